@@ -0,0 +1,59 @@
+"""Índices de lectura para reportes.
+
+Crea (solo si la relación fuente es una tabla; reportes_ventas_30dias,
+items y facturas_proveedor los alimenta el ERP y pueden ser vistas):
+- reportes_ventas_30dias(fecha_venta): rangos de fecha de KPIs, diagnóstico
+  y get_rango_fechas.
+- reportes_ventas_30dias(nombre) INCLUDE (precio, cantidad): agregados por
+  producto (inventario, detalle, agotados) sin visitar el heap.
+- reportes_ventas_30dias(vendedor) INCLUDE (precio, cantidad): top vendedores
+  con index-only scan.
+- facturas_proveedor(proveedor, fecha): agrupación de facturas por proveedor
+  y día (vencimientos y resumen).
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-15
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "007"
+down_revision: Union[str, None] = "006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDICES = [
+    ("ix_rv30_fecha_venta", "reportes_ventas_30dias", "(fecha_venta)"),
+    ("ix_rv30_nombre", "reportes_ventas_30dias", "(nombre) INCLUDE (precio, cantidad)"),
+    (
+        "ix_rv30_vendedor",
+        "reportes_ventas_30dias",
+        "(vendedor) INCLUDE (precio, cantidad) WHERE vendedor IS NOT NULL",
+    ),
+    ("ix_facturas_proveedor_proveedor_fecha", "facturas_proveedor", "(proveedor, fecha)"),
+]
+
+
+def upgrade() -> None:
+    for nombre, tabla, definicion in INDICES:
+        op.execute(
+            f"""
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM pg_class
+                    WHERE relname = '{tabla}' AND relkind = 'r'
+                ) THEN
+                    CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} {definicion};
+                END IF;
+            END $$;
+            """
+        )
+
+
+def downgrade() -> None:
+    for nombre, _, _ in reversed(INDICES):
+        op.execute(f"DROP INDEX IF EXISTS {nombre}")
@@ -0,0 +1,55 @@
+"""Rollup diario de ventas (vista materializada).
+
+Crea:
+- mv_ventas_agg: reportes_ventas_30dias agregada por (fecha_venta, vendedor,
+  familia, metodo, proveedor_moda, nombre). Los agregados de dashboard por
+  día, vendedor, familia, método y producto leen de aquí en vez de volver a
+  escanear las líneas de venta.
+- ux_mv_ventas_agg: índice único sobre la llave del rollup, requisito de
+  REFRESH MATERIALIZED VIEW CONCURRENTLY (POST /api/ventas/agregados/refrescar).
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-15
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "008"
+down_revision: Union[str, None] = "007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE MATERIALIZED VIEW IF NOT EXISTS mv_ventas_agg AS
+        SELECT
+            fecha_venta,
+            EXTRACT(DOW FROM fecha_venta)::int AS dow,
+            vendedor,
+            familia,
+            metodo,
+            proveedor_moda,
+            nombre,
+            SUM(precio * cantidad) AS ingresos,
+            SUM(cantidad) AS cant,
+            SUM((precio - precio_promedio_compra) * cantidad)
+                FILTER (WHERE precio_promedio_compra IS NOT NULL) AS margen,
+            COUNT(*) AS tx
+        FROM reportes_ventas_30dias
+        GROUP BY fecha_venta, vendedor, familia, metodo, proveedor_moda, nombre
+        """
+    )
+    op.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_ventas_agg
+        ON mv_ventas_agg (fecha_venta, vendedor, familia, metodo, proveedor_moda, nombre)
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS mv_ventas_agg")
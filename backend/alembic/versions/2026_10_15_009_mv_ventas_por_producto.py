@@ -0,0 +1,50 @@
+"""Ventas de 30 días por producto (vista materializada).
+
+Crea:
+- mv_ventas_30d_por_producto: reportes_ventas_30dias agregada por nombre
+  (cantidad, ingresos, precio y costo promedio, proveedor y familia). El
+  inventario la cruza con items en lugar de reagrupar las ventas en cada
+  request.
+- ux_mv_ventas_30d_por_producto: índice único por nombre, requisito de
+  REFRESH MATERIALIZED VIEW CONCURRENTLY (POST /api/ventas/agregados/refrescar).
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-15
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "009"
+down_revision: Union[str, None] = "008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE MATERIALIZED VIEW IF NOT EXISTS mv_ventas_30d_por_producto AS
+        SELECT
+            nombre,
+            SUM(cantidad) AS cantidad_vendida,
+            SUM(precio * cantidad) AS total_ventas,
+            AVG(precio) AS precio_promedio_venta,
+            AVG(precio_promedio_compra) AS precio_promedio_compra,
+            MAX(proveedor_moda) AS proveedor,
+            MAX(familia) AS familia
+        FROM reportes_ventas_30dias
+        GROUP BY nombre
+        """
+    )
+    op.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_ventas_30d_por_producto
+        ON mv_ventas_30d_por_producto (nombre)
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS mv_ventas_30d_por_producto")
@@ -0,0 +1,59 @@
+"""Índices parciales de stock y de historial por producto.
+
+Crea (solo si la relación fuente es una tabla, igual que 007):
+- items(nombre) INCLUDE (cantidad_disponible, precio) WHERE cantidad_disponible > 0:
+  productos con stock del inventario completo con index-only scan.
+- items(nombre) INCLUDE (cantidad_disponible) WHERE cantidad_disponible <= 0:
+  productos sin stock que cruza get_productos_agotados.
+- reportes_ventas_30dias(nombre, fecha_venta DESC): historial diario del detalle
+  de producto y MAX(fecha_venta) por nombre de agotados.
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-15
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "010"
+down_revision: Union[str, None] = "009"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDICES = [
+    (
+        "ix_items_con_stock",
+        "items",
+        "(nombre) INCLUDE (cantidad_disponible, precio) WHERE cantidad_disponible > 0",
+    ),
+    (
+        "ix_items_sin_stock",
+        "items",
+        "(nombre) INCLUDE (cantidad_disponible) WHERE cantidad_disponible <= 0",
+    ),
+    ("ix_rv30_nombre_fecha", "reportes_ventas_30dias", "(nombre, fecha_venta DESC)"),
+]
+
+
+def upgrade() -> None:
+    for nombre, tabla, definicion in INDICES:
+        op.execute(
+            f"""
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM pg_class
+                    WHERE relname = '{tabla}' AND relkind = 'r'
+                ) THEN
+                    CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} {definicion};
+                END IF;
+            END $$;
+            """
+        )
+
+
+def downgrade() -> None:
+    for nombre, _, _ in reversed(INDICES):
+        op.execute(f"DROP INDEX IF EXISTS {nombre}")
@@ -0,0 +1,70 @@
+"""Rollup diario con las reglas de línea de _rows_to_ventas.
+
+Recrea mv_ventas_agg (migración 008) con la cantidad truncada a entero y el
+precio NULL como 0, igual que las líneas de get_ventas, para que los agregados
+leídos de la vista coincidan con los calculados al vuelo. El margen solo cuenta
+líneas con costo distinto de NULL y de 0.
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-15
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "011"
+down_revision: Union[str, None] = "010"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _crear_vista(ingresos: str, cant: str, margen: str) -> None:
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS mv_ventas_agg")
+    op.execute(
+        f"""
+        CREATE MATERIALIZED VIEW mv_ventas_agg AS
+        SELECT
+            fecha_venta,
+            EXTRACT(DOW FROM fecha_venta)::int AS dow,
+            vendedor,
+            familia,
+            metodo,
+            proveedor_moda,
+            nombre,
+            {ingresos} AS ingresos,
+            {cant} AS cant,
+            {margen} AS margen,
+            COUNT(*) AS tx
+        FROM reportes_ventas_30dias
+        GROUP BY fecha_venta, vendedor, familia, metodo, proveedor_moda, nombre
+        """
+    )
+    op.execute(
+        """
+        CREATE UNIQUE INDEX ux_mv_ventas_agg
+        ON mv_ventas_agg (fecha_venta, vendedor, familia, metodo, proveedor_moda, nombre)
+        """
+    )
+
+
+def upgrade() -> None:
+    _crear_vista(
+        ingresos="SUM(COALESCE(precio, 0) * TRUNC(COALESCE(cantidad, 0)))",
+        cant="SUM(TRUNC(COALESCE(cantidad, 0)))",
+        margen=(
+            "SUM((COALESCE(precio, 0) - precio_promedio_compra) * TRUNC(COALESCE(cantidad, 0)))"
+            " FILTER (WHERE NULLIF(precio_promedio_compra, 0) IS NOT NULL)"
+        ),
+    )
+
+
+def downgrade() -> None:
+    _crear_vista(
+        ingresos="SUM(precio * cantidad)",
+        cant="SUM(cantidad)",
+        margen=(
+            "SUM((precio - precio_promedio_compra) * cantidad)"
+            " FILTER (WHERE precio_promedio_compra IS NOT NULL)"
+        ),
+    )
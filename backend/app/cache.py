@@ -1,4 +1,4 @@
-"""Cache TTL para predicciones y compras."""
+"""Cache TTL para predicciones, compras, inventario y reportes PDF."""
 import hashlib
 import json
 from typing import Any, Optional
@@ -8,9 +8,20 @@ from cachetools import TTLCache
 
 # TTL 15 minutos
 PREDICCIONES_CACHE: TTLCache = TTLCache(maxsize=50, ttl=900)
+# Desglose: JSON de la respuesta ya serializado (str)
 PREDICCIONES_DESGLOSE_CACHE: TTLCache = TTLCache(maxsize=100, ttl=900)
 COMPRAS_CACHE: TTLCache = TTLCache(maxsize=50, ttl=900)
 
+# TTL 30 segundos: el inventario cambia poco dentro de un mismo refresco de dashboard
+INVENTARIO_CACHE: TTLCache = TTLCache(maxsize=1, ttl=30)
+
+# TTL 60 segundos: inventario con métricas (InventarioService.get_inventario_completo)
+# y su índice por proveedor
+INVENTARIO_COMPLETO_CACHE: TTLCache = TTLCache(maxsize=4, ttl=60)
+
+# TTL 5 minutos: bytes del PDF de ventas, con clave por el contenido del reporte
+PDF_CACHE: TTLCache = TTLCache(maxsize=32, ttl=300)
+
 
 def _cache_key(prefix: str, filters: Any, extra: Optional[str] = None) -> str:
     """Genera clave de cache a partir de filtros."""
@@ -17,6 +17,9 @@ class Settings(BaseSettings):
     secret_key: str = "cambiar-en-produccion-generar-con-openssl-rand-hex-32"
     access_token_expire_minutes: int = 1440  # 24 horas
     
+    # Cada cuántos minutos se refrescan las vistas materializadas de ventas (0 = nunca)
+    agregados_refresco_minutos: int = 15
+
     # Gemini (Analista IA)
     gemini_api_key: str = ""
 
@@ -1,7 +1,9 @@
 """
 Configuración de la base de datos con SQLAlchemy async.
 """
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 
@@ -23,9 +25,10 @@ def get_engine():
     )
 
 
-# Engine y session factory (lazy)
+# Engine y session factories (lazy)
 _engine = None
 _async_session = None
+_async_session_lectura = None
 
 
 def get_session_factory():
@@ -41,6 +44,23 @@ def get_session_factory():
     return _async_session
 
 
+def get_readonly_session_factory():
+    """
+    Session factory de solo lectura: mismo pool que get_session_factory pero con
+    las conexiones en AUTOCOMMIT, sin BEGIN/COMMIT por consulta. Solo para
+    dashboards que no escriben.
+    """
+    global _async_session_lectura
+    if _async_session_lectura is None:
+        get_session_factory()
+        _async_session_lectura = async_sessionmaker(
+            _engine.execution_options(isolation_level="AUTOCOMMIT"),
+            class_=AsyncSession,
+            expire_on_commit=False
+        )
+    return _async_session_lectura
+
+
 class Base(DeclarativeBase):
     """Base para modelos ORM."""
     pass
@@ -55,3 +75,47 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         finally:
             await session.close()
 
+
+async def get_db_lectura() -> AsyncGenerator[AsyncSession, None]:
+    """Dependency de sesión en AUTOCOMMIT para rutas de solo lectura."""
+    async with get_readonly_session_factory()() as session:
+        yield session
+
+
+async def relacion_existe(db: AsyncSession, nombre: str) -> bool:
+    """
+    True si la tabla o vista ``nombre`` existe. to_regclass devuelve NULL en vez
+    de fallar, así que la prueba no aborta la transacción de la sesión.
+    """
+    result = await db.execute(text("SELECT to_regclass(:nombre) IS NOT NULL"), {"nombre": nombre})
+    return bool(result.scalar())
+
+
+class QueryPipeline:
+    """
+    Agrupa consultas escalares independientes en un solo SELECT (un round-trip).
+
+    Cada consulta debe devolver una fila y una columna. Los parámetros se
+    comparten: un mismo nombre en dos consultas debe tener el mismo valor.
+    """
+
+    def __init__(self) -> None:
+        self._consultas: List[Tuple[str, str]] = []
+        self._params: Dict[str, Any] = {}
+
+    def add(self, alias: str, sql: str, params: Optional[Dict[str, Any]] = None) -> "QueryPipeline":
+        """Encola ``sql`` cuyo resultado se devolverá bajo ``alias``."""
+        for k, v in (params or {}).items():
+            if k in self._params and self._params[k] != v:
+                raise ValueError(f"Parámetro '{k}' repetido con otro valor")
+            self._params[k] = v
+        self._consultas.append((alias, sql.strip()))
+        return self
+
+    async def execute(self, db: AsyncSession) -> Dict[str, Any]:
+        """Ejecuta todas las consultas encoladas en una sola sentencia."""
+        if not self._consultas:
+            return {}
+        columnas = ", ".join(f"({sql}) AS {alias}" for alias, sql in self._consultas)
+        row = (await db.execute(text(f"SELECT {columnas}"), self._params)).fetchone()
+        return dict(row._mapping) if row else {alias: None for alias, _ in self._consultas}
@@ -1,7 +1,9 @@
 """
 Aplicación FastAPI principal.
 """
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -9,6 +11,7 @@ from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 
 from app.config import get_settings
+from app.database import get_session_factory
 from app.routes import (
     ventas_router,
     dashboard_router,
@@ -37,8 +40,37 @@ from app.routes.diagnostico import router as diagnostico_router
 from app.routes.orquestador import router as orquestador_router
 from app.routes.autonomia import router as autonomia_router
 from app.routes.control import router_aprendizaje, router_control
+from app.services.inventario import InventarioService
+from app.services.ventas import VentasService
 
 settings = get_settings()
+logger = logging.getLogger("app")
+
+
+async def refrescar_agregados_periodicamente(minutos: int) -> None:
+    """Refresca (CONCURRENTLY) las vistas materializadas de ventas cada ``minutos``."""
+    while True:
+        await asyncio.sleep(minutos * 60)
+        try:
+            async with get_session_factory()() as db:
+                await VentasService(db).refrescar_agregados()
+                await InventarioService(db).refrescar_ventas_por_producto()
+        except Exception:
+            logger.exception("No se pudieron refrescar los agregados de ventas")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arranca el refresco periódico de agregados y lo cancela al apagar."""
+    tarea = None
+    if settings.agregados_refresco_minutos > 0:
+        tarea = asyncio.create_task(
+            refrescar_agregados_periodicamente(settings.agregados_refresco_minutos)
+        )
+    yield
+    if tarea is not None:
+        tarea.cancel()
+
 
 app = FastAPI(
     title=settings.app_name,
@@ -46,10 +78,9 @@ app = FastAPI(
     version="2.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
-logger = logging.getLogger("app")
-
 
 class ErroresComoJSONMiddleware(BaseHTTPMiddleware):
     """Convierte excepciones no controladas en JSON 500.
@@ -10,6 +10,7 @@ from app.models.schemas import (
     ABCResponse,
     VendedorRankingResponse,
     VendedorDetalleResponse,
+    Prioridad,
     SugerenciaCompraResponse,
     OrdenCompraResponse,
     FiltrosOpciones,
@@ -28,6 +29,7 @@ __all__ = [
     "ABCResponse",
     "VendedorRankingResponse",
     "VendedorDetalleResponse",
+    "Prioridad",
     "SugerenciaCompraResponse",
     "OrdenCompraResponse",
     "FiltrosOpciones",
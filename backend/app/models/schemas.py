@@ -2,8 +2,9 @@
 Esquemas Pydantic para request/response.
 """
 from datetime import date, datetime
+from enum import IntEnum
 from typing import Any, Dict, List, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_serializer, field_validator
 
 
 # =============================================================================
@@ -253,6 +254,33 @@ class VendedorDetalleResponse(BaseModel):
 # Compras
 # =============================================================================
 
+class Prioridad(IntEnum):
+    """Prioridad de compra; el valor numérico ordena de más a menos urgente."""
+    URGENTE = 0
+    ALTA = 1
+    MEDIA = 2
+    BAJA = 3
+
+    @property
+    def label(self) -> str:
+        """Etiqueta con emoji que expone la API."""
+        return PRIORIDAD_LABELS[self]
+
+    @classmethod
+    def from_label(cls, label: Optional[str]) -> Optional["Prioridad"]:
+        """Convierte la etiqueta de la API ("🔴 Urgente", ...) en Prioridad."""
+        return _PRIORIDAD_POR_LABEL.get(label) if label else None
+
+
+PRIORIDAD_LABELS: Dict[Prioridad, str] = {
+    Prioridad.URGENTE: "🔴 Urgente",
+    Prioridad.ALTA: "🟠 Alta",
+    Prioridad.MEDIA: "🟡 Media",
+    Prioridad.BAJA: "🟢 Baja",
+}
+_PRIORIDAD_POR_LABEL: Dict[str, Prioridad] = {v: k for k, v in PRIORIDAD_LABELS.items()}
+
+
 class SugerenciaCompraResponse(BaseModel):
     """Sugerencia de compra."""
     nombre: str
@@ -264,7 +292,7 @@ class SugerenciaCompraResponse(BaseModel):
     cantidad_sugerida: int
     precio_compra: Optional[float]
     costo_estimado: float
-    prioridad: str  # Urgente, Alta, Media, Baja
+    prioridad: Prioridad  # se serializa como etiqueta: Urgente, Alta, Media, Baja
     # Nuevos campos para inteligencia de inventario
     clasificacion_abc: Optional[str] = None          # "A", "B", "C"
     tendencia: Optional[str] = None                  # "creciente", "estable", "decreciente"
@@ -275,6 +303,18 @@ class SugerenciaCompraResponse(BaseModel):
     punto_reorden: Optional[int] = None              # ROP = venta_diaria * lead_time + safety_stock
     demanda_proyectada_7d: Optional[float] = None     # demanda promedio próximos 7d desde forecast
 
+    @field_validator("prioridad", mode="before")
+    @classmethod
+    def _parse_prioridad(cls, v: Any) -> Any:
+        """Acepta también la etiqueta con emoji."""
+        if isinstance(v, str):
+            return Prioridad.from_label(v) or v
+        return v
+
+    @field_serializer("prioridad")
+    def _serializar_prioridad(self, prioridad: Prioridad) -> str:
+        return prioridad.label
+
 
 class ResumenProveedorResponse(BaseModel):
     """Resumen de compras por proveedor."""
@@ -294,6 +334,31 @@ class OrdenCompraResponse(BaseModel):
     items: List[SugerenciaCompraResponse]
 
 
+# =============================================================================
+# Inventario
+# =============================================================================
+
+class EstadoStock(IntEnum):
+    """Estado de stock por cobertura; el valor numérico ordena de más a menos urgente."""
+    CRITICO = 0
+    BAJO = 1
+    NORMAL = 2
+    EXCESO = 3
+
+    @property
+    def label(self) -> str:
+        """Etiqueta con emoji que expone la API."""
+        return ESTADO_STOCK_LABELS[self]
+
+
+ESTADO_STOCK_LABELS: Dict[EstadoStock, str] = {
+    EstadoStock.CRITICO: "🔴 Crítico",
+    EstadoStock.BAJO: "🟠 Bajo",
+    EstadoStock.NORMAL: "🟢 Normal",
+    EstadoStock.EXCESO: "🔵 Exceso",
+}
+
+
 # =============================================================================
 # Métricas sector retail
 # =============================================================================
@@ -0,0 +1,27 @@
+"""Respuestas HTTP especializadas."""
+import json
+from typing import Any, Iterable, Sequence
+
+from fastapi.responses import JSONResponse
+
+
+class FilasJSONResponse(JSONResponse):
+    """
+    Serializa filas en tupla como lista de objetos JSON con claves fijas.
+
+    Evita construir un dict por fila y el recorrido de ``jsonable_encoder``:
+    cada fila se escribe con una plantilla precalculada a partir de ``columnas``.
+    Los valores deben ser tipos JSON nativos (str, int, float, bool, None).
+    """
+
+    def __init__(self, filas: Iterable[Sequence[Any]], columnas: Sequence[str], **kwargs: Any):
+        self.columnas = tuple(columnas)
+        super().__init__(content=filas, **kwargs)
+
+    def render(self, content: Iterable[Sequence[Any]]) -> bytes:
+        plantilla = "{" + ",".join(f"{json.dumps(c)}:%s" for c in self.columnas) + "}"
+        dumps = json.dumps
+        cuerpo = ",".join(
+            plantilla % tuple(dumps(v, ensure_ascii=False) for v in fila) for fila in content
+        )
+        return f"[{cuerpo}]".encode("utf-8")
@@ -1,6 +1,7 @@
 """
 Rutas de exportación de datos.
 """
+import asyncio
 from datetime import date, datetime
 from io import BytesIO
 from typing import List, Optional
@@ -10,6 +11,7 @@ from fastapi.responses import StreamingResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 import pandas as pd
 
+from app.cache import PDF_CACHE, _cache_key, get_cached, set_cached
 from app.database import get_db
 from app.auth.dependencies import get_current_active_user
 from app.auth.models import User
@@ -145,9 +147,11 @@ async def export_pdf(
     familias = await service.get_ventas_por_familia(filters)
     alertas = await service.get_alertas(filters)
     
-    # Generar PDF
-    pdf_generator = PDFReportGenerator()
-    pdf_bytes = pdf_generator.generate_sales_report(
+    # Generar PDF: mismo contenido → mismos bytes, se reutilizan desde el cache.
+    # La fecha impresa (al minuto) va en la llave para no servir una vieja.
+    # ReportLab es CPU puro; se arma en un hilo para no bloquear el event loop.
+    generado = datetime.now()
+    payload = dict(
         metricas=metricas.dict() if hasattr(metricas, 'dict') else metricas,
         top_productos=[p.dict() if hasattr(p, 'dict') else p for p in top_productos],
         top_vendedores=vendedores,
@@ -156,8 +160,15 @@ async def export_pdf(
         fecha_inicio=str(filters.fecha_inicio) if filters.fecha_inicio else None,
         fecha_fin=str(filters.fecha_fin) if filters.fecha_fin else None,
     )
+    key = _cache_key("pdf", payload, generado.strftime("%Y%m%d%H%M"))
+    pdf_bytes = get_cached(PDF_CACHE, key)
+    if pdf_bytes is None:
+        pdf_bytes = await asyncio.to_thread(
+            PDFReportGenerator().generate_sales_report, **payload, generado=generado
+        )
+        set_cached(PDF_CACHE, key, pdf_bytes)
     
-    filename = f"reporte_ventas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    filename = f"reporte_ventas_{generado.strftime('%Y%m%d_%H%M%S')}.pdf"
     
     return Response(
         content=pdf_bytes,
@@ -7,7 +7,8 @@ from fastapi import APIRouter, Depends, Query
 
 from app.database import get_db
 from app.auth.dependencies import get_current_active_user
-from app.services.facturas_proveedor import FacturasProveedorService
+from app.responses import FilasJSONResponse
+from app.services.facturas_proveedor import COLUMNAS_FACTURA, FacturasProveedorService
 from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter(
@@ -26,11 +27,12 @@ async def listar_facturas(
 ):
     """Lista facturas con estado de vencimiento."""
     service = FacturasProveedorService(db)
-    return await service.get_facturas(
+    filas = await service.get_facturas_filas(
         proveedor=proveedor,
         dias_plazo=dias_plazo,
         estado=estado,
     )
+    return FilasJSONResponse(filas, COLUMNAS_FACTURA)
 
 
 @router.get("/resumen")
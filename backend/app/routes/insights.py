@@ -6,7 +6,7 @@ from typing import Any, Dict
 from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_db_lectura, get_readonly_session_factory
 from app.auth.dependencies import get_current_active_user
 from app.models.schemas import FilterParams
 from app.services.ventas import VentasService
@@ -25,7 +25,7 @@ router = APIRouter(
 @router.get("", response_model=dict)
 async def get_insights(
     filters: FilterParams = Depends(get_filter_params),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db_lectura),
 ) -> Dict[str, Any]:
     """Obtiene insights inteligentes cruzando ABC + inventario + tendencias."""
     ventas_service = VentasService(db)
@@ -37,11 +37,11 @@ async def get_insights(
 @router.get("/kpis", response_model=dict)
 async def get_insights_kpis(
     filters: FilterParams = Depends(get_filter_params),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_db_lectura),
 ) -> Dict[str, Any]:
     """KPIs ejecutivos consolidados (ventas, margen, inventario, forecast, urgencias)."""
     ventas_service = VentasService(db)
     pred = PrediccionesService(ventas_service)
-    service = InsightsService(db, ventas_service, pred)
+    service = InsightsService(db, ventas_service, pred, session_factory=get_readonly_session_factory())
     return await service.get_kpis_ejecutivo(filters)
 
@@ -1,14 +1,18 @@
 """
 Rutas de inventario.
 """
+import heapq
 from typing import Optional
 
 from fastapi import APIRouter, Depends, Query, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_db, get_readonly_session_factory
+from app.models.schemas import EstadoStock
 from app.auth.dependencies import get_current_active_user
-from app.services.inventario import InventarioService
+from app.services.compras import ComprasService
+from app.services.inventario import InventarioService, redondear_producto
+from app.services.ventas import VentasService
 
 router = APIRouter(
     prefix="/api/inventario",
@@ -28,40 +32,46 @@ async def get_inventario(
 ):
     """Obtiene inventario completo con métricas."""
     service = InventarioService(db)
-    productos = await service.get_inventario_completo()
+    if proveedor:
+        productos = (await service.get_productos_por_proveedor()).get(proveedor, [])
+    else:
+        productos = await service.get_inventario_completo()
     
     # Aplicar filtros
     if estado:
         estado_map = {
-            "critico": "🔴 Crítico",
-            "bajo": "🟠 Bajo",
-            "normal": "🟢 Normal",
-            "exceso": "🔵 Exceso",
+            "critico": EstadoStock.CRITICO,
+            "bajo": EstadoStock.BAJO,
+            "normal": EstadoStock.NORMAL,
+            "exceso": EstadoStock.EXCESO,
         }
         estado_filtro = estado_map.get(estado.lower())
-        if estado_filtro:
-            productos = [p for p in productos if p["estado_stock"] == estado_filtro]
+        if estado_filtro is not None:
+            productos = [p for p in productos if p["estado_stock"] is estado_filtro]
     
     if familia:
         productos = [p for p in productos if p.get("familia") == familia]
     
-    if proveedor:
-        productos = [p for p in productos if p.get("proveedor") == proveedor]
-    
-    # Ordenar
+    # Ordenar: solo hace falta la página pedida
+    pagina = productos[:limite]
     if ordenar_por in ["venta_diaria", "stock_actual", "dias_cobertura", "rotacion", "valor_inventario"]:
-        productos = sorted(
-            productos, 
-            key=lambda x: x.get(ordenar_por) or 0, 
-            reverse=ordenar_por != "dias_cobertura"
-        )
+        seleccionar = heapq.nsmallest if ordenar_por == "dias_cobertura" else heapq.nlargest
+        pagina = seleccionar(limite, productos, key=lambda x: x.get(ordenar_por) or 0)
     
     return {
-        "data": productos[:limite],
+        "data": [redondear_producto(p) for p in pagina],
         "total": len(productos),
     }
 
 
+@router.post("/cache/invalidar")
+async def invalidar_cache_inventario(db: AsyncSession = Depends(get_db)):
+    """Descarta el inventario cacheado de este proceso; llamar tras cargar items desde el ERP."""
+    InventarioService(db).invalidate_inventario()
+    ComprasService(db, VentasService(db)).invalidate_inventario()
+    return {"ok": True}
+
+
 @router.get("/resumen")
 async def get_resumen_inventario(db: AsyncSession = Depends(get_db)):
     """Obtiene resumen ejecutivo del inventario."""
@@ -103,7 +113,7 @@ async def get_producto_detalle(
     db: AsyncSession = Depends(get_db),
 ):
     """Obtiene detalle completo de un producto."""
-    service = InventarioService(db)
+    service = InventarioService(db, session_factory=get_readonly_session_factory())
     producto = await service.get_producto_detalle(nombre)
     
     if not producto:
@@ -4,7 +4,7 @@ Rutas de ventas y datos principales.
 from datetime import date
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
@@ -152,6 +152,15 @@ async def get_top_productos_cantidad(
     return await service.get_top_productos_cantidad(filters, limit)
 
 
+@router.post("/ventas/agregados/refrescar")
+async def refrescar_agregados(db: AsyncSession = Depends(get_db)):
+    """Recalcula ya los agregados de ventas (mv_ventas_agg, mv_ventas_30d_por_producto); app.main los refresca periódicamente."""
+    service = VentasService(db)
+    await service.refrescar_agregados()
+    await InventarioService(db).refrescar_ventas_por_producto()
+    return {"ok": True}
+
+
 @router.get("/margenes", response_model=MargenResponse)
 async def get_margenes(
     filters: FilterParams = Depends(get_filter_params),
@@ -198,16 +207,19 @@ async def get_predicciones(
     filters: FilterParams = Depends(get_filter_params),
     db: AsyncSession = Depends(get_db),
 ):
-    """Obtiene predicciones de ventas (nivel global). Cache TTL 15 min."""
+    """Obtiene predicciones de ventas (nivel global). Cache TTL 15 min.
+
+    El cache guarda el modelo (lo reutiliza el desglose); se serializa directo
+    con pydantic-core en vez de revalidarlo contra response_model.
+    """
     key = _cache_key("pred", filters)
-    cached = get_cached(PREDICCIONES_CACHE, key)
-    if cached is not None:
-        return cached
-    ventas_service = VentasService(db)
-    service = PrediccionesService(ventas_service)
-    result = await service.get_predicciones(filters)
-    set_cached(PREDICCIONES_CACHE, key, result)
-    return result
+    result = get_cached(PREDICCIONES_CACHE, key)
+    if result is None:
+        ventas_service = VentasService(db)
+        service = PrediccionesService(ventas_service)
+        result = await service.get_predicciones(filters)
+        set_cached(PREDICCIONES_CACHE, key, result)
+    return Response(content=result.model_dump_json(), media_type="application/json")
 
 
 @router.get("/predicciones/desglose", response_model=PrediccionDesgloseResponse)
@@ -216,18 +228,21 @@ async def get_predicciones_desglose(
     filters: FilterParams = Depends(get_filter_params),
     db: AsyncSession = Depends(get_db),
 ):
-    """Predicciones desglosadas por familia o producto. Cache TTL 15 min."""
+    """Predicciones desglosadas por familia o producto. Cache TTL 15 min.
+
+    El cache guarda el JSON ya serializado: un hit no recorre los grupos.
+    """
     if nivel not in ("familia", "producto"):
         nivel = "familia"
     key = _cache_key("pred_desglose", filters, nivel)
-    cached = get_cached(PREDICCIONES_DESGLOSE_CACHE, key)
-    if cached is not None:
-        return cached
-    ventas_service = VentasService(db)
-    service = PrediccionesService(ventas_service)
-    result = await service.get_predicciones_desglose(filters, nivel)
-    set_cached(PREDICCIONES_DESGLOSE_CACHE, key, result)
-    return result
+    body = get_cached(PREDICCIONES_DESGLOSE_CACHE, key)
+    if body is None:
+        ventas_service = VentasService(db)
+        service = PrediccionesService(ventas_service)
+        result = await service.get_predicciones_desglose(filters, nivel)
+        body = result.model_dump_json()
+        set_cached(PREDICCIONES_DESGLOSE_CACHE, key, body)
+    return Response(content=body, media_type="application/json")
 
 
 @router.get("/predicciones/backtest")
@@ -256,5 +271,7 @@ async def get_abc(
         criterio = "ventas"
     ventas_service = VentasService(db)
     service = ABCService(ventas_service)
-    return await service.get_analisis_abc(filters, criterio)
+    result = await service.get_analisis_abc(filters, criterio)
+    # Las claves con "_" son índices internos del servicio
+    return {k: v for k, v in result.items() if not k.startswith("_")}
 
@@ -4,10 +4,48 @@ Servicio de análisis ABC (Pareto) mejorado.
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 
+import numpy as np
+from sqlalchemy import text
+
 from app.models.schemas import FilterParams, ABCResponse, ProductoABCResponse
 from app.services.ventas import VentasService
 
 
+# Umbrales del % acumulado (antes del producto) que separan las clases A/B/C
+_UMBRALES_ABC = np.array([80.0, 95.0])
+_CATEGORIAS_ABC = np.array(["A", "B", "C"])
+
+# Venta del producto, venta de los productos ordenados antes que él y venta
+# total. Las líneas siguen las reglas de _rows_to_ventas y el orden es el de
+# get_analisis_abc: venta descendente y, en empate, el producto que aparece
+# antes en get_ventas (última venta más reciente, luego nombre).
+_ABC_PRODUCTO_SQL = """
+    WITH por_producto AS (
+        SELECT
+            nombre,
+            SUM(COALESCE(precio, 0) * TRUNC(COALESCE(cantidad, 0))) AS total,
+            MAX(fecha_venta) AS ultima_venta
+        FROM reportes_ventas_30dias
+        {where}
+        GROUP BY nombre
+    ),
+    acumulado AS (
+        SELECT
+            nombre,
+            total AS propio,
+            SUM(total) OVER (
+                ORDER BY total DESC, ultima_venta DESC, nombre
+                ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+            ) AS anterior,
+            SUM(total) OVER () AS total
+        FROM por_producto
+    )
+    SELECT propio, anterior, total
+    FROM acumulado
+    WHERE nombre = :nombre
+"""
+
+
 @dataclass
 class ABCCriterio:
     """Criterios disponibles para análisis ABC."""
@@ -83,39 +121,58 @@ class ABCService:
             reverse=True
         )
         
-        total_valor = sum(key_func((n, d)) for n, d in productos_ordenados)
-        total_ventas = sum(p[1]["total_venta"] for p in productos_ordenados)
-        total_margen = sum(p[1]["margen"] or 0 for p in productos_ordenados)
+        # Totales en una sola pasada
+        total_ventas = total_margen = 0
+        for _, data in productos_ordenados:
+            total_ventas += data["total_venta"]
+            total_margen += data["margen"] or 0
         
         # Calcular porcentaje acumulado y clasificar
-        productos_abc = []
-        acumulado = 0
-        
-        for nombre, data in productos_ordenados:
-            valor_criterio = key_func((nombre, data))
-            porcentaje = (valor_criterio / total_valor * 100) if total_valor > 0 else 0
-            acumulado_anterior = acumulado
-            acumulado += porcentaje
+        valores = np.fromiter(
+            (key_func(item) for item in productos_ordenados),
+            dtype=float,
+            count=len(productos_ordenados),
+        )
+        total_valor = float(valores.sum())
+        if total_valor > 0:
+            porcentajes = valores / total_valor * 100
+        else:
+            porcentajes = np.zeros(len(valores))
+        acumulados = np.cumsum(porcentajes)
+        acumulados_anteriores = np.concatenate(([0.0], acumulados[:-1]))
+        # side="right": un acumulado anterior de exactamente 80 ya es B
+        categorias = _CATEGORIAS_ABC[
+            np.searchsorted(_UMBRALES_ABC, acumulados_anteriores, side="right")
+        ].tolist()
 
-            if acumulado_anterior < 80:
-                clasificacion = "A"
-            elif acumulado_anterior < 95:
-                clasificacion = "B"
-            else:
-                clasificacion = "C"
-            
+        # Redondeo por columna (una operación vectorizada en lugar de N round())
+        n = len(productos_ordenados)
+        total_venta_r = np.round(
+            np.fromiter((d["total_venta"] for _, d in productos_ordenados), dtype=float, count=n), 2
+        ).tolist()
+        margen_r = np.round(
+            np.fromiter((d["margen"] or 0 for _, d in productos_ordenados), dtype=float, count=n), 2
+        ).tolist()
+        margen_pct_r = np.round(
+            np.fromiter((d["margen_porcentaje"] or 0 for _, d in productos_ordenados), dtype=float, count=n), 1
+        ).tolist()
+        porcentaje_r = np.round(porcentajes, 2).tolist()
+        acumulado_r = np.round(acumulados, 2).tolist()
+
+        productos_abc = []
+        for i, (nombre, data) in enumerate(productos_ordenados):
             productos_abc.append({
                 "nombre": nombre,
-                "categoria": clasificacion,
-                "total_venta": round(data["total_venta"], 2),
+                "categoria": categorias[i],
+                "total_venta": total_venta_r[i],
                 "cantidad": data["cantidad"],
                 "transacciones": data["transacciones"],
-                "margen": round(data["margen"], 2) if data["margen"] else None,
-                "margen_porcentaje": round(data["margen_porcentaje"], 1) if data["margen_porcentaje"] else None,
+                "margen": margen_r[i] if data["margen"] else None,
+                "margen_porcentaje": margen_pct_r[i] if data["margen_porcentaje"] else None,
                 "familia": data["familia"],
                 "proveedor": data["proveedor"],
-                "porcentaje": round(porcentaje, 2),
-                "porcentaje_acumulado": round(acumulado, 2),
+                "porcentaje": porcentaje_r[i],
+                "porcentaje_acumulado": acumulado_r[i],
             })
         
         # Calcular métricas por clase
@@ -153,6 +210,11 @@ class ABCService:
         
         return {
             "productos": productos_abc,
+            # Índice interno nombre -> categoría para consumidores del servicio;
+            # las rutas lo omiten de la respuesta (claves con "_").
+            "_categoria_por_nombre": {
+                nombre: cat for (nombre, _), cat in zip(productos_ordenados, categorias)
+            },
             "resumen": resumen,
             "insights": insights,
             "criterio_usado": criterio,
@@ -163,6 +225,25 @@ class ABCService:
             }
         }
     
+    async def get_clasificacion_abc_producto(
+        self, nombre: str, filters: FilterParams
+    ) -> Optional[str]:
+        """
+        Clase ABC (criterio ventas) de un solo producto, agregada en SQL sin
+        armar el análisis completo. Los empates de venta se ordenan como en
+        get_analisis_abc.
+        """
+        where, params = self.ventas_service._build_where_clause(filters)
+        result = await self.ventas_service.db.execute(
+            text(_ABC_PRODUCTO_SQL.format(where=where)), {**params, "nombre": nombre}
+        )
+        row = result.fetchone()
+        if not row:
+            return None
+        total = float(row.total or 0)
+        acumulado_anterior = float(row.anterior or 0) / total * 100 if total > 0 else 0.0
+        return str(_CATEGORIAS_ABC[np.searchsorted(_UMBRALES_ABC, acumulado_anterior, side="right")])
+    
     async def get_cambios_categoria(self, filters: FilterParams) -> List[Dict[str, Any]]:
         """Compara categorías ABC con período anterior."""
         # Obtener análisis actual
@@ -178,7 +259,7 @@ class ABCService:
         anterior = await self.get_analisis_abc(filters_anterior)
         
         # Mapear categorías anteriores
-        categorias_anteriores = {p["nombre"]: p["categoria"] for p in anterior.get("productos", [])}
+        categorias_anteriores = anterior["_categoria_por_nombre"]
         
         cambios = []
         for producto in actual.get("productos", []):
@@ -272,6 +353,7 @@ class ABCService:
         """Respuesta vacía cuando no hay datos."""
         return {
             "productos": [],
+            "_categoria_por_nombre": {},
             "resumen": [
                 {"categoria": "A", "productos": 0, "total_ventas": 0, "porcentaje_ventas": 0},
                 {"categoria": "B", "productos": 0, "total_ventas": 0, "porcentaje_ventas": 0},
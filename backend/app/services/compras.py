@@ -2,14 +2,16 @@
 Servicio de sugerencias de compras.
 """
 from datetime import datetime
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 
 import numpy as np
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.cache import INVENTARIO_CACHE, get_cached, set_cached
 from app.models.schemas import (
     FilterParams,
+    Prioridad,
     SugerenciaCompraResponse,
     ResumenProveedorResponse,
     OrdenCompraResponse,
@@ -19,6 +21,56 @@ from app.services.abc import ABCService
 from app.services.predicciones import PrediccionesService
 
 
+_ITEMS_SQL = text("SELECT id, nombre, cantidad_disponible, familia, precio FROM items")
+
+# Cortes de días de stock para la prioridad: ≤3 Urgente, ≤7 Alta, ≤15 Media, resto Baja
+_CORTES_PRIORIDAD_DIAS = np.array([3.0, 7.0, 15.0])
+
+
+def _calcular_reposicion(
+    venta_diaria: np.ndarray,
+    stock: np.ndarray,
+    variabilidad: np.ndarray,
+    cobertura_objetivo: np.ndarray,
+    lead_time: np.ndarray,
+    precio_compra: np.ndarray,
+    precio_venta: np.ndarray,
+    safety_dias_base: float,
+) -> Tuple[np.ndarray, ...]:
+    """Aritmética de reposición para todos los productos en una sola llamada.
+
+    Retorna (dias_stock, cantidad_sugerida, costo_estimado, punto_reorden,
+    roi_estimado, codigo_prioridad) como arrays alineados con la entrada; el
+    código de prioridad es el valor de Prioridad.
+    """
+    # Días de stock
+    dias_stock = np.divide(
+        stock, venta_diaria, out=np.full(len(stock), 999.0), where=venta_diaria > 0
+    )
+
+    # Margen de seguridad según variabilidad (entre 10% y 40%)
+    margen_seguridad = np.clip(0.1 + variabilidad, 0.1, 0.4)
+    demanda_objetivo = venta_diaria * cobertura_objetivo * (1 + margen_seguridad)
+
+    # Cantidad sugerida = demanda objetivo - stock actual
+    cantidad_sugerida = np.maximum(0, np.round(demanda_objetivo - stock)).astype(np.int64)
+
+    # Costo estimado
+    costo_estimado = cantidad_sugerida * precio_compra
+
+    # Punto de reorden (ROP) = venta_diaria * (lead_time + safety_stock_dias)
+    safety_dias = safety_dias_base * (1 + np.minimum(variabilidad, 1.0))
+    punto_reorden = np.round(venta_diaria * (lead_time + safety_dias)).astype(np.int64)
+
+    # ROI estimado: margen unitario aproximado (precio_venta_promedio - precio_compra)
+    roi_estimado = np.maximum(0.0, precio_venta - precio_compra) * cantidad_sugerida
+
+    # Prioridad por días de stock (side="left": exactamente 3 días sigue siendo Urgente)
+    prioridad = np.searchsorted(_CORTES_PRIORIDAD_DIAS, dias_stock, side="left")
+
+    return dias_stock, cantidad_sugerida, costo_estimado, punto_reorden, roi_estimado, prioridad
+
+
 class ComprasService:
     """Servicio para sugerencias de compras."""
     
@@ -39,26 +91,31 @@ class ComprasService:
         self.safety_dias_base = safety_dias_base
     
     async def get_inventario(self) -> dict:
-        """Obtiene datos de inventario desde la tabla items."""
-        query = "SELECT id, nombre, cantidad_disponible, familia, precio FROM items"
-        
+        """Obtiene datos de inventario desde la tabla items (cache TTL 30s)."""
+        cached = get_cached(INVENTARIO_CACHE, "inventario")
+        if cached is not None:
+            return cached
+
         try:
-            result = await self.db.execute(text(query))
-            rows = result.fetchall()
-            
-            inventario = {}
-            for row in rows:
-                row_dict = row._asdict()
-                nombre = row_dict.get("nombre")
-                if nombre:
-                    inventario[nombre] = {
-                        "cantidad_disponible": float(row_dict.get("cantidad_disponible") or 0),
-                        "precio": float(row_dict.get("precio") or 0),
-                    }
-            
-            return inventario
+            rows = (await self.db.execute(_ITEMS_SQL)).fetchall()
         except Exception:
             return {}
+
+        # Columnas fijas: id, nombre, cantidad_disponible, familia, precio
+        inventario = {
+            r[1]: {
+                "cantidad_disponible": float(r[2] or 0),
+                "precio": float(r[4] or 0),
+            }
+            for r in rows
+            if r[1]
+        }
+        set_cached(INVENTARIO_CACHE, "inventario", inventario)
+        return inventario
+
+    def invalidate_inventario(self) -> None:
+        """Descarta el inventario cacheado (llamar tras escribir en items)."""
+        INVENTARIO_CACHE.clear()
     
     async def _get_clasificacion_abc_por_producto(
         self, filters: FilterParams
@@ -66,22 +123,44 @@ class ComprasService:
         """Obtiene un mapa nombre_producto -> clasificación ABC."""
         abc_service = ABCService(self.ventas_service)
         abc_result = await abc_service.get_analisis_abc(filters)
-        # abc_result es un dict con "productos" como lista de dicts
-        # Cada producto usa "categoria" (no "clasificacion")
-        return {p["nombre"]: p["categoria"] for p in abc_result.get("productos", [])}
+        return abc_result["_categoria_por_nombre"]
+
+    async def get_sugerencias(
+        self,
+        filters: FilterParams,
+        proveedor: Optional[str] = None,
+        nombre: Optional[str] = None,
+    ) -> List[SugerenciaCompraResponse]:
+        """Calcula sugerencias de reposición con inteligencia adicional (ABC, tendencia, ROI).
+
+        Con `proveedor` o `nombre` solo se leen y agregan las ventas de ese proveedor
+        o producto (filtro en SQL); la clasificación ABC, el forecast y el período
+        siguen calculándose sobre los filtros completos para que las cifras coincidan
+        con el listado general.
+        """
+        ventas_filters = filters
+        if proveedor is not None:
+            if filters.proveedores and proveedor not in filters.proveedores:
+                return []
+            ventas_filters = ventas_filters.model_copy(update={"proveedores": [proveedor]})
+        if nombre is not None:
+            if filters.productos and nombre not in filters.productos:
+                return []
+            ventas_filters = ventas_filters.model_copy(update={"productos": [nombre]})
 
-    async def get_sugerencias(self, filters: FilterParams) -> List[SugerenciaCompraResponse]:
-        """Calcula sugerencias de reposición con inteligencia adicional (ABC, tendencia, ROI)."""
-        ventas, _ = await self.ventas_service.get_ventas(filters)
+        ventas, _ = await self.ventas_service.get_ventas(ventas_filters)
         inventario = await self.get_inventario()
         
         if not ventas:
             return []
         
         # Rango real de fechas del periodo
-        fechas = [v.fecha_venta for v in ventas]
-        fecha_min = min(fechas)
-        fecha_max = max(fechas)
+        if ventas_filters is filters:
+            fechas = [v.fecha_venta for v in ventas]
+            fecha_min = min(fechas)
+            fecha_max = max(fechas)
+        else:
+            fecha_min, fecha_max = await self.ventas_service.get_rango_fechas(filters)
         dias_periodo = max((fecha_max - fecha_min).days + 1, 1)
         
         # Agrupar ventas por producto y por día
@@ -103,7 +182,11 @@ class ComprasService:
             prod["por_dia"][v.fecha_venta] += v.cantidad
 
         # Clasificación ABC por producto
-        mapa_abc = await self._get_clasificacion_abc_por_producto(filters)
+        if nombre is None:
+            mapa_abc = await self._get_clasificacion_abc_por_producto(filters)
+        else:
+            abc_service = ABCService(self.ventas_service)
+            mapa_abc = {nombre: await abc_service.get_clasificacion_abc_producto(nombre, filters)}
 
         # Forecast por producto (si disponible): venta_diaria_promedio en $ por día
         forecast_diario_por_producto: Dict[str, float] = {}
@@ -115,8 +198,10 @@ class ComprasService:
             except Exception:
                 pass
 
-        sugerencias: List[SugerenciaCompraResponse] = []
-        
+        # Primera pasada: señales por producto que dependen de su serie diaria
+        # (tendencia, variabilidad, forecast). La aritmética de reposición se
+        # hace después, vectorizada sobre todos los productos a la vez.
+        filas: List[dict] = []
         for nombre, data in productos.items():
             unidades_vendidas = data["unidades_vendidas"]
             if unidades_vendidas <= 0:
@@ -163,12 +248,6 @@ class ComprasService:
             else:
                 variabilidad = 0.0
 
-            # Stock actual
-            stock_actual = inventario.get(nombre, {}).get("cantidad_disponible", 0)
-            
-            # Días de stock
-            dias_stock = stock_actual / venta_diaria if venta_diaria > 0 else 999
-
             # Cobertura objetivo según ABC
             clasificacion_abc = mapa_abc.get(nombre) or "C"
             if clasificacion_abc == "A":
@@ -178,83 +257,107 @@ class ComprasService:
             else:
                 cobertura_objetivo = 21
 
-            # Margen de seguridad según variabilidad (entre 10% y 40%)
-            margen_seguridad_factor = min(max(0.1 + variabilidad, 0.1), 0.4)
-            demanda_objetivo = venta_diaria * cobertura_objetivo * (1 + margen_seguridad_factor)
-
-            # Cantidad sugerida = demanda objetivo - stock actual
-            cantidad_sugerida = max(0, int(round(demanda_objetivo - stock_actual)))
-            if cantidad_sugerida <= 0:
-                continue
-            
             # Precio de compra (de ventas o inventario)
             precio_compra = data["precio_compra"] or inventario.get(nombre, {}).get("precio", 0)
-            
-            # Costo estimado
-            costo_estimado = cantidad_sugerida * (precio_compra or 0)
-            
-            # Prioridad por días de stock
-            if dias_stock <= 3:
-                prioridad = "🔴 Urgente"
-            elif dias_stock <= 7:
-                prioridad = "🟠 Alta"
-            elif dias_stock <= 15:
-                prioridad = "🟡 Media"
-            else:
-                prioridad = "🟢 Baja"
 
-            # Punto de reorden (ROP) = venta_diaria * (lead_time + safety_stock_dias)
             proveedor_key = data["proveedor"] or ""
-            lead_time_dias = self.lead_time_por_proveedor.get(
-                proveedor_key, self.lead_time_default
-            )
-            safety_dias = self.safety_dias_base * (1 + min(variabilidad, 1.0))
-            punto_reorden = int(round(venta_diaria * (lead_time_dias + safety_dias)))
+            filas.append({
+                "nombre": nombre,
+                "data": data,
+                "venta_diaria": venta_diaria,
+                "demanda_proyectada_7d": demanda_proyectada_7d,
+                "tendencia": tendencia,
+                "variabilidad": variabilidad,
+                "stock_actual": inventario.get(nombre, {}).get("cantidad_disponible", 0),
+                "clasificacion_abc": clasificacion_abc,
+                "cobertura_objetivo": cobertura_objetivo,
+                "precio_compra": precio_compra,
+                "lead_time_dias": self.lead_time_por_proveedor.get(
+                    proveedor_key, self.lead_time_default
+                ),
+                "precio_venta_promedio": data["total_ventas"] / unidades_vendidas,
+            })
 
-            # ROI estimado (si tenemos margen unitario aproximado)
-            # Aproximamos margen como (precio_venta_promedio - precio_compra)
-            if unidades_vendidas > 0:
-                precio_venta_promedio = data["total_ventas"] / unidades_vendidas
-            else:
-                precio_venta_promedio = 0.0
-            margen_unitario = max(0.0, precio_venta_promedio - (precio_compra or 0))
-            roi_estimado = margen_unitario * cantidad_sugerida
-            
+        if not filas:
+            return []
+
+        # Segunda pasada vectorizada: cobertura, objetivo, cantidad, ROP y ROI
+        venta_diaria_arr = np.array([f["venta_diaria"] for f in filas], dtype=float)
+        (
+            dias_stock_arr,
+            cantidad_sugerida_arr,
+            costo_estimado_arr,
+            punto_reorden_arr,
+            roi_estimado_arr,
+            prioridad_arr,
+        ) = _calcular_reposicion(
+            venta_diaria=venta_diaria_arr,
+            stock=np.array([f["stock_actual"] for f in filas], dtype=float),
+            variabilidad=np.array([f["variabilidad"] for f in filas], dtype=float),
+            cobertura_objetivo=np.array([f["cobertura_objetivo"] for f in filas], dtype=float),
+            lead_time=np.array([f["lead_time_dias"] for f in filas], dtype=float),
+            precio_compra=np.array([f["precio_compra"] or 0 for f in filas], dtype=float),
+            precio_venta=np.array([f["precio_venta_promedio"] for f in filas], dtype=float),
+            safety_dias_base=self.safety_dias_base,
+        )
+
+        # Redondeo de presentación por columna
+        dias_stock_r_arr = np.round(dias_stock_arr, 1)
+        roi_estimado_r_arr = np.round(roi_estimado_arr, 2)
+        venta_diaria_r = np.round(venta_diaria_arr, 1).tolist()
+        dias_stock_r = dias_stock_r_arr.tolist()
+        costo_estimado_r = np.round(costo_estimado_arr, 2).tolist()
+        roi_estimado_r = roi_estimado_r_arr.tolist()
+        cantidad_sugerida_l = cantidad_sugerida_arr.tolist()
+        punto_reorden_l = punto_reorden_arr.tolist()
+        prioridad_l = prioridad_arr.tolist()
+
+        # Solo se materializan respuestas para productos que hay que pedir, ya
+        # ordenados por prioridad, días de stock y ROI descendente (lexsort es
+        # estable y toma la última clave como la principal)
+        a_pedir = np.flatnonzero(cantidad_sugerida_arr > 0)
+        orden = a_pedir[np.lexsort((
+            -roi_estimado_r_arr[a_pedir],
+            dias_stock_r_arr[a_pedir],
+            prioridad_arr[a_pedir],
+        ))]
+
+        sugerencias: List[SugerenciaCompraResponse] = []
+        for i in orden.tolist():
+            f = filas[i]
+            data = f["data"]
             sugerencias.append(
                 SugerenciaCompraResponse(
-                    nombre=nombre,
+                    nombre=f["nombre"],
                     proveedor=data["proveedor"],
                     familia=data["familia"],
-                    cantidad_disponible=int(stock_actual),
-                    venta_diaria=round(venta_diaria, 1),
-                    dias_stock=round(dias_stock, 1),
-                    cantidad_sugerida=cantidad_sugerida,
-                    precio_compra=precio_compra,
-                    costo_estimado=round(costo_estimado, 2),
-                    prioridad=prioridad,
-                    clasificacion_abc=clasificacion_abc,
-                    tendencia=tendencia,
-                    variabilidad=variabilidad,
-                    cobertura_objetivo_dias=cobertura_objetivo,
-                    roi_estimado=round(roi_estimado, 2),
-                    unidades_vendidas_periodo=unidades_vendidas,
-                    punto_reorden=punto_reorden,
-                    demanda_proyectada_7d=demanda_proyectada_7d,
+                    cantidad_disponible=int(f["stock_actual"]),
+                    venta_diaria=venta_diaria_r[i],
+                    dias_stock=dias_stock_r[i],
+                    cantidad_sugerida=cantidad_sugerida_l[i],
+                    precio_compra=f["precio_compra"],
+                    costo_estimado=costo_estimado_r[i],
+                    prioridad=Prioridad(prioridad_l[i]),
+                    clasificacion_abc=f["clasificacion_abc"],
+                    tendencia=f["tendencia"],
+                    variabilidad=f["variabilidad"],
+                    cobertura_objetivo_dias=f["cobertura_objetivo"],
+                    roi_estimado=roi_estimado_r[i],
+                    unidades_vendidas_periodo=data["unidades_vendidas"],
+                    punto_reorden=punto_reorden_l[i],
+                    demanda_proyectada_7d=f["demanda_proyectada_7d"],
                 )
             )
         
-        # Ordenar por prioridad y días de stock (y luego por ROI descendente)
-        prioridad_orden = {"🔴 Urgente": 0, "🟠 Alta": 1, "🟡 Media": 2, "🟢 Baja": 3}
-        sugerencias.sort(
-            key=lambda x: (
-                prioridad_orden.get(x.prioridad, 4),
-                x.dias_stock,
-                -(x.roi_estimado or 0),
-            )
-        )
-        
         return sugerencias
     
+    async def get_sugerencia_producto(
+        self, nombre: str, filters: FilterParams
+    ) -> Optional[SugerenciaCompraResponse]:
+        """Sugerencia de reposición de un solo producto (None si no hay que pedir)."""
+        sugerencias = await self.get_sugerencias(filters, nombre=nombre)
+        return sugerencias[0] if sugerencias else None
+    
     async def get_resumen_proveedores(self, filters: FilterParams) -> List[ResumenProveedorResponse]:
         """Obtiene resumen de compras por proveedor."""
         sugerencias = await self.get_sugerencias(filters)
@@ -290,21 +393,12 @@ class ComprasService:
         prioridad_minima: Optional[str] = None
     ) -> OrdenCompraResponse:
         """Genera orden de compra para un proveedor."""
-        sugerencias = await self.get_sugerencias(filters)
-        
-        # Filtrar por proveedor
-        items = [s for s in sugerencias if s.proveedor == proveedor]
+        items = await self.get_sugerencias(filters, proveedor=proveedor)
         
-        # Filtrar por prioridad mínima
-        if prioridad_minima:
-            prioridades_incluir = {
-                "🔴 Urgente": ["🔴 Urgente"],
-                "🟠 Alta": ["🔴 Urgente", "🟠 Alta"],
-                "🟡 Media": ["🔴 Urgente", "🟠 Alta", "🟡 Media"],
-            }
-            prioridades = prioridades_incluir.get(prioridad_minima, [])
-            if prioridades:
-                items = [s for s in items if s.prioridad in prioridades]
+        # Filtrar por prioridad mínima (etiqueta de la API, p. ej. "🟠 Alta")
+        minima = Prioridad.from_label(prioridad_minima)
+        if minima is not None:
+            items = [s for s in items if s.prioridad <= minima]
         
         total_unidades = sum(s.cantidad_sugerida for s in items)
         costo_total = sum(s.costo_estimado for s in items)
@@ -322,9 +416,9 @@ class ComprasService:
         """Obtiene alertas de stock crítico."""
         sugerencias = await self.get_sugerencias(filters)
         
-        urgentes = [s for s in sugerencias if s.prioridad == "🔴 Urgente"]
-        altos = [s for s in sugerencias if s.prioridad == "🟠 Alta"]
-        medios = [s for s in sugerencias if s.prioridad == "🟡 Media"]
+        urgentes = [s for s in sugerencias if s.prioridad is Prioridad.URGENTE]
+        altos = [s for s in sugerencias if s.prioridad is Prioridad.ALTA]
+        medios = [s for s in sugerencias if s.prioridad is Prioridad.MEDIA]
         
         return {
             "urgentes": {
@@ -9,7 +9,7 @@ Alertas sin acción no existen. Cada decisión registra su resolución para
 el circuito de aprendizaje (¿se aceptó? ¿sirvió?).
 """
 import json
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from typing import Any, Dict, List, Optional
 
 from sqlalchemy import text
@@ -237,44 +237,54 @@ class DecisionesService:
 
     async def _detectar_inventario_muerto(self) -> int:
         """P3 · comprador — capital atrapado en stock sin venta en 30 días."""
+        # Total y capital sobre todos los productos (ventana) antes de recortar al top 25
         query = """
+            WITH muertos AS (
+                SELECT
+                    UPPER(TRIM(i.nombre)) as nombre,
+                    COALESCE(i.cantidad_disponible, 0) as stock,
+                    COALESCE(i.cantidad_disponible, 0) * p.costo_unitario as valor_costo
+                FROM items i
+                LEFT JOIN productos p ON p.nombre = UPPER(TRIM(i.nombre))
+                WHERE COALESCE(i.cantidad_disponible, 0) > 0
+                  AND NOT EXISTS (
+                      SELECT 1 FROM reportes_ventas_30dias v
+                      WHERE UPPER(TRIM(v.nombre)) = UPPER(TRIM(i.nombre))
+                        AND v.fecha_venta >= CURRENT_DATE - INTERVAL '30 days'
+                  )
+            )
             SELECT
-                UPPER(TRIM(i.nombre)) as nombre,
-                COALESCE(i.cantidad_disponible, 0) as stock,
-                p.costo_unitario
-            FROM items i
-            LEFT JOIN productos p ON p.nombre = UPPER(TRIM(i.nombre))
-            WHERE COALESCE(i.cantidad_disponible, 0) > 0
-              AND NOT EXISTS (
-                  SELECT 1 FROM reportes_ventas_30dias v
-                  WHERE UPPER(TRIM(v.nombre)) = UPPER(TRIM(i.nombre))
-                    AND v.fecha_venta >= CURRENT_DATE - INTERVAL '30 days'
-              )
+                nombre,
+                stock,
+                valor_costo,
+                COUNT(*) OVER () as total_productos,
+                COALESCE(SUM(valor_costo) OVER (), 0) as capital_total
+            FROM muertos
+            ORDER BY COALESCE(valor_costo, 0) DESC
+            LIMIT 25
         """
         result = await self.db.execute(text(query))
-        filas = [dict(r._asdict()) for r in result.fetchall()]
+        filas = result.fetchall()
         if not filas:
             return 0
 
-        detalle = []
-        capital_total = 0.0
-        for f in filas:
-            costo = float(f["costo_unitario"]) if f["costo_unitario"] is not None else None
-            valor = semantica.valor_inventario_costo(float(f["stock"] or 0), costo)
-            if valor:
-                capital_total += valor
-            detalle.append(
-                {"nombre": f["nombre"], "stock": float(f["stock"] or 0), "valor_costo": valor}
-            )
-
-        detalle.sort(key=lambda x: x["valor_costo"] or 0, reverse=True)
+        total_productos = int(filas[0].total_productos)
+        capital_total = float(filas[0].capital_total)
+        detalle = [
+            {
+                "nombre": f.nombre,
+                "stock": float(f.stock or 0),
+                "valor_costo": float(f.valor_costo) if f.valor_costo is not None else None,
+            }
+            for f in filas
+        ]
 
         emitida = await self._emitir(
             codigo_alerta="inventario_muerto",
             prioridad="P3",
-            titulo=f"{len(detalle)} productos sin una sola venta en 30 días",
+            titulo=f"{total_productos} productos sin una sola venta en 30 días",
             que_pasa=(
-                f"Hay {len(detalle)} productos con stock y cero ventas en 30 días. "
+                f"Hay {total_productos} productos con stock y cero ventas en 30 días. "
                 f"Capital atrapado (al costo): ${capital_total:,.0f}."
             ),
             por_que=(
@@ -290,7 +300,7 @@ class DecisionesService:
             dueno="comprador",
             impacto_dinero=capital_total,
             clave_dedup=f"inventario_muerto:{datetime.now(timezone.utc):%Y-%W}",
-            datos=detalle[:25],
+            datos=detalle,
         )
         return 1 if emitida else 0
 
@@ -388,18 +398,28 @@ class DecisionesService:
         except Exception:
             await self.db.rollback()
             return 0
-        filas = [dict(r._asdict()) for r in result.fetchall()]
+        filas = result.mappings().all()
 
-        hoy = datetime.now(timezone.utc).date()
+        plazo = semantica.DIAS_PLAZO_PAGO_DEFAULT
+        plazo_td = timedelta(days=plazo)
+        # dias_restantes = ordinal(fecha) + plazo - ordinal(hoy)
+        base = datetime.now(timezone.utc).date().toordinal() - plazo
+        if not filas:
+            return 0
+        # El tipo de la columna es el mismo en todo el resultado: resolver la conversión una vez
+        muestra = filas[0]["fecha"]
+        a_fecha = (
+            (lambda x: x.date()) if hasattr(muestra, "date")
+            else (lambda x: date.fromisoformat(x[:10])) if isinstance(muestra, str)
+            else (lambda x: x)
+        )
         por_vencer = []
         total = 0.0
         for f in filas:
-            fecha_fact = f["fecha"]
-            if hasattr(fecha_fact, "date"):
-                fecha_fact = fecha_fact.date()
-            vence = fecha_fact + timedelta(days=semantica.DIAS_PLAZO_PAGO_DEFAULT)
-            dias_restantes = (vence - hoy).days
+            fecha_fact = a_fecha(f["fecha"])
+            dias_restantes = fecha_fact.toordinal() - base
             if 0 <= dias_restantes <= 7:
+                vence = fecha_fact + plazo_td
                 monto = float(f["monto"] or 0)
                 total += monto
                 por_vencer.append(
@@ -4,7 +4,7 @@ Servicio de diagnóstico causal (Fase 4).
 Descompone la variación de venta entre dos períodos en efectos de
 volumen, precio y mix (productos que explican la desviación).
 """
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -12,41 +12,64 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app import semantica
 
 
+# Venta por producto de las ventanas previa y reciente (un solo escaneo)
+_PERIODOS_SQL = text("""
+    WITH v AS (
+        SELECT
+            REGEXP_REPLACE(UPPER(TRIM(nombre)), '\\s+', ' ', 'g') as nombre,
+            precio,
+            cantidad,
+            precio_promedio_compra,
+            fecha_venta >= CURRENT_DATE - CAST(:reciente AS INTEGER) as es_reciente
+        FROM reportes_ventas_30dias
+        WHERE fecha_venta >= CURRENT_DATE - CAST(:inicio AS INTEGER)
+          AND fecha_venta < CURRENT_DATE
+    )
+    SELECT
+        nombre,
+        es_reciente,
+        SUM(cantidad) as cantidad,
+        CASE WHEN SUM(cantidad) > 0
+             THEN SUM(precio * cantidad) / SUM(cantidad)
+             ELSE AVG(precio) END as precio,
+        SUM(precio * cantidad) as venta_neta,
+        SUM((precio - COALESCE(precio_promedio_compra, 0)) * cantidad) as margen
+    FROM v
+    GROUP BY nombre, es_reciente
+""")
+
+
 class DiagnosticoCausalService:
     """Descomposición volumen / precio / mix de la venta."""
 
     def __init__(self, db: AsyncSession):
         self.db = db
 
-    async def _agregar_periodo(self, dias_atras_inicio: int, dias_atras_fin: int) -> List[Dict]:
-        """Agrega venta por producto en una ventana [fin, inicio] días atrás."""
-        query = """
-            SELECT
-                REGEXP_REPLACE(UPPER(TRIM(v.nombre)), '\\s+', ' ', 'g') as nombre,
-                SUM(v.cantidad) as cantidad,
-                CASE WHEN SUM(v.cantidad) > 0
-                     THEN SUM(v.precio * v.cantidad) / SUM(v.cantidad)
-                     ELSE AVG(v.precio) END as precio,
-                SUM(v.precio * v.cantidad) as venta_neta,
-                SUM((v.precio - COALESCE(v.precio_promedio_compra, 0)) * v.cantidad) as margen
-            FROM reportes_ventas_30dias v
-            WHERE v.fecha_venta >= CURRENT_DATE - CAST(:inicio AS INTEGER)
-              AND v.fecha_venta < CURRENT_DATE - CAST(:fin AS INTEGER)
-            GROUP BY REGEXP_REPLACE(UPPER(TRIM(v.nombre)), '\\s+', ' ', 'g')
+    async def _agregar_periodos(
+        self, dias_reciente: int, dias_previo: int
+    ) -> Tuple[List[Dict], List[Dict]]:
+        """Agrega venta por producto de la ventana previa y la reciente en un solo escaneo.
+
+        Devuelve (periodo_a, periodo_b): previa = [reciente + previo, reciente) días atrás,
+        reciente = [reciente, 0) días atrás.
         """
         result = await self.db.execute(
-            text(query), {"inicio": dias_atras_inicio, "fin": dias_atras_fin}
+            _PERIODOS_SQL,
+            {"inicio": dias_reciente + dias_previo, "reciente": dias_reciente},
         )
-        return [
-            {
-                "nombre": r[0],
-                "cantidad": float(r[1] or 0),
-                "precio": float(r[2] or 0),
-                "venta_neta": float(r[3] or 0),
-                "margen": float(r[4] or 0),
-            }
-            for r in result.fetchall()
-        ]
+        periodo_a: List[Dict] = []
+        periodo_b: List[Dict] = []
+        for r in result.fetchall():
+            (periodo_b if r[1] else periodo_a).append(
+                {
+                    "nombre": r[0],
+                    "cantidad": float(r[2] or 0),
+                    "precio": float(r[3] or 0),
+                    "venta_neta": float(r[4] or 0),
+                    "margen": float(r[5] or 0),
+                }
+            )
+        return periodo_a, periodo_b
 
     async def get_descomposicion(
         self,
@@ -54,8 +77,7 @@ class DiagnosticoCausalService:
         dias_previo: int = 7,
     ) -> Dict[str, Any]:
         """Compara ventana reciente vs ventana previa inmediata."""
-        periodo_b = await self._agregar_periodo(dias_reciente, 0)
-        periodo_a = await self._agregar_periodo(dias_reciente + dias_previo, dias_reciente)
+        periodo_a, periodo_b = await self._agregar_periodos(dias_reciente, dias_previo)
 
         descomp = semantica.descomponer_varianza_venta(periodo_a, periodo_b)
 
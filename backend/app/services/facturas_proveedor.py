@@ -2,90 +2,152 @@
 Servicio de facturas de proveedor - Vencimientos y recordatorios.
 Calcula fecha_vencimiento = fecha + dias_plazo (default 30).
 """
-from datetime import date, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
+# Facturas unicas por (proveedor, fecha). Los filtros opcionales van como
+# parametros nulos para que la sentencia sea estatica y SQLAlchemy reutilice
+# su compilacion (cache de sentencias del engine).
+_FACTURAS_BASE = """
+    SELECT
+        proveedor,
+        fecha,
+        CAST(fecha AS DATE) as fecha_factura,
+        CAST(fecha AS DATE) + CAST(:dias_plazo AS INTEGER) as fecha_vencimiento,
+        MAX(total_fact) as monto,
+        COUNT(*) as lineas
+    FROM facturas_proveedor
+    WHERE CAST(:proveedor AS TEXT) IS NULL
+       OR LOWER(TRIM(proveedor)) LIKE LOWER(CAST(:proveedor AS TEXT))
+    GROUP BY proveedor, fecha
+"""
+
+_FACTURAS_SQL = text(f"""
+    WITH f AS ({_FACTURAS_BASE}),
+    e AS (
+        SELECT
+            f.*,
+            fecha_vencimiento - CURRENT_DATE as dias_restantes,
+            CASE
+                WHEN fecha_vencimiento < CURRENT_DATE THEN 'vencida'
+                WHEN fecha_vencimiento = CURRENT_DATE THEN 'vence_hoy'
+                WHEN fecha_vencimiento <= CURRENT_DATE + 7 THEN 'proxima'
+                ELSE 'vigente'
+            END as estado
+        FROM f
+    )
+    SELECT proveedor, fecha_factura, fecha_vencimiento, dias_restantes, monto, lineas, estado
+    FROM e
+    WHERE CAST(:estado AS TEXT) IS NULL OR estado = CAST(:estado AS TEXT)
+    ORDER BY fecha DESC, proveedor
+""").execution_options(yield_per=1000)
+
+_RESUMEN_SQL = text(f"""
+    WITH f AS ({_FACTURAS_BASE}),
+    d AS (
+        SELECT
+            proveedor,
+            fecha,
+            COALESCE(monto, 0) as monto,
+            fecha_vencimiento - CURRENT_DATE as dias_restantes
+        FROM f
+    )
+    SELECT
+        proveedor,
+        COUNT(*) as total_facturas,
+        SUM(monto) as monto_total,
+        COUNT(*) FILTER (WHERE dias_restantes < 0) as facturas_vencidas,
+        COALESCE(SUM(monto) FILTER (WHERE dias_restantes < 0), 0) as monto_vencido,
+        COUNT(*) FILTER (WHERE dias_restantes = 0) as facturas_vence_hoy,
+        COALESCE(SUM(monto) FILTER (WHERE dias_restantes = 0), 0) as monto_vence_hoy,
+        COUNT(*) FILTER (WHERE dias_restantes BETWEEN 1 AND 7) as facturas_proximas,
+        COALESCE(SUM(monto) FILTER (WHERE dias_restantes BETWEEN 1 AND 7), 0) as monto_proximo
+    FROM d
+    GROUP BY proveedor
+    ORDER BY MAX(fecha) DESC, proveedor
+""")
+
+_ESTADOS = ("vencida", "vence_hoy", "proxima", "vigente")
+
+COLUMNAS_FACTURA = (
+    "proveedor",
+    "fecha_factura",
+    "fecha_vencimiento",
+    "dias_restantes",
+    "monto",
+    "lineas",
+    "estado",
+)
+
+
+def _params(proveedor: Optional[str], dias_plazo: int, **extra: Any) -> Dict[str, Any]:
+    """Parametros comunes; proveedor=None desactiva el filtro."""
+    return {
+        "dias_plazo": dias_plazo,
+        "proveedor": f"%{proveedor.strip()}%" if proveedor else None,
+        **extra,
+    }
+
+
 class FacturasProveedorService:
     """Servicio para gestionar facturas de proveedor y vencimientos."""
 
     def __init__(self, db: AsyncSession):
         self.db = db
+        # Memo por instancia (la instancia vive lo que dura la request)
+        self._cache: Dict[tuple, Any] = {}
 
-    async def get_facturas(
+    async def get_facturas_filas(
         self,
         proveedor: Optional[str] = None,
         dias_plazo: int = 30,
         estado: Optional[str] = None,
-    ) -> List[Dict[str, Any]]:
+    ) -> List[Tuple[Any, ...]]:
         """
-        Obtiene facturas con estado de vencimiento.
+        Facturas con estado de vencimiento como tuplas en el orden de COLUMNAS_FACTURA.
         Agrupa por proveedor + fecha (una factura por dia por proveedor).
         estado: None (todas), 'vencida', 'proxima', 'vigente', 'vence_hoy'
         """
-        # Query para obtener facturas unicas por (proveedor, fecha)
-        query = """
-            SELECT 
-                proveedor,
-                fecha,
-                MAX(total_fact) as monto,
-                COUNT(*) as lineas
-            FROM facturas_proveedor
-            WHERE 1=1
-        """
-        params: Dict[str, Any] = {}
-        if proveedor:
-            query += " AND LOWER(TRIM(proveedor)) LIKE LOWER(:proveedor)"
-            params["proveedor"] = f"%{proveedor.strip()}%"
+        estado = estado if estado in _ESTADOS else None
+        key = ("facturas", proveedor, dias_plazo, estado)
+        if key in self._cache:
+            return self._cache[key]
 
-        query += " GROUP BY proveedor, fecha ORDER BY fecha DESC, proveedor"
+        params = _params(proveedor, dias_plazo, estado=estado)
         try:
-            result = await self.db.execute(text(query), params)
+            # Cursor de servidor: las filas llegan por lotes en vez de materializar todo
+            result = await self.db.stream(_FACTURAS_SQL, params)
+            filas = [
+                (
+                    row.proveedor,
+                    str(row.fecha_factura),
+                    str(row.fecha_vencimiento),
+                    int(row.dias_restantes),
+                    float(row.monto or 0),
+                    int(row.lineas or 0),
+                    row.estado,
+                )
+                async for row in result
+            ]
         except Exception:
             # Si la tabla no existe o tiene otro esquema, devolver lista vacia
             return []
 
-        rows = result.fetchall()
-        hoy = date.today()
-        facturas = []
-
-        for row in rows:
-            row_dict = row._asdict()
-            fecha_fact = row_dict["fecha"]
-            if hasattr(fecha_fact, "date"):
-                fecha_fact = fecha_fact.date()
-            elif isinstance(fecha_fact, str):
-                fecha_fact = date.fromisoformat(fecha_fact[:10])
-
-            fecha_venc = fecha_fact + timedelta(days=dias_plazo)
-            dias_restantes = (fecha_venc - hoy).days
-
-            if dias_restantes < 0:
-                est = "vencida"
-            elif dias_restantes == 0:
-                est = "vence_hoy"
-            elif dias_restantes <= 7:
-                est = "proxima"
-            else:
-                est = "vigente"
-
-            if estado and estado in ("vencida", "vence_hoy", "proxima", "vigente") and est != estado:
-                continue
-
-            facturas.append({
-                "proveedor": row_dict["proveedor"],
-                "fecha_factura": str(fecha_fact),
-                "fecha_vencimiento": str(fecha_venc),
-                "dias_restantes": dias_restantes,
-                "monto": float(row_dict["monto"] or 0),
-                "lineas": int(row_dict["lineas"] or 0),
-                "estado": est,
-            })
+        self._cache[key] = filas
+        return filas
 
-        return facturas
+    async def get_facturas(
+        self,
+        proveedor: Optional[str] = None,
+        dias_plazo: int = 30,
+        estado: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Obtiene facturas con estado de vencimiento (ver get_facturas_filas)."""
+        filas = await self.get_facturas_filas(proveedor, dias_plazo, estado)
+        return [dict(zip(COLUMNAS_FACTURA, f)) for f in filas]
 
     async def get_resumen(
         self,
@@ -93,52 +155,58 @@ class FacturasProveedorService:
         dias_plazo: int = 30,
     ) -> Dict[str, Any]:
         """Resumen por proveedor: total facturas, monto, vencidas, proximas."""
-        facturas = await self.get_facturas(proveedor=proveedor, dias_plazo=dias_plazo)
-
-        total_facturas = len(facturas)
-        monto_total = sum(f["monto"] for f in facturas)
-        vencidas = [f for f in facturas if f["estado"] == "vencida"]
-        vence_hoy = [f for f in facturas if f["estado"] == "vence_hoy"]
-        proximas = [f for f in facturas if f["estado"] == "proxima"]
-        vigentes = [f for f in facturas if f["estado"] == "vigente"]
-
-        monto_vencido = sum(f["monto"] for f in vencidas)
-        monto_vence_hoy = sum(f["monto"] for f in vence_hoy)
-        monto_proximo = sum(f["monto"] for f in proximas)
-
-        # Resumen por proveedor
-        por_proveedor: Dict[str, Dict[str, Any]] = {}
-        for f in facturas:
-            p = f["proveedor"]
-            if p not in por_proveedor:
-                por_proveedor[p] = {
-                    "proveedor": p,
-                    "total_facturas": 0,
-                    "monto_total": 0,
-                    "facturas_vencidas": 0,
-                    "monto_vencido": 0,
-                    "facturas_proximas": 0,
-                    "monto_proximo": 0,
-                }
-            por_proveedor[p]["total_facturas"] += 1
-            por_proveedor[p]["monto_total"] += f["monto"]
-            if f["estado"] == "vencida":
-                por_proveedor[p]["facturas_vencidas"] += 1
-                por_proveedor[p]["monto_vencido"] += f["monto"]
-            elif f["estado"] in ("proxima", "vence_hoy"):
-                por_proveedor[p]["facturas_proximas"] += 1
-                por_proveedor[p]["monto_proximo"] += f["monto"] if f["estado"] == "proxima" else 0
-                if f["estado"] == "vence_hoy":
-                    por_proveedor[p]["monto_proximo"] += f["monto"]
-
-        return {
+        key = ("resumen", proveedor, dias_plazo)
+        if key in self._cache:
+            return self._cache[key]
+
+        # Misma agrupacion y clasificacion que get_facturas, agregada en SQL
+        try:
+            result = await self.db.execute(_RESUMEN_SQL, _params(proveedor, dias_plazo))
+            rows = result.fetchall()
+            cacheable = True
+        except Exception:
+            # Si la tabla no existe o tiene otro esquema, devolver resumen vacio
+            rows, cacheable = [], False
+
+        # Una sola pasada: totales generales y detalle por proveedor
+        total_facturas = vencidas = vence_hoy = proximas = 0
+        monto_total = monto_vencido = monto_vence_hoy = monto_proximo = 0.0
+        por_proveedor = []
+        for r in rows:
+            n, m = int(r.total_facturas), float(r.monto_total)
+            nv, mv = int(r.facturas_vencidas), float(r.monto_vencido)
+            nh, mh = int(r.facturas_vence_hoy), float(r.monto_vence_hoy)
+            npx, mpx = int(r.facturas_proximas), float(r.monto_proximo)
+            total_facturas += n
+            monto_total += m
+            vencidas += nv
+            monto_vencido += mv
+            vence_hoy += nh
+            monto_vence_hoy += mh
+            proximas += npx
+            monto_proximo += mpx
+            # Por proveedor, "proximas" incluye las que vencen hoy
+            por_proveedor.append({
+                "proveedor": r.proveedor,
+                "total_facturas": n,
+                "monto_total": m,
+                "facturas_vencidas": nv,
+                "monto_vencido": mv,
+                "facturas_proximas": npx + nh,
+                "monto_proximo": mpx + mh,
+            })
+
+        resumen = {
             "total_facturas": total_facturas,
             "monto_total": round(monto_total, 2),
-            "facturas_vencidas": len(vencidas),
+            "facturas_vencidas": vencidas,
             "monto_vencido": round(monto_vencido, 2),
-            "facturas_vence_hoy": len(vence_hoy),
+            "facturas_vence_hoy": vence_hoy,
             "monto_vence_hoy": round(monto_vence_hoy, 2),
-            "facturas_proximas": len(proximas),
+            "facturas_proximas": proximas,
             "monto_proximo": round(monto_proximo, 2),
-            "por_proveedor": list(por_proveedor.values()),
+            "por_proveedor": por_proveedor,
         }
+        if cacheable:
+            self._cache[key] = resumen
+        return resumen
@@ -99,10 +99,11 @@ class ForecastService:
             FROM ventas_diarias_historicas h
             JOIN productos p ON p.id = h.producto_id
             WHERE h.fecha >= CURRENT_DATE - CAST(:dias_max AS INTEGER)
-              AND h.producto_id IN (
-                  SELECT DISTINCT producto_id FROM ventas_diarias_historicas
-                  WHERE fecha >= CURRENT_DATE - CAST(:activos AS INTEGER)
-                    AND unidades > 0
+              AND EXISTS (
+                  SELECT 1 FROM ventas_diarias_historicas a
+                  WHERE a.producto_id = h.producto_id
+                    AND a.fecha >= CURRENT_DATE - CAST(:activos AS INTEGER)
+                    AND a.unidades > 0
               )
             ORDER BY h.producto_id, h.fecha
         """
@@ -2,10 +2,11 @@
 Servicio de insights inteligentes para gestión de inventario.
 Cruza información de ventas, compras (sugerencias) y ABC para generar insights accionables.
 """
-from datetime import date, timedelta
-from typing import Any, Dict, List, Optional
+import asyncio
+import heapq
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from app.models.schemas import FilterParams, SugerenciaCompraResponse
 from app.services.ventas import VentasService
@@ -23,8 +24,10 @@ class InsightsService:
         db: AsyncSession,
         ventas_service: VentasService,
         predicciones_service: Optional[PrediccionesService] = None,
+        session_factory: Optional[async_sessionmaker] = None,
     ):
         self.db = db
+        self.session_factory = session_factory
         self.ventas_service = ventas_service
         self.predicciones_service = predicciones_service or PrediccionesService(ventas_service)
         self.compras_service = ComprasService(
@@ -33,16 +36,42 @@ class InsightsService:
             self.predicciones_service,
         )
 
+    async def _en_sesion(self, fn: Callable[["InsightsService"], Awaitable[Any]]) -> Any:
+        """
+        Ejecuta ``fn`` sobre un InsightsService con sesión propia. El factory
+        debe ser de solo lectura (get_readonly_session_factory: AUTOCOMMIT).
+        Sin session_factory usa la sesión compartida.
+        """
+        if self.session_factory is None:
+            return await fn(self)
+        async with self.session_factory() as s:
+            return await fn(InsightsService(s, VentasService(s)))
+
+    async def _reunir(self, *fns: Callable[["InsightsService"], Awaitable[Any]]) -> List[Any]:
+        """
+        Lanza bloques de consulta independientes. Con session_factory corren en paralelo
+        (una conexión por bloque); una AsyncSession no admite uso concurrente, así que
+        sin factory se ejecutan en serie sobre la sesión compartida.
+        """
+        if self.session_factory is None:
+            return [await fn(self) for fn in fns]
+        return list(await asyncio.gather(*(self._en_sesion(fn) for fn in fns)))
+
+    async def _get_inventario_kpis(self) -> Tuple[Dict[str, Any], Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Resumen, stockout, productos y valor por familia del inventario."""
+        inv_service = InventarioService(self.db)
+        res_inv = await inv_service.get_resumen_inventario()
+        stockout = await inv_service.get_stockout_rate()
+        productos = await inv_service.get_inventario_completo()
+        valor_familias = await inv_service.get_valor_por_familia()
+        return res_inv, stockout, productos, valor_familias
+
     def _serialize_sugerencias(self, items: List[Any], limit: int = 5) -> List[Dict[str, Any]]:
-        out: List[Dict[str, Any]] = []
-        for s in items[:limit]:
-            if isinstance(s, SugerenciaCompraResponse):
-                out.append(s.model_dump(mode="json"))
-            elif hasattr(s, "model_dump"):
-                out.append(s.model_dump(mode="json"))
-            elif isinstance(s, dict):
-                out.append(s)
-        return out
+        return [
+            s.model_dump(mode="json") if hasattr(s, "model_dump") else s
+            for s in items[:limit]
+            if hasattr(s, "model_dump") or isinstance(s, dict)
+        ]
 
     async def get_insights(self, filters: FilterParams) -> Dict[str, Any]:
         """
@@ -73,13 +102,16 @@ class InsightsService:
             if (s.clasificacion_abc or "C") == "A" and s.dias_stock <= 7
         ]
 
-        # Oportunidades: alto ROI estimado, stock bajo o en cero
-        oportunidades = [
-            s
-            for s in sugerencias
-            if (s.roi_estimado or 0) > 0 and s.cantidad_disponible <= s.cobertura_objetivo_dias * s.venta_diaria * 0.3
-        ]
-        oportunidades.sort(key=lambda x: (x.roi_estimado or 0), reverse=True)
+        # Oportunidades: alto ROI estimado, stock bajo o en cero (se publican las 20 mejores)
+        oportunidades = heapq.nlargest(
+            20,
+            (
+                s
+                for s in sugerencias
+                if (s.roi_estimado or 0) > 0 and s.cantidad_disponible <= s.cobertura_objetivo_dias * s.venta_diaria * 0.3
+            ),
+            key=lambda x: (x.roi_estimado or 0),
+        )
 
         # Sobre-stock: clase C con muchos días de stock
         sobre_stock = [
@@ -89,10 +121,11 @@ class InsightsService:
         ]
 
         # Productos que se van a agotar esta semana (todos los que tienen < 7 dias)
-        productos_agotamiento_semana = [
-            s for s in sugerencias if s.dias_stock < 7 and s.dias_stock >= 0
-        ]
-        productos_agotamiento_semana.sort(key=lambda x: x.dias_stock)
+        productos_agotamiento_semana = heapq.nsmallest(
+            15,
+            (s for s in sugerencias if s.dias_stock < 7 and s.dias_stock >= 0),
+            key=lambda x: x.dias_stock,
+        )
 
         # Costo de oportunidad: ventas perdidas estimadas por quiebre (stock=0)
         costo_oportunidad = 0.0
@@ -123,7 +156,7 @@ class InsightsService:
 
         return {
             "productos_en_riesgo": productos_en_riesgo,
-            "oportunidades": oportunidades[:20],
+            "oportunidades": oportunidades,
             "sobre_stock": sobre_stock[:20],
             "proveedores_en_riesgo": proveedores_en_riesgo,
             "productos_agotamiento_semana": [
@@ -133,9 +166,9 @@ class InsightsService:
                     "dias_stock": s.dias_stock,
                     "venta_diaria": s.venta_diaria,
                     "cantidad_sugerida": s.cantidad_sugerida,
-                    "prioridad": s.prioridad,
+                    "prioridad": s.prioridad.label,
                 }
-                for s in productos_agotamiento_semana[:15]
+                for s in productos_agotamiento_semana
             ],
             "costo_oportunidad_estimado": round(costo_oportunidad, 2),
         }
@@ -198,25 +231,31 @@ class InsightsService:
 
     async def get_kpis_ejecutivo(self, filters: FilterParams) -> Dict[str, Any]:
         """KPIs consolidados para CEO en una sola llamada (respeta filtros del período)."""
-        today = date.today()
-        f_hoy = filters.model_copy(update={"fecha_inicio": today, "fecha_fin": today})
-        ayer = today - timedelta(days=1)
-        f_ayer = filters.model_copy(update={"fecha_inicio": ayer, "fecha_fin": ayer})
-
-        m_hoy = await self.ventas_service.get_metricas(f_hoy)
-        m_ayer = await self.ventas_service.get_metricas(f_ayer)
-        m_periodo = await self.ventas_service.get_metricas(filters)
-
-        ventas_hoy = float(m_hoy.total_ventas or 0)
-        transacciones_hoy = int(m_hoy.total_registros or 0)
-        ventas_ayer = float(m_ayer.total_ventas or 0)
+        # Bloques independientes: métricas, márgenes, inventario, backtest e insights
+        (
+            totales_dia,
+            m_periodo,
+            marg,
+            (res_inv, stockout, productos, valor_familias),
+            backtest,
+            insights_data,
+        ) = await self._reunir(
+            lambda svc: svc.ventas_service.get_totales_hoy_ayer(filters),
+            lambda svc: svc.ventas_service.get_metricas(filters),
+            lambda svc: MargenesService(svc.ventas_service).get_analisis_margenes(filters),
+            lambda svc: svc._get_inventario_kpis(),
+            lambda svc: svc.predicciones_service.get_backtest_metricas(filters, semanas=4),
+            lambda svc: svc.get_insights(filters),
+        )
+
+        ventas_hoy = totales_dia["total_hoy"]
+        transacciones_hoy = totales_dia["tx_hoy"]
+        ventas_ayer = totales_dia["total_ayer"]
         if ventas_ayer > 0:
             delta_vs_ayer = round((ventas_hoy - ventas_ayer) / ventas_ayer * 100, 1)
         else:
             delta_vs_ayer = 0.0 if ventas_hoy == 0 else 100.0
 
-        margenes_service = MargenesService(self.ventas_service)
-        marg = await margenes_service.get_analisis_margenes(filters)
         margen_bruto_pct = (
             round((marg.margen_total / marg.ventas_con_margen_total) * 100, 2)
             if marg.ventas_con_margen_total and marg.ventas_con_margen_total > 0
@@ -230,11 +269,6 @@ class InsightsService:
         )
         top_familias_margen = fams_sorted[:3]
 
-        inv_service = InventarioService(self.db)
-        res_inv = await inv_service.get_resumen_inventario()
-        stockout = await inv_service.get_stockout_rate()
-        productos = await inv_service.get_inventario_completo()
-
         total_p = int(res_inv.get("total_productos", 0) or 0)
         normales = int(res_inv.get("productos_normales", 0) or 0)
         exceso = int(res_inv.get("productos_exceso", 0) or 0)
@@ -242,31 +276,25 @@ class InsightsService:
 
         # Cobertura: menor y mayor (capital ocioso)
         with_cov = [p for p in productos if p.get("dias_cobertura") is not None and p.get("dias_cobertura", 999) < 999]
-        by_cov = sorted(with_cov, key=lambda x: float(x.get("dias_cobertura") or 999))
         top_menor_cobertura = [
             {
                 "nombre": p.get("nombre"),
-                "dias_cobertura": p.get("dias_cobertura"),
+                "dias_cobertura": round(p["dias_cobertura"], 1),
                 "proveedor": p.get("proveedor"),
             }
-            for p in by_cov[:5]
+            for p in heapq.nsmallest(5, with_cov, key=lambda x: float(x.get("dias_cobertura") or 999))
         ]
-        by_cov_desc = sorted(
-            with_cov,
-            key=lambda x: float(x.get("dias_cobertura") or 0),
-            reverse=True,
-        )
         top_mayor_cobertura = [
             {
                 "nombre": p.get("nombre"),
-                "dias_cobertura": p.get("dias_cobertura"),
+                "dias_cobertura": round(p["dias_cobertura"], 1),
                 "proveedor": p.get("proveedor"),
             }
-            for p in by_cov_desc[:5]
+            for p in heapq.nlargest(5, with_cov, key=lambda x: float(x.get("dias_cobertura") or 0))
         ]
 
         # GMROI por familia (proxy: margen período / valor inventario actual por familia)
-        valor_por_fam = {x["familia"]: float(x.get("valor") or 0) for x in await inv_service.get_valor_por_familia()}
+        valor_por_fam = {x["familia"]: float(x.get("valor") or 0) for x in valor_familias}
         gmroi_rows: List[Dict[str, Any]] = []
         for row in fams_sorted:
             fam = row.get("familia") or "Sin familia"
@@ -293,11 +321,9 @@ class InsightsService:
             round(top10_m / total_m * 100, 1) if total_m > 0 else 0.0
         )
 
-        backtest = await self.predicciones_service.get_backtest_metricas(filters, semanas=4)
         wape_forecast = backtest.get("wape_promedio")
         mape_forecast = backtest.get("mape_promedio")
 
-        insights_data = await self.get_insights(filters)
         prod_riesgo = insights_data.get("productos_en_riesgo") or []
         oportunidades = insights_data.get("oportunidades") or []
 
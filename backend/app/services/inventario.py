@@ -1,19 +1,276 @@
 """
 Servicio de inventario - Gestión y análisis de stock.
 """
+import asyncio
 from datetime import date, timedelta
-from typing import List, Dict, Any, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from dataclasses import dataclass
 
+import numpy as np
 from sqlalchemy import text
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from app.models.schemas import FilterParams
+from app.cache import INVENTARIO_COMPLETO_CACHE, get_cached, set_cached
+from app.database import relacion_existe
+from app.models.schemas import EstadoStock, FilterParams
 from app.services.ventas import VentasService
 from app.services.abc import ABCService
 from app.services.compras import ComprasService
 
 
+# Ventas de 30 días por producto: precalculadas (migración 009) o agrupadas al vuelo
+_VENTAS_30D_MV = """
+        SELECT 
+            nombre,
+            cantidad_vendida,
+            total_ventas,
+            precio_promedio_venta,
+            precio_promedio_compra,
+            proveedor,
+            familia
+        FROM mv_ventas_30d_por_producto
+"""
+
+_VENTAS_30D_AGRUPADAS = """
+        SELECT 
+            nombre,
+            SUM(cantidad) as cantidad_vendida,
+            SUM(precio * cantidad) as total_ventas,
+            AVG(precio) as precio_promedio_venta,
+            AVG(precio_promedio_compra) as precio_promedio_compra,
+            MAX(proveedor_moda) as proveedor,
+            MAX(familia) as familia
+        FROM reportes_ventas_30dias
+        GROUP BY nombre
+"""
+
+_REFRESCAR_VENTAS_30D_SQL = text("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_ventas_30d_por_producto")
+
+# None = aún no probado; False = la vista no existe en esta base
+_ventas_30d_mv_disponible: Optional[bool] = None
+
+
+# Stock actual (items) cruzado con ventas de los últimos 30 días. Las columnas
+# numéricas salen como float8 sin NULL (0 en precio_compra = sin costo): asyncpg
+# entrega float nativo en vez de Decimal y no hay conversión por fila.
+_INVENTARIO_BASE = """
+    WITH ventas_30d AS ({ventas_30d}),
+    inventario AS (
+        SELECT 
+            nombre,
+            cantidad_disponible,
+            precio
+        FROM items
+    )
+    SELECT 
+        COALESCE(i.nombre, v.nombre) as nombre,
+        COALESCE(i.cantidad_disponible, 0)::float8 as stock_actual,
+        COALESCE(v.cantidad_vendida, 0)::float8 as cantidad_vendida_30d,
+        COALESCE(v.total_ventas, 0)::float8 as total_ventas_30d,
+        COALESCE(v.precio_promedio_venta, i.precio, 0)::float8 as precio_venta,
+        COALESCE(v.precio_promedio_compra, 0)::float8 as precio_compra,
+        v.proveedor,
+        v.familia
+    FROM inventario i
+    FULL OUTER JOIN ventas_30d v ON i.nombre = v.nombre
+    WHERE COALESCE(i.cantidad_disponible, 0) > 0 
+       OR COALESCE(v.cantidad_vendida, 0) > 0
+"""
+
+_INVENTARIO_ORDEN = """
+    ORDER BY COALESCE(v.cantidad_vendida, 0) DESC
+"""
+
+
+# Métricas por producto con las reglas de get_inventario_completo (stock y
+# vendido truncados a entero, valor redondeado por producto, días de cobertura
+# 999 sin venta) para agregar en SQL sin traer la lista de productos.
+_METRICAS_CTE = """
+    WITH base AS ({base}),
+    truncado AS (
+        SELECT
+            base.*,
+            COALESCE(NULLIF(base.familia, ''), 'Sin familia') AS familia_grupo,
+            COALESCE(NULLIF(base.proveedor, ''), 'Sin proveedor') AS proveedor_grupo,
+            TRUNC(stock_actual) AS stock,
+            TRUNC(cantidad_vendida_30d) AS vendida,
+            COALESCE(NULLIF(precio_compra, 0), precio_venta, 0) AS costo_unitario
+        FROM base
+    ),
+    cobertura AS (
+        -- stock / (vendida / 30) en float8, la misma operación que
+        -- _productos_desde_filas: en los cortes de 3/7/60 días stock * 30 / vendida
+        -- redondea distinto y cambiaría el estado
+        SELECT
+            truncado.*,
+            CASE WHEN vendida > 0 THEN stock / (vendida / 30.0) END AS dias_cobertura
+        FROM truncado
+    ),
+    metricas AS (
+        SELECT
+            cobertura.*,
+            ROUND((stock * costo_unitario)::numeric, 2) AS valor,
+            CASE WHEN stock > 0 AND vendida <> 0
+                 THEN ROUND((vendida * 12.0 / stock)::numeric, 1) END AS rotacion,
+            CASE
+                WHEN vendida <= 0 THEN 'exceso'
+                WHEN dias_cobertura <= 3 THEN 'critico'
+                WHEN dias_cobertura <= {minimo} THEN 'bajo'
+                WHEN dias_cobertura <= {maximo} THEN 'normal'
+                ELSE 'exceso'
+            END AS estado
+        FROM cobertura
+    )
+"""
+
+
+# Hasta 10 productos por alerta (críticos y bajos por menor cobertura; exceso y
+# sin movimiento por mayor valor) con el total y el valor de cada grupo. La
+# cobertura redondeada en 0 ordena al final, como en el listado en memoria.
+_ALERTAS_CONSULTA = """
+    , grupos AS (
+        SELECT 'critico' AS grupo, m.* FROM metricas m WHERE estado = 'critico'
+        UNION ALL
+        SELECT 'bajo', m.* FROM metricas m WHERE estado = 'bajo'
+        UNION ALL
+        SELECT 'exceso', m.* FROM metricas m WHERE estado = 'exceso'
+        UNION ALL
+        SELECT 'sin_movimiento', m.* FROM metricas m WHERE vendida = 0 AND stock > 0
+    ),
+    ranking AS (
+        SELECT
+            g.*,
+            COUNT(*) OVER (PARTITION BY grupo) AS total_grupo,
+            SUM(valor) OVER (PARTITION BY grupo) AS valor_grupo,
+            ROW_NUMBER() OVER (
+                PARTITION BY grupo
+                ORDER BY
+                    CASE WHEN grupo IN ('critico', 'bajo')
+                         THEN COALESCE(NULLIF(ROUND(dias_cobertura::numeric, 1), 0), 999)
+                         ELSE -valor
+                    END,
+                    vendida DESC
+            ) AS rn
+        FROM grupos g
+    )
+    SELECT
+        grupo, total_grupo, valor_grupo,
+        nombre, familia, proveedor, stock_actual, cantidad_vendida_30d,
+        precio_venta, precio_compra
+    FROM ranking
+    WHERE rn <= 10
+    ORDER BY grupo, rn
+"""
+
+
+# Datos básicos de un producto
+_PRODUCTO_SQL = text("""
+    SELECT 
+        nombre,
+        cantidad_disponible as stock_actual,
+        precio as precio_venta,
+        familia
+    FROM items
+    WHERE nombre = :nombre
+""")
+
+
+# Historial diario de ventas de un producto, con proveedor
+_PRODUCTO_VENTAS_SQL = text("""
+    SELECT 
+        fecha_venta,
+        SUM(cantidad) as cantidad,
+        SUM(precio * cantidad) as total_venta,
+        AVG(precio) as precio_promedio,
+        AVG(precio_promedio_compra) as costo_promedio,
+        STRING_AGG(DISTINCT vendedor, ', ') as vendedores,
+        MAX(proveedor_moda) as proveedor
+    FROM reportes_ventas_30dias
+    WHERE nombre = :nombre
+    GROUP BY fecha_venta
+    ORDER BY fecha_venta DESC
+""")
+
+
+# Productos sin stock que tuvieron ventas recientes (importes y promedios en float8).
+# Los predicados sobre items coinciden con los índices parciales de la migración 010.
+_AGOTADOS_SQL = text("""
+    WITH ventas_recientes AS (
+        SELECT 
+            nombre,
+            proveedor_moda as proveedor,
+            familia,
+            SUM(cantidad) as cantidad_vendida,
+            COALESCE(SUM(precio * cantidad), 0)::float8 as ingresos,
+            MAX(fecha_venta) as ultima_venta,
+            COALESCE(AVG(precio), 0)::float8 as precio_promedio,
+            AVG(precio_promedio_compra)::float8 as costo_promedio,
+            (SUM(cantidad) / 30.0)::float8 as venta_diaria
+        FROM reportes_ventas_30dias
+        GROUP BY nombre, proveedor_moda, familia
+    ),
+    stock_actual AS (
+        SELECT 
+            nombre,
+            cantidad_disponible as stock
+        FROM items
+        WHERE cantidad_disponible <= 0
+    )
+    SELECT 
+        v.nombre,
+        v.proveedor,
+        v.familia,
+        COALESCE(s.stock, 0) as stock_actual,
+        v.cantidad_vendida,
+        v.ingresos,
+        v.ultima_venta,
+        v.precio_promedio,
+        v.costo_promedio,
+        v.venta_diaria,
+        -- Si se vendió en última semana pero stock = 0, se agotó recientemente
+        CASE 
+            WHEN v.ultima_venta >= CURRENT_DATE - INTERVAL '7 days' THEN 'ultima_semana'
+            WHEN v.ultima_venta >= CURRENT_DATE - INTERVAL '14 days' THEN 'ultimas_2_semanas'
+            ELSE 'mas_antiguo'
+        END as periodo_agotamiento
+    FROM ventas_recientes v
+    LEFT JOIN stock_actual s ON v.nombre = s.nombre
+    WHERE NOT EXISTS (
+            SELECT 1 FROM items i
+            WHERE i.nombre = v.nombre AND i.cantidad_disponible > 0
+        )
+        AND v.cantidad_vendida > 0
+    ORDER BY v.ultima_venta DESC
+""").execution_options(yield_per=1000)
+
+
+# Decimales con que se publica cada métrica de get_inventario_completo
+_DECIMALES_PRODUCTO = {
+    "precio_venta": 2,
+    "precio_compra": 2,
+    "venta_diaria": 2,
+    "dias_cobertura": 1,
+    "rotacion": 1,
+    "valor_inventario": 2,
+    "margen_porcentaje": 1,
+}
+
+
+def redondear_producto(producto: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copia del producto lista para la respuesta: métricas redondeadas y
+    estado_stock como etiqueta con emoji.
+    """
+    publicado = {
+        campo: round(valor, _DECIMALES_PRODUCTO[campo])
+        if valor is not None and campo in _DECIMALES_PRODUCTO
+        else valor
+        for campo, valor in producto.items()
+    }
+    publicado["estado_stock"] = producto["estado_stock"].label
+    return publicado
+
+
 @dataclass
 class ProductoInventario:
     """Modelo de producto con datos de inventario."""
@@ -28,7 +285,7 @@ class ProductoInventario:
     venta_diaria: float
     dias_cobertura: float
     rotacion: Optional[float]
-    estado_stock: str  # Crítico, Bajo, Normal, Exceso
+    estado_stock: EstadoStock
     valor_inventario: float
     margen_porcentaje: Optional[float]
 
@@ -41,116 +298,210 @@ class InventarioService:
     DIAS_STOCK_OBJETIVO = 30  # Días objetivo de stock
     DIAS_STOCK_MAXIMO = 60  # Días máximo antes de considerarlo exceso
     
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, session_factory: Optional[async_sessionmaker] = None):
         self.db = db
+        self.session_factory = session_factory
+        self._inventario: Optional[List[Dict[str, Any]]] = None
+        self._valor_agrupado: Optional[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]] = None
     
     async def get_inventario_completo(self) -> List[Dict[str, Any]]:
-        """Obtiene inventario con todas las métricas calculadas."""
-        
-        # Query para obtener stock actual y ventas de los últimos 30 días
-        query = """
-            WITH ventas_30d AS (
-                SELECT 
-                    nombre,
-                    SUM(cantidad) as cantidad_vendida,
-                    SUM(precio * cantidad) as total_ventas,
-                    AVG(precio) as precio_promedio_venta,
-                    AVG(precio_promedio_compra) as precio_promedio_compra,
-                    MAX(proveedor_moda) as proveedor,
-                    MAX(familia) as familia
-                FROM reportes_ventas_30dias
-                GROUP BY nombre
-            ),
-            inventario AS (
-                SELECT 
-                    nombre,
-                    cantidad_disponible,
-                    precio
-                FROM items
-            )
-            SELECT 
-                COALESCE(i.nombre, v.nombre) as nombre,
-                COALESCE(i.cantidad_disponible, 0) as stock_actual,
-                COALESCE(v.cantidad_vendida, 0) as cantidad_vendida_30d,
-                COALESCE(v.total_ventas, 0) as total_ventas_30d,
-                COALESCE(v.precio_promedio_venta, i.precio) as precio_venta,
-                v.precio_promedio_compra as precio_compra,
-                v.proveedor,
-                v.familia
-            FROM inventario i
-            FULL OUTER JOIN ventas_30d v ON i.nombre = v.nombre
-            WHERE COALESCE(i.cantidad_disponible, 0) > 0 
-               OR COALESCE(v.cantidad_vendida, 0) > 0
-            ORDER BY COALESCE(v.cantidad_vendida, 0) DESC
         """
+        Obtiene inventario con todas las métricas calculadas.
+
+        Se calcula una vez por instancia y se comparte entre requests con un
+        cache TTL de 60s; la lista devuelta no debe mutarse. Las métricas van
+        sin redondear y estado_stock es un EstadoStock: usar redondear_producto
+        al armar la respuesta.
+        """
+        if self._inventario is None:
+            clave = f"inventario_completo:{date.today()}"
+            productos = get_cached(INVENTARIO_COMPLETO_CACHE, clave)
+            if productos is None:
+                productos = await self._calcular_inventario_completo()
+                set_cached(INVENTARIO_COMPLETO_CACHE, clave, productos)
+            self._inventario = productos
+        return self._inventario
+
+    async def get_productos_por_proveedor(self) -> Dict[Optional[str], List[Dict[str, Any]]]:
+        """
+        Índice proveedor -> productos de get_inventario_completo, para no
+        recorrer todo el catálogo en cada consulta por proveedor. Se guarda en el
+        mismo cache TTL junto a la lista de la que se construyó.
+        """
+        productos = await self.get_inventario_completo()
+        clave = f"inventario_por_proveedor:{date.today()}"
+        cached = get_cached(INVENTARIO_COMPLETO_CACHE, clave)
+        if cached is not None and cached[0] is productos:
+            return cached[1]
+        indice: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        for p in productos:
+            indice.setdefault(p.get("proveedor"), []).append(p)
+        set_cached(INVENTARIO_COMPLETO_CACHE, clave, (productos, indice))
+        return indice
+
+    def invalidate_inventario(self) -> None:
+        """Descarta el inventario memorizado (llamar tras escribir en items)."""
+        self._inventario = None
+        self._valor_agrupado = None
+        INVENTARIO_COMPLETO_CACHE.clear()
+
+    async def _calcular_inventario_completo(self) -> List[Dict[str, Any]]:
+        """Ejecuta la consulta de inventario y calcula las métricas por producto."""
         
-        result = await self.db.execute(text(query))
-        rows = result.fetchall()
-        
-        productos = []
-        for row in rows:
-            row_dict = row._asdict()
-            
-            stock_actual = int(row_dict["stock_actual"] or 0)
-            cantidad_vendida = int(row_dict["cantidad_vendida_30d"] or 0)
-            precio_venta = float(row_dict["precio_venta"] or 0)
-            precio_compra = float(row_dict["precio_compra"]) if row_dict["precio_compra"] else None
-            
-            # Calcular métricas
-            venta_diaria = cantidad_vendida / 30 if cantidad_vendida > 0 else 0
-            dias_cobertura = stock_actual / venta_diaria if venta_diaria > 0 else 999
-            
-            # Rotación anual = (Ventas anualizadas) / Stock promedio
-            ventas_anualizadas = cantidad_vendida * 12
-            rotacion = ventas_anualizadas / stock_actual if stock_actual > 0 else None
-            
-            # Estado del stock
-            if dias_cobertura <= 3:
-                estado_stock = "🔴 Crítico"
-            elif dias_cobertura <= self.DIAS_STOCK_MINIMO:
-                estado_stock = "🟠 Bajo"
-            elif dias_cobertura <= self.DIAS_STOCK_MAXIMO:
-                estado_stock = "🟢 Normal"
-            else:
-                estado_stock = "🔵 Exceso"
-            
-            # Stock mínimo y máximo calculados
-            stock_minimo = int(venta_diaria * self.DIAS_STOCK_MINIMO)
-            stock_maximo = int(venta_diaria * self.DIAS_STOCK_MAXIMO)
-            
-            # Valor del inventario
-            valor_inventario = stock_actual * (precio_compra or precio_venta)
-            
-            # Margen
-            margen_porcentaje = None
-            if precio_compra and precio_venta > 0:
-                margen_porcentaje = ((precio_venta - precio_compra) / precio_venta) * 100
-            
-            productos.append({
-                "nombre": row_dict["nombre"],
-                "familia": row_dict["familia"],
-                "proveedor": row_dict["proveedor"],
-                "stock_actual": stock_actual,
-                "stock_minimo": stock_minimo,
-                "stock_maximo": stock_maximo,
-                "precio_venta": round(precio_venta, 2),
-                "precio_compra": round(precio_compra, 2) if precio_compra else None,
-                "venta_diaria": round(venta_diaria, 2),
-                "dias_cobertura": round(dias_cobertura, 1) if dias_cobertura < 999 else None,
-                "rotacion": round(rotacion, 1) if rotacion else None,
-                "estado_stock": estado_stock,
-                "valor_inventario": round(valor_inventario, 2),
-                "margen_porcentaje": round(margen_porcentaje, 1) if margen_porcentaje else None,
-                "cantidad_vendida_30d": cantidad_vendida,
-            })
-        
-        return productos
+        # Query para obtener stock actual y ventas de los últimos 30 días
+        # Cursor de servidor: las filas llegan por lotes en vez de materializar todo
+        result = await self._execute_ventas_30d(
+            lambda ventas_30d: _INVENTARIO_BASE.format(ventas_30d=ventas_30d) + _INVENTARIO_ORDEN,
+            stream=True,
+        )
+        return self._productos_desde_filas([row._mapping async for row in result])
+
+    def _productos_desde_filas(self, filas: List[Any]) -> List[Dict[str, Any]]:
+        """Métricas por producto a partir de filas con las columnas de _INVENTARIO_BASE."""
+        n = len(filas)
+        if not n:
+            return []
+
+        def columna(campo: str) -> np.ndarray:
+            return np.fromiter((f[campo] for f in filas), dtype=float, count=n)
+
+        # Métricas por columna; 0 en precio_compra equivale a "sin precio de compra"
+        stock = np.trunc(columna("stock_actual"))
+        vendida = np.trunc(columna("cantidad_vendida_30d"))
+        precio_venta = columna("precio_venta")
+        precio_compra = columna("precio_compra")
+        con_compra = precio_compra != 0
+
+        venta_diaria = np.where(vendida > 0, vendida / 30, 0.0)
+        dias_cobertura = np.divide(
+            stock, venta_diaria, out=np.full(n, 999.0), where=venta_diaria > 0
+        )
+
+        # Rotación anual = (Ventas anualizadas) / Stock promedio
+        rotacion = np.divide(vendida * 12, stock, out=np.zeros(n), where=stock > 0)
+
+        estados = tuple(EstadoStock)
+        estado_stock = [
+            estados[codigo]
+            for codigo in np.select(
+                [
+                    dias_cobertura <= 3,
+                    dias_cobertura <= self.DIAS_STOCK_MINIMO,
+                    dias_cobertura <= self.DIAS_STOCK_MAXIMO,
+                ],
+                [EstadoStock.CRITICO, EstadoStock.BAJO, EstadoStock.NORMAL],
+                EstadoStock.EXCESO,
+            ).tolist()
+        ]
+
+        # Stock mínimo y máximo calculados
+        stock_minimo = (venta_diaria * self.DIAS_STOCK_MINIMO).astype(np.int64).tolist()
+        stock_maximo = (venta_diaria * self.DIAS_STOCK_MAXIMO).astype(np.int64).tolist()
+
+        # Valor del inventario
+        valor_inventario = stock * np.where(con_compra, precio_compra, precio_venta)
+
+        # Margen
+        margen = np.divide(
+            (precio_venta - precio_compra) * 100,
+            precio_venta,
+            out=np.zeros(n),
+            where=con_compra & (precio_venta > 0),
+        )
+
+        # Los ceros de rotación/margen y la cobertura ≥ 999 se reportan como
+        # None, igual que en el cálculo fila a fila. Los floats se guardan sin
+        # redondear; redondear_producto los formatea al publicar la respuesta.
+        precio_compra_l = precio_compra.tolist()
+        rotacion_l = rotacion.tolist()
+        margen_l = margen.tolist()
+        dias_l = dias_cobertura.tolist()
+        con_compra_l = con_compra.tolist()
+        rotacion_ok = (rotacion != 0).tolist()
+        margen_ok = (margen != 0).tolist()
+        dias_ok = (dias_cobertura < 999).tolist()
+        stock_l = stock.astype(np.int64).tolist()
+        vendida_l = vendida.astype(np.int64).tolist()
+        precio_venta_l = precio_venta.tolist()
+        venta_diaria_l = venta_diaria.tolist()
+        valor_l = valor_inventario.tolist()
+
+        return [
+            {
+                "nombre": f["nombre"],
+                "familia": f["familia"],
+                "proveedor": f["proveedor"],
+                "stock_actual": stock_l[i],
+                "stock_minimo": stock_minimo[i],
+                "stock_maximo": stock_maximo[i],
+                "precio_venta": precio_venta_l[i],
+                "precio_compra": precio_compra_l[i] if con_compra_l[i] else None,
+                "venta_diaria": venta_diaria_l[i],
+                "dias_cobertura": dias_l[i] if dias_ok[i] else None,
+                "rotacion": rotacion_l[i] if rotacion_ok[i] else None,
+                "estado_stock": estado_stock[i],
+                "valor_inventario": valor_l[i],
+                "margen_porcentaje": margen_l[i] if margen_ok[i] else None,
+                "cantidad_vendida_30d": vendida_l[i],
+            }
+            for i, f in enumerate(filas)
+        ]
     
+    def _metricas_sql(self, consulta: str) -> Callable[[str], str]:
+        """Arma la consulta sobre _METRICAS_CTE para una fuente de ventas_30d dada."""
+        def armar(ventas_30d: str) -> str:
+            return _METRICAS_CTE.format(
+                base=_INVENTARIO_BASE.format(ventas_30d=ventas_30d),
+                minimo=self.DIAS_STOCK_MINIMO,
+                maximo=self.DIAS_STOCK_MAXIMO,
+            ) + consulta
+        return armar
+
+    async def _execute_ventas_30d(self, armar: Callable[[str], str], stream: bool = False) -> Any:
+        """
+        Ejecuta una consulta de inventario leyendo ventas_30d de la vista
+        materializada; si la base no la tiene, la agrupa al vuelo.
+
+        Con ``stream`` usa un cursor de servidor (AsyncResult por lotes).
+        """
+        global _ventas_30d_mv_disponible
+        if _ventas_30d_mv_disponible is None:
+            # Base sin la migración 009: se prueba una vez, sin consultar la vista
+            _ventas_30d_mv_disponible = await relacion_existe(self.db, "mv_ventas_30d_por_producto")
+        ventas_30d = _VENTAS_30D_MV if _ventas_30d_mv_disponible else _VENTAS_30D_AGRUPADAS
+        if stream:
+            return await self.db.stream(text(armar(ventas_30d)).execution_options(yield_per=1000))
+        return await self.db.execute(text(armar(ventas_30d)))
+
+    async def refrescar_ventas_por_producto(self) -> None:
+        """Recalcula mv_ventas_30d_por_producto sin bloquear lecturas (lo programa app.main)."""
+        global _ventas_30d_mv_disponible
+        _ventas_30d_mv_disponible = await relacion_existe(self.db, "mv_ventas_30d_por_producto")
+        if not _ventas_30d_mv_disponible:
+            return
+        await self.db.execute(_REFRESCAR_VENTAS_30D_SQL)
+        await self.db.commit()
+        self.invalidate_inventario()
+
     async def get_resumen_inventario(self) -> Dict[str, Any]:
-        """Obtiene resumen ejecutivo del inventario."""
-        productos = await self.get_inventario_completo()
-        
-        if not productos:
+        """Obtiene resumen ejecutivo del inventario (agregado en SQL)."""
+        query = self._metricas_sql("""
+            SELECT
+                COUNT(*) AS total_productos,
+                SUM(stock) AS total_unidades,
+                SUM(valor) AS valor_total,
+                COUNT(*) FILTER (WHERE estado = 'critico') AS criticos,
+                COUNT(*) FILTER (WHERE estado = 'bajo') AS bajos,
+                COUNT(*) FILTER (WHERE estado = 'normal') AS normales,
+                COUNT(*) FILTER (WHERE estado = 'exceso') AS exceso,
+                AVG(rotacion) AS rotacion_promedio,
+                SUM(valor) FILTER (WHERE estado = 'critico') AS valor_criticos,
+                SUM(valor) FILTER (WHERE estado = 'exceso') AS valor_exceso
+            FROM metricas
+        """)
+        r = (await self._execute_ventas_30d(query)).fetchone()
+        
+        if not r or not r.total_productos:
             return {
                 "total_productos": 0,
                 "total_unidades": 0,
@@ -162,96 +513,91 @@ class InventarioService:
                 "rotacion_promedio": 0,
             }
         
-        total_unidades = sum(p["stock_actual"] for p in productos)
-        valor_total = sum(p["valor_inventario"] for p in productos)
-        
-        criticos = [p for p in productos if p["estado_stock"] == "🔴 Crítico"]
-        bajos = [p for p in productos if p["estado_stock"] == "🟠 Bajo"]
-        normales = [p for p in productos if p["estado_stock"] == "🟢 Normal"]
-        exceso = [p for p in productos if p["estado_stock"] == "🔵 Exceso"]
-        
-        rotaciones = [p["rotacion"] for p in productos if p["rotacion"] is not None]
-        rotacion_promedio = sum(rotaciones) / len(rotaciones) if rotaciones else 0
-        
         return {
-            "total_productos": len(productos),
-            "total_unidades": total_unidades,
-            "valor_total": round(valor_total, 2),
-            "productos_criticos": len(criticos),
-            "productos_bajos": len(bajos),
-            "productos_normales": len(normales),
-            "productos_exceso": len(exceso),
-            "rotacion_promedio": round(rotacion_promedio, 1),
-            "valor_criticos": round(sum(p["valor_inventario"] for p in criticos), 2),
-            "valor_exceso": round(sum(p["valor_inventario"] for p in exceso), 2),
+            "total_productos": int(r.total_productos),
+            "total_unidades": int(r.total_unidades or 0),
+            "valor_total": round(float(r.valor_total or 0), 2),
+            "productos_criticos": int(r.criticos),
+            "productos_bajos": int(r.bajos),
+            "productos_normales": int(r.normales),
+            "productos_exceso": int(r.exceso),
+            "rotacion_promedio": round(float(r.rotacion_promedio or 0), 1),
+            "valor_criticos": round(float(r.valor_criticos or 0), 2),
+            "valor_exceso": round(float(r.valor_exceso or 0), 2),
         }
 
     async def get_stockout_rate(self) -> Dict[str, Any]:
         """% de SKU con venta en 30d que están sin stock (aprox. stockout rate)."""
         productos = await self.get_inventario_completo()
-        activos = [
-            p
-            for p in productos
-            if float(p.get("cantidad_vendida_30d") or 0) > 0
-        ]
+        activos = sin_stock = 0
+        for p in productos:
+            if float(p.get("cantidad_vendida_30d") or 0) > 0:
+                activos += 1
+                if float(p.get("stock_actual") or 0) <= 0:
+                    sin_stock += 1
         if not activos:
             return {"stockout_pct": 0.0, "activos": 0, "sin_stock": 0}
-        sin_stock = len([p for p in activos if float(p.get("stock_actual") or 0) <= 0])
         return {
-            "stockout_pct": round(sin_stock / len(activos) * 100, 1),
-            "activos": len(activos),
+            "stockout_pct": round(sin_stock / activos * 100, 1),
+            "activos": activos,
             "sin_stock": sin_stock,
         }
     
     async def get_alertas_inventario(self) -> List[Dict[str, Any]]:
-        """Obtiene alertas de inventario priorizadas."""
-        productos = await self.get_inventario_completo()
+        """Obtiene alertas de inventario priorizadas (selección y conteo en SQL)."""
+        result = await self._execute_ventas_30d(self._metricas_sql(_ALERTAS_CONSULTA))
+        filas = [row._mapping for row in result.fetchall()]
+        grupos: Dict[str, Dict[str, Any]] = {}
+        for f, producto in zip(filas, self._productos_desde_filas(filas)):
+            grupo = grupos.setdefault(
+                f["grupo"],
+                {"total": int(f["total_grupo"]), "valor": float(f["valor_grupo"] or 0), "datos": []},
+            )
+            grupo["datos"].append(redondear_producto(producto))
         alertas = []
         
         # Productos críticos (< 3 días)
-        criticos = [p for p in productos if p["estado_stock"] == "🔴 Crítico"]
+        criticos = grupos.get("critico")
         if criticos:
             alertas.append({
                 "tipo": "error",
                 "icono": "🚨",
-                "titulo": f"{len(criticos)} productos con stock crítico",
+                "titulo": f"{criticos['total']} productos con stock crítico",
                 "detalle": "Menos de 3 días de cobertura. ¡Compra urgente requerida!",
-                "datos": sorted(criticos, key=lambda x: x.get("dias_cobertura") or 999)[:10],
+                "datos": criticos["datos"],
             })
         
         # Productos con stock bajo (< 7 días)
-        bajos = [p for p in productos if p["estado_stock"] == "🟠 Bajo"]
+        bajos = grupos.get("bajo")
         if bajos:
             alertas.append({
                 "tipo": "warning",
                 "icono": "⚠️",
-                "titulo": f"{len(bajos)} productos con stock bajo",
+                "titulo": f"{bajos['total']} productos con stock bajo",
                 "detalle": "Menos de 7 días de cobertura. Planificar compra.",
-                "datos": sorted(bajos, key=lambda x: x.get("dias_cobertura") or 999)[:10],
+                "datos": bajos["datos"],
             })
         
         # Productos con exceso de stock
-        exceso = [p for p in productos if p["estado_stock"] == "🔵 Exceso"]
+        exceso = grupos.get("exceso")
         if exceso:
-            valor_exceso = sum(p["valor_inventario"] for p in exceso)
             alertas.append({
                 "tipo": "info",
                 "icono": "📦",
-                "titulo": f"{len(exceso)} productos con exceso de stock",
-                "detalle": f"Capital inmovilizado: ${valor_exceso:,.0f}",
-                "datos": sorted(exceso, key=lambda x: x["valor_inventario"], reverse=True)[:10],
+                "titulo": f"{exceso['total']} productos con exceso de stock",
+                "detalle": f"Capital inmovilizado: ${exceso['valor']:,.0f}",
+                "datos": exceso["datos"],
             })
         
         # Productos sin movimiento (ventas = 0 pero hay stock)
-        sin_movimiento = [p for p in productos if p["cantidad_vendida_30d"] == 0 and p["stock_actual"] > 0]
+        sin_movimiento = grupos.get("sin_movimiento")
         if sin_movimiento:
-            valor_muerto = sum(p["valor_inventario"] for p in sin_movimiento)
             alertas.append({
                 "tipo": "warning",
                 "icono": "💤",
-                "titulo": f"{len(sin_movimiento)} productos sin movimiento",
-                "detalle": f"Sin ventas en 30 días. Inventario muerto: ${valor_muerto:,.0f}",
-                "datos": sorted(sin_movimiento, key=lambda x: x["valor_inventario"], reverse=True)[:10],
+                "titulo": f"{sin_movimiento['total']} productos sin movimiento",
+                "detalle": f"Sin ventas en 30 días. Inventario muerto: ${sin_movimiento['valor']:,.0f}",
+                "datos": sin_movimiento["datos"],
             })
         
         return alertas
@@ -260,61 +606,27 @@ class InventarioService:
         """Obtiene detalle completo de un producto."""
         
         # Datos básicos del producto
-        producto_query = """
-            SELECT 
-                nombre,
-                cantidad_disponible as stock_actual,
-                precio as precio_venta,
-                familia
-            FROM items
-            WHERE nombre = :nombre
-        """
-        
-        result = await self.db.execute(text(producto_query), {"nombre": nombre})
+        result = await self.db.execute(_PRODUCTO_SQL, {"nombre": nombre})
         producto_row = result.fetchone()
         
         if not producto_row:
             return None
         
         producto = producto_row._asdict()
-        
-        # Historial de ventas (últimos 90 días) con proveedor
-        ventas_query = """
-            SELECT 
-                fecha_venta,
-                SUM(cantidad) as cantidad,
-                SUM(precio * cantidad) as total_venta,
-                AVG(precio) as precio_promedio,
-                AVG(precio_promedio_compra) as costo_promedio,
-                STRING_AGG(DISTINCT vendedor, ', ') as vendedores,
-                MAX(proveedor_moda) as proveedor
-            FROM reportes_ventas_30dias
-            WHERE nombre = :nombre
-            GROUP BY fecha_venta
-            ORDER BY fecha_venta DESC
-        """
-        
-        result = await self.db.execute(text(ventas_query), {"nombre": nombre})
-        ventas = [dict(row._asdict()) for row in result.fetchall()]
-
-        # Proveedor principal (el mas frecuente en ventas)
-        proveedor = ventas[0].get("proveedor") if ventas else None
 
         hoy = date.today()
         filtros = FilterParams(fecha_inicio=hoy - timedelta(days=30), fecha_fin=hoy)
 
-        # Clasificacion ABC (usando ultimos 30 dias)
-        clasificacion_abc = None
-        try:
-            ventas_svc = VentasService(self.db)
-            abc_svc = ABCService(ventas_svc)
-            abc_result = await abc_svc.get_analisis_abc(filtros)
-            for p in abc_result.get("productos", []):
-                if p.get("nombre") == nombre:
-                    clasificacion_abc = p.get("categoria")
-                    break
-        except Exception:
-            pass
+        # Historial de ventas (últimos 90 días), clasificación ABC y sugerencia
+        # de compra son independientes: con session_factory corren en paralelo
+        ventas, clasificacion_abc, sugerencia_compra = await self._reunir(
+            lambda db: self._historial_ventas(db, nombre),
+            lambda db: self._clasificacion_abc(db, nombre, filtros),
+            lambda db: self._sugerencia_compra(db, nombre, filtros),
+        )
+
+        # Proveedor principal (el mas frecuente en ventas)
+        proveedor = ventas[0].get("proveedor") if ventas else None
 
         # Calcular métricas
         total_vendido = sum(v["cantidad"] for v in ventas)
@@ -341,24 +653,6 @@ class InventarioService:
             dias_cob = stock_actual / venta_diaria if venta_diaria else 0
             fill_rate_estimado = round(min(1.0, dias_cob / 30) * 100, 1) if dias_cob else 0
 
-        # Sugerencia de compra si aplica
-        sugerencia_compra = None
-        try:
-            ventas_svc = VentasService(self.db)
-            compras_svc = ComprasService(self.db, ventas_svc)
-            sugerencias = await compras_svc.get_sugerencias(filtros)
-            for s in sugerencias:
-                if s.nombre == nombre:
-                    sugerencia_compra = {
-                        "cantidad_sugerida": s.cantidad_sugerida,
-                        "costo_estimado": s.costo_estimado,
-                        "prioridad": s.prioridad,
-                        "dias_stock": s.dias_stock,
-                    }
-                    break
-        except Exception:
-            pass
-        
         return {
             "nombre": nombre,
             "familia": producto.get("familia"),
@@ -381,124 +675,153 @@ class InventarioService:
             "sugerencia_compra": sugerencia_compra,
         }
     
+    async def _reunir(self, *fns: Callable[[AsyncSession], Awaitable[Any]]) -> List[Any]:
+        """
+        Ejecuta bloques de consulta independientes. Con session_factory (de solo
+        lectura) cada bloque usa su propia sesión y corren en paralelo; una
+        AsyncSession no admite uso concurrente, así que sin factory van en serie.
+        """
+        if self.session_factory is None:
+            return [await fn(self.db) for fn in fns]
+
+        async def en_sesion(fn: Callable[[AsyncSession], Awaitable[Any]]) -> Any:
+            async with self.session_factory() as s:
+                return await fn(s)
+
+        return list(await asyncio.gather(*(en_sesion(fn) for fn in fns)))
+
+    @staticmethod
+    async def _historial_ventas(db: AsyncSession, nombre: str) -> List[Dict[str, Any]]:
+        result = await db.execute(_PRODUCTO_VENTAS_SQL, {"nombre": nombre})
+        return [dict(row._asdict()) for row in result.fetchall()]
+
+    @staticmethod
+    async def _clasificacion_abc(db: AsyncSession, nombre: str, filtros: FilterParams) -> Optional[str]:
+        """Clasificación ABC de los últimos 30 días; None si no se puede calcular."""
+        try:
+            return await ABCService(VentasService(db)).get_clasificacion_abc_producto(nombre, filtros)
+        except Exception:
+            return None
+
+    @staticmethod
+    async def _sugerencia_compra(db: AsyncSession, nombre: str, filtros: FilterParams) -> Optional[Dict[str, Any]]:
+        """Sugerencia de compra si aplica; None si no hay o falla el cálculo."""
+        try:
+            s = await ComprasService(db, VentasService(db)).get_sugerencia_producto(nombre, filtros)
+        except Exception:
+            return None
+        if s is None:
+            return None
+        return {
+            "cantidad_sugerida": s.cantidad_sugerida,
+            "costo_estimado": s.costo_estimado,
+            "prioridad": s.prioridad.label,
+            "dias_stock": s.dias_stock,
+        }
+
+    async def get_valor_por_dimensiones(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Valor del inventario por familia y por proveedor en una sola consulta
+        (GROUPING SETS). Se memoriza en la instancia.
+        """
+        if self._valor_agrupado is None:
+            query = self._metricas_sql("""
+                SELECT
+                    GROUPING(familia_grupo) = 1 AS por_proveedor,
+                    familia_grupo AS familia,
+                    proveedor_grupo AS proveedor,
+                    COUNT(*) AS productos,
+                    SUM(stock) AS unidades,
+                    SUM(valor) AS valor,
+                    COUNT(*) FILTER (WHERE estado = 'critico') AS criticos,
+                    COUNT(*) FILTER (WHERE estado = 'bajo') AS bajos
+                FROM metricas
+                GROUP BY GROUPING SETS ((familia_grupo), (proveedor_grupo))
+                ORDER BY valor DESC, familia_grupo, proveedor_grupo
+            """)
+            result = await self._execute_ventas_30d(query)
+            familias: List[Dict[str, Any]] = []
+            proveedores: List[Dict[str, Any]] = []
+            for r in result.fetchall():
+                if r.por_proveedor:
+                    proveedores.append({
+                        "proveedor": r.proveedor,
+                        "productos": int(r.productos),
+                        "unidades": int(r.unidades or 0),
+                        "valor": float(r.valor or 0),
+                        "criticos": int(r.criticos),
+                    })
+                else:
+                    familias.append({
+                        "familia": r.familia,
+                        "productos": int(r.productos),
+                        "unidades": int(r.unidades or 0),
+                        "valor": float(r.valor or 0),
+                        "criticos": int(r.criticos),
+                        "bajos": int(r.bajos),
+                    })
+            self._valor_agrupado = (familias, proveedores)
+        return self._valor_agrupado
+
+    async def get_alertas_por_proveedor(self) -> Dict[Optional[str], Dict[str, int]]:
+        """
+        Productos críticos y bajos por proveedor (agregado en SQL, con la misma
+        clave de proveedor que get_productos_por_proveedor). Los proveedores sin
+        alertas no aparecen.
+        """
+        query = self._metricas_sql("""
+            SELECT
+                proveedor,
+                COUNT(*) FILTER (WHERE estado = 'critico') AS criticos,
+                COUNT(*) FILTER (WHERE estado = 'bajo') AS bajos
+            FROM metricas
+            WHERE estado IN ('critico', 'bajo')
+            GROUP BY proveedor
+        """)
+        result = await self._execute_ventas_30d(query)
+        return {
+            r.proveedor: {"criticos": int(r.criticos), "bajos": int(r.bajos)}
+            for r in result.fetchall()
+        }
+
     async def get_valor_por_familia(self) -> List[Dict[str, Any]]:
         """Obtiene valor del inventario agrupado por familia."""
-        productos = await self.get_inventario_completo()
-        
-        familias = {}
-        for p in productos:
-            familia = p["familia"] or "Sin familia"
-            if familia not in familias:
-                familias[familia] = {
-                    "familia": familia,
-                    "productos": 0,
-                    "unidades": 0,
-                    "valor": 0,
-                    "criticos": 0,
-                    "bajos": 0,
-                }
-            familias[familia]["productos"] += 1
-            familias[familia]["unidades"] += p["stock_actual"]
-            familias[familia]["valor"] += p["valor_inventario"]
-            if p["estado_stock"] == "🔴 Crítico":
-                familias[familia]["criticos"] += 1
-            elif p["estado_stock"] == "🟠 Bajo":
-                familias[familia]["bajos"] += 1
-        
-        return sorted(familias.values(), key=lambda x: x["valor"], reverse=True)
+        familias, _ = await self.get_valor_por_dimensiones()
+        return familias
     
     async def get_valor_por_proveedor(self) -> List[Dict[str, Any]]:
         """Obtiene valor del inventario agrupado por proveedor."""
-        productos = await self.get_inventario_completo()
-        
-        proveedores = {}
-        for p in productos:
-            prov = p["proveedor"] or "Sin proveedor"
-            if prov not in proveedores:
-                proveedores[prov] = {
-                    "proveedor": prov,
-                    "productos": 0,
-                    "unidades": 0,
-                    "valor": 0,
-                    "criticos": 0,
-                }
-            proveedores[prov]["productos"] += 1
-            proveedores[prov]["unidades"] += p["stock_actual"]
-            proveedores[prov]["valor"] += p["valor_inventario"]
-            if p["estado_stock"] == "🔴 Crítico":
-                proveedores[prov]["criticos"] += 1
-        
-        return sorted(proveedores.values(), key=lambda x: x["valor"], reverse=True)
+        _, proveedores = await self.get_valor_por_dimensiones()
+        return proveedores
     
     async def get_productos_agotados(self) -> Dict[str, Any]:
         """Obtiene productos que se agotaron en la última semana y últimas 2 semanas."""
         
         # Productos con stock 0 que tuvieron ventas recientes
-        query = """
-            WITH ventas_recientes AS (
-                SELECT 
-                    nombre,
-                    proveedor_moda as proveedor,
-                    familia,
-                    SUM(cantidad) as cantidad_vendida,
-                    SUM(precio * cantidad) as ingresos,
-                    MAX(fecha_venta) as ultima_venta,
-                    AVG(precio) as precio_promedio,
-                    AVG(precio_promedio_compra) as costo_promedio,
-                    SUM(cantidad) / 30.0 as venta_diaria
-                FROM reportes_ventas_30dias
-                GROUP BY nombre, proveedor_moda, familia
-            ),
-            stock_actual AS (
-                SELECT 
-                    nombre,
-                    cantidad_disponible as stock
-                FROM items
-            )
-            SELECT 
-                v.nombre,
-                v.proveedor,
-                v.familia,
-                COALESCE(s.stock, 0) as stock_actual,
-                v.cantidad_vendida,
-                v.ingresos,
-                v.ultima_venta,
-                v.precio_promedio,
-                v.costo_promedio,
-                v.venta_diaria,
-                -- Si se vendió en última semana pero stock = 0, se agotó recientemente
-                CASE 
-                    WHEN v.ultima_venta >= CURRENT_DATE - INTERVAL '7 days' THEN 'ultima_semana'
-                    WHEN v.ultima_venta >= CURRENT_DATE - INTERVAL '14 days' THEN 'ultimas_2_semanas'
-                    ELSE 'mas_antiguo'
-                END as periodo_agotamiento
-            FROM ventas_recientes v
-            LEFT JOIN stock_actual s ON v.nombre = s.nombre
-            WHERE COALESCE(s.stock, 0) <= 0
-                AND v.cantidad_vendida > 0
-            ORDER BY v.ultima_venta DESC
-        """
-        
-        result = await self.db.execute(text(query))
-        rows = result.fetchall()
+        result = await self.db.stream(_AGOTADOS_SQL)
+        rows = [row async for row in result]
         
         agotados_semana = []
         agotados_2_semanas = []
+
+        venta_diaria = np.fromiter((r.venta_diaria for r in rows), dtype=float, count=len(rows))
+        venta_diaria_r = np.round(venta_diaria, 2).tolist()
+        sugerida = np.maximum(1, (venta_diaria * 15).astype(np.int64)).tolist()  # 15 días de stock
         
-        for row in rows:
-            row_dict = row._asdict()
+        for i, row in enumerate(rows):
+            row_dict = row._mapping
             producto = {
                 "nombre": row_dict["nombre"],
                 "proveedor": row_dict["proveedor"],
                 "familia": row_dict["familia"],
                 "stock_actual": row_dict["stock_actual"],
                 "cantidad_vendida_30d": row_dict["cantidad_vendida"],
-                "ingresos_perdidos": float(row_dict["ingresos"] or 0),
+                "ingresos_perdidos": row_dict["ingresos"],
                 "ultima_venta": str(row_dict["ultima_venta"]) if row_dict["ultima_venta"] else None,
-                "precio_promedio": float(row_dict["precio_promedio"] or 0),
-                "costo_promedio": float(row_dict["costo_promedio"]) if row_dict["costo_promedio"] else None,
-                "venta_diaria": round(float(row_dict["venta_diaria"] or 0), 2),
-                "cantidad_sugerida": max(1, int(float(row_dict["venta_diaria"] or 0) * 15)),  # 15 días de stock
+                "precio_promedio": row_dict["precio_promedio"],
+                "costo_promedio": row_dict["costo_promedio"] or None,
+                "venta_diaria": venta_diaria_r[i],
+                "cantidad_sugerida": sugerida[i],
             }
             
             if row_dict["periodo_agotamiento"] == "ultima_semana":
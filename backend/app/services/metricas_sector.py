@@ -1,6 +1,7 @@
 """Métricas retail estándar usando únicamente las tablas actuales."""
 from __future__ import annotations
 
+import heapq
 import math
 from datetime import date, timedelta
 from typing import Any, Dict, List, Optional, Tuple
@@ -8,7 +9,8 @@ from typing import Any, Dict, List, Optional, Tuple
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.schemas import FilterParams, SectorMetric
+from app.database import QueryPipeline
+from app.models.schemas import EstadoStock, FilterParams, SectorMetric
 from app.services.facturas_proveedor import FacturasProveedorService
 from app.services.predicciones import PrediccionesService
 from app.services.ventas import VentasService
@@ -179,10 +181,11 @@ class MetricasSectorService:
             params["familias"] = filters.familias
         if filters.proveedores:
             where += """
-                AND f.nombre IN (
-                    SELECT DISTINCT nombre
-                    FROM reportes_ventas_30dias
-                    WHERE proveedor_moda = ANY(:proveedores)
+                AND EXISTS (
+                    SELECT 1
+                    FROM reportes_ventas_30dias r
+                    WHERE r.nombre = f.nombre
+                      AND r.proveedor_moda = ANY(:proveedores)
                 )
             """
             params["proveedores"] = filters.proveedores
@@ -210,7 +213,7 @@ class MetricasSectorService:
         where, params = self._facturas_where(filters, inicio, fin)
         cte = self._facturas_cte_sql(extra_select).format(where=where)
         rows = await self._execute(f"{cte} SELECT * FROM facturas_agrupadas", params)
-        return [dict(r._asdict()) for r in rows]
+        return [dict(r._mapping) for r in rows]
 
     def _bucket_series(
         self,
@@ -238,10 +241,13 @@ class MetricasSectorService:
             out.append(res)
         return out
 
-    async def _resumen_temporal(self, filters: FilterParams) -> Dict[str, Any]:
+    async def _resumen_temporal(
+        self, filters: FilterParams, invoices: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
         _, fin = self._periodo(filters)
-        inicio_ext = fin - timedelta(days=59)
-        invoices = await self._fetch_facturas_agrupadas(filters, inicio_ext, fin)
+        if invoices is None:
+            inicio_ext = fin - timedelta(days=59)
+            invoices = await self._fetch_facturas_agrupadas(filters, inicio_ext, fin)
 
         hoy = fin
         ayer = fin - timedelta(days=1)
@@ -270,19 +276,16 @@ class MetricasSectorService:
             },
         }
 
-    async def _precio_promedio_linea(self, filters: FilterParams) -> float:
+    def _precio_promedio_linea_sql(self, filters: FilterParams) -> Tuple[str, Dict[str, Any]]:
         where, params = self._facturas_where(filters)
-        rows = await self._execute(
+        return (
             f"SELECT AVG(f.precio) AS avg_precio FROM facturas f LEFT JOIN items i ON i.nombre = f.nombre {where}",
             params,
         )
-        if not rows:
-            return 0.0
-        return round(float(rows[0]._asdict().get("avg_precio") or 0), 2)
 
-    async def _compras_por_proveedor_total(self, filters: FilterParams) -> float:
+    def _compras_por_proveedor_sql(self, filters: FilterParams) -> Tuple[str, Dict[str, Any]]:
         inicio, fin = self._periodo(filters)
-        rows = await self._execute(
+        return (
             """
             SELECT COALESCE(SUM(precio * COALESCE(cantidad, 1)), 0) AS total
             FROM facturas_proveedor
@@ -290,18 +293,54 @@ class MetricasSectorService:
             """,
             {"fecha_inicio": inicio, "fecha_fin": fin},
         )
+
+    async def _precio_promedio_linea(self, filters: FilterParams) -> float:
+        rows = await self._execute(*self._precio_promedio_linea_sql(filters))
         if not rows:
             return 0.0
-        return round(float(rows[0]._asdict().get("total") or 0), 2)
+        return round(float(rows[0]._mapping.get("avg_precio") or 0), 2)
+
+    async def _compras_por_proveedor_total(self, filters: FilterParams) -> float:
+        rows = await self._execute(*self._compras_por_proveedor_sql(filters))
+        if not rows:
+            return 0.0
+        return round(float(rows[0]._mapping.get("total") or 0), 2)
+
+    async def _escalares_periodo(self, filters: FilterParams) -> Tuple[float, float]:
+        """Precio promedio por línea y compras a proveedores en un solo round-trip."""
+        pipeline = (
+            QueryPipeline()
+            .add("precio_linea", *self._precio_promedio_linea_sql(filters))
+            .add("compras_prov", *self._compras_por_proveedor_sql(filters))
+        )
+        try:
+            r = await pipeline.execute(self.db)
+        except Exception:
+            # Si una fuente falla (p. ej. sin facturas_proveedor), aislar cada consulta
+            await self.db.rollback()
+            return (
+                await self._precio_promedio_linea(filters),
+                await self._compras_por_proveedor_total(filters),
+            )
+        return (
+            round(float(r.get("precio_linea") or 0), 2),
+            round(float(r.get("compras_prov") or 0), 2),
+        )
 
     async def _variacion_vs_periodo_anterior(
-        self, filters: FilterParams, ventas_actuales: float
+        self,
+        filters: FilterParams,
+        ventas_actuales: float,
+        invoices: Optional[List[Dict[str, Any]]] = None,
     ) -> Optional[float]:
         inicio, fin = self._periodo(filters)
         dias = max((fin - inicio).days + 1, 1)
         prev_fin = inicio - timedelta(days=1)
         prev_inicio = prev_fin - timedelta(days=dias - 1)
-        prev_rows = await self._fetch_facturas_agrupadas(filters, prev_inicio, prev_fin)
+        if invoices is None:
+            prev_rows = await self._fetch_facturas_agrupadas(filters, prev_inicio, prev_fin)
+        else:
+            prev_rows = self.filter_invoices(invoices, prev_inicio, prev_fin)
         ventas_prev = self.compute_ticket_metrics(prev_rows)["ventas_totales"]
         return self.safe_pct(ventas_actuales - ventas_prev, ventas_prev)
 
@@ -337,8 +376,11 @@ class MetricasSectorService:
         except Exception:
             return []
 
-    async def _ventas_tickets(self, filters: FilterParams) -> Dict[str, Any]:
-        invoices = await self._fetch_facturas_agrupadas(filters)
+    async def _ventas_tickets(
+        self, filters: FilterParams, invoices: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        if invoices is None:
+            invoices = await self._fetch_facturas_agrupadas(filters)
         base = self.compute_ticket_metrics(invoices)
 
         dias_periodo = max((self._periodo(filters)[1] - self._periodo(filters)[0]).days + 1, 1)
@@ -351,14 +393,16 @@ class MetricasSectorService:
                 continue
             clientes_identificados.setdefault(cliente, 0)
             clientes_identificados[cliente] += 1
-        recurrentes = len([c for c in clientes_identificados.values() if c > 1])
+        recurrentes = sum(1 for c in clientes_identificados.values() if c > 1)
         base["clientes_identificados"] = len(clientes_identificados)
         base["repeat_customer_rate_proxy"] = (
             recurrentes / len(clientes_identificados) * 100 if clientes_identificados else 0
         )
         return base
 
-    async def _series_ventas(self, filters: FilterParams) -> Dict[str, List[Dict[str, Any]]]:
+    async def _series_ventas(
+        self, filters: FilterParams, period_invoices: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
         where, params = self._facturas_where(filters)
         rows = await self._execute(
             f"""
@@ -386,7 +430,7 @@ class MetricasSectorService:
         )
         ventas_diarias = []
         for idx, row in enumerate(rows):
-            d = row._asdict()
+            d = row._mapping
             ventas = float(d.get("ventas") or 0)
             prev = ventas_diarias[max(0, idx - 6):idx]
             window_sum = sum(float(p["ventas"]) for p in prev) + ventas
@@ -442,11 +486,11 @@ class MetricasSectorService:
         )
         por_vendedor = [
             {
-                "vendedor": r._asdict()["vendedor"],
-                "facturas": int(r._asdict().get("facturas") or 0),
-                "ticket_promedio": round(float(r._asdict().get("ventas") or 0) / int(r._asdict().get("facturas") or 1), 2),
-                "unidades_por_ticket": round(float(r._asdict().get("unidades") or 0) / int(r._asdict().get("facturas") or 1), 2),
-                "lineas_por_ticket": round(float(r._asdict().get("lineas") or 0) / int(r._asdict().get("facturas") or 1), 2),
+                "vendedor": r._mapping["vendedor"],
+                "facturas": int(r._mapping.get("facturas") or 0),
+                "ticket_promedio": round(float(r._mapping.get("ventas") or 0) / int(r._mapping.get("facturas") or 1), 2),
+                "unidades_por_ticket": round(float(r._mapping.get("unidades") or 0) / int(r._mapping.get("facturas") or 1), 2),
+                "lineas_por_ticket": round(float(r._mapping.get("lineas") or 0) / int(r._mapping.get("facturas") or 1), 2),
             }
             for r in vendedor_rows
         ]
@@ -479,16 +523,17 @@ class MetricasSectorService:
         )
         por_metodo = [
             {
-                "metodo": r._asdict()["metodo"],
-                "facturas": int(r._asdict().get("facturas") or 0),
-                "ticket_promedio": round(float(r._asdict().get("ventas") or 0) / int(r._asdict().get("facturas") or 1), 2),
-                "unidades_por_ticket": round(float(r._asdict().get("unidades") or 0) / int(r._asdict().get("facturas") or 1), 2),
-                "lineas_por_ticket": round(float(r._asdict().get("lineas") or 0) / int(r._asdict().get("facturas") or 1), 2),
+                "metodo": r._mapping["metodo"],
+                "facturas": int(r._mapping.get("facturas") or 0),
+                "ticket_promedio": round(float(r._mapping.get("ventas") or 0) / int(r._mapping.get("facturas") or 1), 2),
+                "unidades_por_ticket": round(float(r._mapping.get("unidades") or 0) / int(r._mapping.get("facturas") or 1), 2),
+                "lineas_por_ticket": round(float(r._mapping.get("lineas") or 0) / int(r._mapping.get("facturas") or 1), 2),
             }
             for r in metodo_rows
         ]
         inicio, fin = self._periodo(filters)
-        period_invoices = await self._fetch_facturas_agrupadas(filters, inicio, fin)
+        if period_invoices is None:
+            period_invoices = await self._fetch_facturas_agrupadas(filters, inicio, fin)
         return {
             "ventas_diarias": ventas_diarias,
             "ticket_diario": ticket_diario,
@@ -544,7 +589,7 @@ class MetricasSectorService:
         return rows[:12]
 
     async def _inventario(self, margen_bruto: float, filters: Optional[FilterParams] = None) -> Dict[str, Any]:
-        from app.services.inventario import InventarioService
+        from app.services.inventario import InventarioService, redondear_producto
         from app.services.abc import ABCService
 
         inv = InventarioService(self.db)
@@ -553,10 +598,7 @@ class MetricasSectorService:
         if filters is not None:
             try:
                 abc_result = await ABCService(VentasService(self.db)).get_analisis_abc(filters, "ventas")
-                abc_map = {
-                    p["nombre"]: p.get("categoria", "C")
-                    for p in abc_result.get("productos", [])
-                }
+                abc_map = abc_result["_categoria_por_nombre"]
             except Exception:
                 pass
         if not productos:
@@ -577,34 +619,47 @@ class MetricasSectorService:
                 "salud": {},
             }
 
-        valor_total = sum(float(p.get("valor_inventario") or 0) for p in productos)
-        activos = [p for p in productos if float(p.get("cantidad_vendida_30d") or 0) > 0]
-        sin_stock = [p for p in activos if float(p.get("stock_actual") or 0) <= 0]
-        unidades_30d = sum(float(p.get("cantidad_vendida_30d") or 0) for p in productos)
-        stock_actual = sum(float(p.get("stock_actual") or 0) for p in productos)
-        dead_stock = [
-            p
-            for p in productos
-            if float(p.get("stock_actual") or 0) > 0 and float(p.get("cantidad_vendida_30d") or 0) == 0
-        ]
-        exceso = [p for p in productos if (p.get("dias_cobertura") is None or float(p.get("dias_cobertura") or 0) > 60)]
-        riesgo = [p for p in productos if "Cr" in str(p.get("estado_stock")) or "Bajo" in str(p.get("estado_stock"))]
-        sano = [
-            p
-            for p in productos
-            if p not in riesgo and p not in exceso
-        ]
-        rotaciones = [float(p.get("rotacion") or 0) for p in productos if p.get("rotacion") is not None]
+        # Una sola pasada por el inventario para todos los contadores y sumas
+        valor_total = unidades_30d = stock_actual = 0.0
+        valor_dead = valor_exceso = rot_sum = 0.0
+        n_activos = n_sin_stock = n_exceso = n_riesgo = n_sano = n_rot = 0
+        for p in productos:
+            valor = float(p.get("valor_inventario") or 0)
+            vendida = float(p.get("cantidad_vendida_30d") or 0)
+            stock = float(p.get("stock_actual") or 0)
+            valor_total += valor
+            unidades_30d += vendida
+            stock_actual += stock
+            if vendida > 0:
+                n_activos += 1
+                if stock <= 0:
+                    n_sin_stock += 1
+            elif vendida == 0 and stock > 0:
+                valor_dead += valor
+            dias = p.get("dias_cobertura")
+            en_exceso = dias is None or float(dias or 0) > 60
+            en_riesgo = p["estado_stock"] <= EstadoStock.BAJO
+            if en_exceso:
+                n_exceso += 1
+                valor_exceso += valor
+            if en_riesgo:
+                n_riesgo += 1
+            if not en_exceso and not en_riesgo:
+                n_sano += 1
+            rotacion = p.get("rotacion")
+            if rotacion is not None:
+                rot_sum += float(rotacion or 0)
+                n_rot += 1
         metrics = {
             "valor_inventario_estimado": round(valor_total, 2),
-            "stockout_rate_sku": self.safe_pct(len(sin_stock), len(activos)) or 0,
+            "stockout_rate_sku": self.safe_pct(n_sin_stock, n_activos) or 0,
             "sell_through_proxy": self.safe_pct(unidades_30d, unidades_30d + stock_actual) or 0,
-            "rotacion_unidades_proxy": round(sum(rotaciones) / len(rotaciones), 2) if rotaciones else 0,
-            "dead_stock_value_proxy": round(sum(float(p.get("valor_inventario") or 0) for p in dead_stock), 2),
-            "excess_stock_value": round(sum(float(p.get("valor_inventario") or 0) for p in exceso), 2),
-            "stock_sano_pct": self.safe_pct(len(sano), len(productos)) or 0,
-            "stock_riesgo_pct": self.safe_pct(len(riesgo), len(productos)) or 0,
-            "stock_exceso_pct": self.safe_pct(len(exceso), len(productos)) or 0,
+            "rotacion_unidades_proxy": round(rot_sum / n_rot, 2) if n_rot else 0,
+            "dead_stock_value_proxy": round(valor_dead, 2),
+            "excess_stock_value": round(valor_exceso, 2),
+            "stock_sano_pct": self.safe_pct(n_sano, len(productos)) or 0,
+            "stock_riesgo_pct": self.safe_pct(n_riesgo, len(productos)) or 0,
+            "stock_exceso_pct": self.safe_pct(n_exceso, len(productos)) or 0,
             "gmroi_proxy": round(margen_bruto / valor_total, 3) if valor_total > 0 else 0,
         }
         scatter = [
@@ -616,7 +671,10 @@ class MetricasSectorService:
                 "estado": p.get("estado_stock"),
                 "categoria": abc_map.get(p.get("nombre"), "C"),
             }
-            for p in sorted(productos, key=lambda x: float(x.get("valor_inventario") or 0), reverse=True)[:120]
+            for p in map(
+                redondear_producto,
+                heapq.nlargest(120, productos, key=lambda x: float(x.get("valor_inventario") or 0)),
+            )
         ]
         return {"metrics": metrics, "scatter": scatter, "salud": {k: metrics[k] for k in ("stock_sano_pct", "stock_riesgo_pct", "stock_exceso_pct")}}
 
@@ -669,11 +727,11 @@ class MetricasSectorService:
         )
         variance = [
             {
-                "nombre": r._asdict().get("nombre"),
-                "proveedor": r._asdict().get("proveedor"),
-                "precio_proveedor": float(r._asdict().get("precio_proveedor") or 0),
-                "precio_min": float(r._asdict().get("precio_min") or 0),
-                "variance_pct": round(float(r._asdict().get("variance_pct") or 0), 2),
+                "nombre": r._mapping.get("nombre"),
+                "proveedor": r._mapping.get("proveedor"),
+                "precio_proveedor": float(r._mapping.get("precio_proveedor") or 0),
+                "precio_min": float(r._mapping.get("precio_min") or 0),
+                "variance_pct": round(float(r._mapping.get("variance_pct") or 0), 2),
             }
             for r in rows
         ]
@@ -681,17 +739,23 @@ class MetricasSectorService:
 
     async def get_resumen(self, filters: FilterParams) -> Dict[str, Any]:
         inicio, fin = self._periodo(filters)
-        tickets = await self._ventas_tickets(filters)
-        series = await self._series_ventas(filters)
+        # Una sola lectura de facturas agrupadas cubre el período, el período
+        # previo del mismo tamaño y las ventanas 7d/30d del resumen temporal
+        dias = max((fin - inicio).days + 1, 1)
+        desde = min(inicio - timedelta(days=dias), fin - timedelta(days=59))
+        invoices = await self._fetch_facturas_agrupadas(filters, desde, fin)
+        period_invoices = self.filter_invoices(invoices, inicio, fin)
+
+        tickets = await self._ventas_tickets(filters, period_invoices)
+        series = await self._series_ventas(filters, period_invoices)
         margenes = await self._margenes(filters, float(tickets.get("ventas_totales") or 0))
         inv = await self._inventario(float(margenes.get("margen_bruto") or 0), filters)
         proveedores = await self._proveedores()
         forecast = await PrediccionesService(VentasService(self.db)).get_backtest_metricas(filters, semanas=4)
-        resumen_temporal = await self._resumen_temporal(filters)
-        precio_linea = await self._precio_promedio_linea(filters)
-        compras_prov = await self._compras_por_proveedor_total(filters)
+        resumen_temporal = await self._resumen_temporal(filters, invoices)
+        precio_linea, compras_prov = await self._escalares_periodo(filters)
         variacion_periodo = await self._variacion_vs_periodo_anterior(
-            filters, float(tickets.get("ventas_totales") or 0)
+            filters, float(tickets.get("ventas_totales") or 0), invoices
         )
         margen_diario = await self._margen_diario(filters)
 
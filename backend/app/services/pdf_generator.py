@@ -3,7 +3,7 @@ Generador de reportes PDF.
 """
 from io import BytesIO
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, A4
@@ -16,9 +16,74 @@ from reportlab.platypus import (
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
 
 
+# Formatos de celda como métodos ligados de str.format, resueltos una vez
+_FMT_DINERO = "${:,.0f}".format
+_FMT_ENTERO = "{:,}".format
+_FMT_PORCENTAJE = "{:.1f}%".format
+
+# Estilos de tabla construidos una vez al importar el módulo; setStyle solo lee
+# sus comandos, así que se comparten entre tablas y reportes.
+
+# Resumen ejecutivo
+_ESTILO_METRICAS = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f3f4f6')),
+    ('BACKGROUND', (0, 2), (-1, 2), colors.HexColor('#f3f4f6')),
+    ('TOPPADDING', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+])
+
+# Alertas activas
+_ESTILO_ALERTAS = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#fee2e2')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#991b1b')),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
+    ('TOPPADDING', (0, 0), (-1, -1), 6),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+])
+
+# Top productos y ranking de vendedores
+_ESTILO_RANKING = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+    ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
+    ('TOPPADDING', (0, 0), (-1, -1), 6),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
+])
+
+# Ventas por familia
+_ESTILO_FAMILIAS = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
+    ('TOPPADDING', (0, 0), (-1, -1), 6),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
+])
+
+
 class PDFReportGenerator:
     """Generador de reportes PDF para ventas."""
     
+    # Filas de etiquetas de la tabla de métricas (cada una va sobre sus valores)
+    ETIQUETAS_METRICAS = (
+        ("Total Ingresos", "Total Ventas", "Ticket Promedio"),
+        ("Productos Únicos", "Margen Promedio", "Total Margen"),
+    )
+    
     def __init__(self):
         self.styles = getSampleStyleSheet()
         self._setup_custom_styles()
@@ -58,6 +123,11 @@ class PDFReportGenerator:
             textColor=colors.gray,
             alignment=TA_CENTER
         ))
+        
+        # Estilos de la tabla de métricas resueltos una vez. Los Paragraph no se
+        # reutilizan entre reportes: reportlab guarda en ellos el layout (wrap/split).
+        self._estilo_metrica_etiqueta = self.styles['MetricLabel']
+        self._estilo_metrica_valor = self.styles['MetricValue']
     
     def generate_sales_report(
         self,
@@ -67,9 +137,10 @@ class PDFReportGenerator:
         ventas_por_familia: List[Dict],
         alertas: List[Dict],
         fecha_inicio: str = None,
-        fecha_fin: str = None
+        fecha_fin: str = None,
+        generado: Optional[datetime] = None
     ) -> bytes:
-        """Genera un reporte PDF completo de ventas."""
+        """Genera un reporte PDF completo de ventas (``generado``: fecha impresa, por defecto ahora)."""
         buffer = BytesIO()
         doc = SimpleDocTemplate(
             buffer,
@@ -94,7 +165,7 @@ class PDFReportGenerator:
             self.styles['Normal']
         ))
         elements.append(Paragraph(
-            f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}",
+            f"Generado: {(generado or datetime.now()).strftime('%d/%m/%Y %H:%M')}",
             self.styles['Normal']
         ))
         elements.append(Spacer(1, 20))
@@ -130,159 +201,128 @@ class PDFReportGenerator:
         # Construir PDF
         doc.build(elements)
         
-        pdf_bytes = buffer.getvalue()
-        buffer.close()
-        
-        return pdf_bytes
+        # getvalue() entrega el bytes interno del BytesIO sin copiar el documento
+        # cuando no hay vistas abiertas; getbuffer().tobytes() sí lo copiaría.
+        return buffer.getvalue()
     
     def _create_metrics_table(self, metricas: Dict[str, Any]) -> Table:
         """Crea tabla de métricas."""
-        data = [
-            [
-                Paragraph("Total Ingresos", self.styles['MetricLabel']),
-                Paragraph("Total Ventas", self.styles['MetricLabel']),
-                Paragraph("Ticket Promedio", self.styles['MetricLabel']),
-            ],
-            [
-                Paragraph(f"${metricas.get('total_ingresos', 0):,.0f}", self.styles['MetricValue']),
-                Paragraph(f"{metricas.get('total_ventas', 0):,}", self.styles['MetricValue']),
-                Paragraph(f"${metricas.get('ticket_promedio', 0):,.0f}", self.styles['MetricValue']),
-            ],
-            [
-                Paragraph("Productos Únicos", self.styles['MetricLabel']),
-                Paragraph("Margen Promedio", self.styles['MetricLabel']),
-                Paragraph("Total Margen", self.styles['MetricLabel']),
-            ],
-            [
-                Paragraph(f"{metricas.get('productos_unicos', 0):,}", self.styles['MetricValue']),
-                Paragraph(f"{metricas.get('margen_promedio', 0):.1f}%", self.styles['MetricValue']),
-                Paragraph(f"${metricas.get('total_margen', 0):,.0f}", self.styles['MetricValue']),
-            ],
-        ]
+        etiqueta = self._estilo_metrica_etiqueta
+        valor = self._estilo_metrica_valor
+        valores = (
+            (
+                _FMT_DINERO(metricas.get('total_ingresos', 0)),
+                _FMT_ENTERO(metricas.get('total_ventas', 0)),
+                _FMT_DINERO(metricas.get('ticket_promedio', 0)),
+            ),
+            (
+                _FMT_ENTERO(metricas.get('productos_unicos', 0)),
+                _FMT_PORCENTAJE(metricas.get('margen_promedio', 0)),
+                _FMT_DINERO(metricas.get('total_margen', 0)),
+            ),
+        )
+        data = []
+        for etiquetas, textos in zip(self.ETIQUETAS_METRICAS, valores):
+            data.append([Paragraph(t, etiqueta) for t in etiquetas])
+            data.append([Paragraph(t, valor) for t in textos])
         
         table = Table(data, colWidths=[150, 150, 150])
-        table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f3f4f6')),
-            ('BACKGROUND', (0, 2), (-1, 2), colors.HexColor('#f3f4f6')),
-            ('TOPPADDING', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-        ]))
+        table.setStyle(_ESTILO_METRICAS)
         
         return table
     
     def _create_alerts_table(self, alertas: List[Dict]) -> Table:
         """Crea tabla de alertas."""
-        data = [['Tipo', 'Título', 'Mensaje']]
-        
-        for alerta in alertas:
-            data.append([
+        mensajes = [alerta.get('mensaje', '') for alerta in alertas]
+        filas = [
+            [
                 alerta.get('tipo', ''),
                 alerta.get('titulo', ''),
-                alerta.get('mensaje', '')[:50] + '...' if len(alerta.get('mensaje', '')) > 50 else alerta.get('mensaje', '')
-            ])
-        
-        table = Table(data, colWidths=[60, 120, 270])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#fee2e2')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#991b1b')),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ]))
-        
-        return table
+                mensaje[:50] + '...' if len(mensaje) > 50 else mensaje,
+            ]
+            for alerta, mensaje in zip(alertas, mensajes)
+        ]
+        return self._build_table(
+            ['Tipo', 'Título', 'Mensaje'],
+            filas,
+            [60, 120, 270],
+            _ESTILO_ALERTAS,
+        )
     
     def _create_products_table(self, productos: List[Dict]) -> Table:
         """Crea tabla de productos."""
-        data = [['#', 'Producto', 'Cantidad', 'Total Ventas', 'Margen %']]
-        
-        for i, prod in enumerate(productos, 1):
-            data.append([
+        # Una sola lectura de cada campo por fila; margen_porcentaje es opcional
+        valores = [
+            (
+                prod.get('nombre', ''),
+                prod.get('cantidad', 0),
+                prod.get('total_venta', 0),
+                prod.get('margen_porcentaje'),
+            )
+            for prod in productos
+        ]
+        filas = [
+            [
                 str(i),
-                prod.get('nombre', '')[:30],
-                f"{prod.get('cantidad', 0):,}",
-                f"${prod.get('total_venta', 0):,.0f}",
-                f"{prod.get('margen_porcentaje', 0):.1f}%" if prod.get('margen_porcentaje') else '-'
-            ])
-        
-        table = Table(data, colWidths=[30, 200, 70, 100, 70])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-            ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
-        ]))
-        
-        return table
+                nombre[:30],
+                _FMT_ENTERO(cantidad),
+                _FMT_DINERO(total),
+                _FMT_PORCENTAJE(margen) if margen else '-',
+            ]
+            for i, (nombre, cantidad, total, margen) in enumerate(valores, 1)
+        ]
+        return self._build_table(
+            ['#', 'Producto', 'Cantidad', 'Total Ventas', 'Margen %'],
+            filas,
+            [30, 200, 70, 100, 70],
+            _ESTILO_RANKING,
+        )
     
     def _create_sellers_table(self, vendedores: List[Dict]) -> Table:
         """Crea tabla de vendedores."""
-        data = [['#', 'Vendedor', 'Transacciones', 'Total Ventas', 'Ticket Prom.']]
-        
-        for i, vend in enumerate(vendedores, 1):
-            data.append([
+        filas = [
+            [
                 str(i),
                 vend.get('vendedor', 'Sin nombre')[:25],
-                f"{vend.get('cantidad', 0):,}",
-                f"${vend.get('total_venta', 0):,.0f}",
-                f"${vend.get('ticket_promedio', 0):,.0f}"
-            ])
-        
-        table = Table(data, colWidths=[30, 150, 90, 100, 100])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-            ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
-        ]))
-        
-        return table
+                _FMT_ENTERO(vend.get('cantidad', 0)),
+                _FMT_DINERO(vend.get('total_venta', 0)),
+                _FMT_DINERO(vend.get('ticket_promedio', 0)),
+            ]
+            for i, vend in enumerate(vendedores, 1)
+        ]
+        return self._build_table(
+            ['#', 'Vendedor', 'Transacciones', 'Total Ventas', 'Ticket Prom.'],
+            filas,
+            [30, 150, 90, 100, 100],
+            _ESTILO_RANKING,
+        )
     
     def _create_family_table(self, familias: List[Dict]) -> Table:
         """Crea tabla de familias."""
-        data = [['Familia', 'Cantidad', 'Total Ventas', '% del Total']]
+        totales = [fam.get('total_venta', 0) for fam in familias]
+        total_general = sum(totales)
         
-        total_general = sum(f.get('total_venta', 0) for f in familias)
-        
-        for fam in familias:
-            porcentaje = (fam.get('total_venta', 0) / total_general * 100) if total_general > 0 else 0
-            data.append([
+        filas = [
+            [
                 fam.get('familia', 'Sin familia')[:25],
-                f"{fam.get('cantidad', 0):,}",
-                f"${fam.get('total_venta', 0):,.0f}",
-                f"{porcentaje:.1f}%"
-            ])
-        
-        table = Table(data, colWidths=[150, 100, 120, 100])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
-        ]))
-        
+                _FMT_ENTERO(fam.get('cantidad', 0)),
+                _FMT_DINERO(total),
+                _FMT_PORCENTAJE((total / total_general * 100) if total_general > 0 else 0),
+            ]
+            for fam, total in zip(familias, totales)
+        ]
+        return self._build_table(
+            ['Familia', 'Cantidad', 'Total Ventas', '% del Total'],
+            filas,
+            [150, 100, 120, 100],
+            _ESTILO_FAMILIAS,
+        )
+    
+    @staticmethod
+    def _build_table(
+        header: List[str], rows: List[List[str]], col_widths: List[int], style: TableStyle
+    ) -> Table:
+        """Arma una tabla de encabezado + filas con un estilo precompilado."""
+        table = Table([header, *rows], colWidths=col_widths)
+        table.setStyle(style)
         return table
-
@@ -2,11 +2,18 @@
 Servicio de predicciones de ventas.
 Usa regresión lineal ponderada + estacionalidad semanal + banda de confianza basada en desviación estándar.
 """
+import asyncio
+import math
+from dataclasses import dataclass
 from datetime import date, timedelta
-from typing import Any, Dict, List, Optional, Tuple
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple, Union
 
 import numpy as np
 
+from app.cache import PREDICCIONES_CACHE, _cache_key, get_cached, set_cached
 from app.models.schemas import (
     FilterParams,
     PrediccionResponse,
@@ -16,39 +23,74 @@ from app.models.schemas import (
 )
 from app.services.ventas import VentasService
 
+# Pesos exponenciales de la regresión: más reciente = más peso
+DECAY_REGRESION = 0.95
+# Los puntos con peso relativo menor a esto no cambian el ajuste
+PESO_MINIMO_REGRESION = 1e-6
+VENTANA_REGRESION = math.ceil(math.log(PESO_MINIMO_REGRESION) / math.log(DECAY_REGRESION))
+
+
+@lru_cache(maxsize=32)
+def _pesos_exponenciales(k: int) -> np.ndarray:
+    """Pesos ``decay ** (k-1-i)`` de una ventana de ``k`` días (solo lectura, compartidos)."""
+    pesos = DECAY_REGRESION ** np.arange(k - 1, -1, -1, dtype=float)
+    pesos.flags.writeable = False
+    return pesos
+
+
+@dataclass
+class Pronostico:
+    """Resultado del pronóstico de una serie diaria (sin redondear salvo las listas)."""
+    pendiente: float
+    venta_diaria_promedio: float
+    prediccion_semanal: float
+    prediccion_mensual: float
+    predicciones: List[VentaDiariaResponse]
+    predicciones_upper: List[float]
+    predicciones_lower: List[float]
+    mape: Optional[float]
+    wape: Optional[float]
+
 
 class PrediccionesService:
     """Servicio para predicciones de ventas."""
     
     DIAS_PREDICCION = 14  # Predecir 14 días en lugar de 7
     VENTANA_MEDIA_MOVIL = 7
+    NOMBRES_DIAS_SEMANA = (
+        "Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo",
+    )
     
     def __init__(self, ventas_service: VentasService):
         self.ventas_service = ventas_service
     
     @staticmethod
     def _regresion_lineal_ponderada(
-        valores: List[float],
+        valores: Union[List[float], np.ndarray],
     ) -> Tuple[float, float]:
         """Regresión lineal con pesos exponenciales (más peso a datos recientes).
         
         Returns:
             (pendiente, intercepto) de la recta y = pendiente*x + intercepto
         """
-        n = len(valores)
-        x = np.arange(n, dtype=float)
-        y = np.array(valores, dtype=float)
+        y = np.asarray(valores, dtype=float)
+        n = y.size
         
-        # Pesos exponenciales: más reciente = más peso
-        decay = 0.95
-        weights = np.array([decay ** (n - 1 - i) for i in range(n)])
+        # Con historias largas solo cuentan los últimos VENTANA_REGRESION días
+        # (los anteriores pesan < PESO_MINIMO_REGRESION); x sigue siendo absoluto
+        k = min(n, VENTANA_REGRESION)
+        weights = _pesos_exponenciales(k)
+        x = np.arange(n - k, n, dtype=float)
+        y = y[n - k:]
         
-        # Regresión ponderada: minimizar sum(w * (y - (a*x + b))^2)
-        W = np.sum(weights)
-        Wx = np.sum(weights * x)
-        Wy = np.sum(weights * y)
-        Wxx = np.sum(weights * x * x)
-        Wxy = np.sum(weights * x * y)
+        # Regresión ponderada: minimizar sum(w * (y - (a*x + b))^2).
+        # Ecuaciones normales con productos punto (BLAS)
+        wx = weights * x
+        W = weights.sum()
+        Wx = wx.sum()
+        Wy = weights @ y
+        Wxx = wx @ x
+        Wxy = wx @ y
         
         denom = W * Wxx - Wx * Wx
         if abs(denom) < 1e-10:
@@ -59,104 +101,186 @@ class PrediccionesService:
         
         return float(pendiente), float(intercepto)
     
+    @staticmethod
+    def _regresion_lineal_ponderada_lote(
+        series: List[np.ndarray],
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """(pendientes, interceptos) de varias series en un solo paso.
+
+        Mismo ajuste que _regresion_lineal_ponderada. Las series se alinean por
+        el final en una matriz (G, L) rellena con ceros a la izquierda, así todas
+        comparten el vector de pesos y los momentos salen de cinco productos
+        matriz-vector; el relleno queda fuera con x = 0 y máscara 0.
+        """
+        tamanos = np.array([serie.size for serie in series])
+        largos = np.minimum(tamanos, VENTANA_REGRESION)
+        L = int(largos.max())
+        weights = _pesos_exponenciales(L)
+        
+        Y = np.zeros((len(series), L))
+        for fila, serie, k in zip(Y, series, largos.tolist()):
+            fila[L - k:] = serie[serie.size - k:]
+        columnas = np.arange(L)
+        M = (columnas >= (L - largos)[:, None]).astype(float)
+        # x absoluto de cada serie: el último punto de la fila es x = n - 1
+        X = (columnas + (tamanos - L)[:, None]) * M
+        
+        W = M @ weights
+        Wx = X @ weights
+        Wy = Y @ weights
+        Wxx = (X * X) @ weights
+        Wxy = (X * Y) @ weights
+        
+        denom = W * Wxx - Wx * Wx
+        degenerada = np.abs(denom) < 1e-10
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pendientes = np.where(degenerada, 0.0, (W * Wxy - Wx * Wy) / denom)
+            interceptos = np.where(
+                degenerada, Y.sum(axis=1) / largos, (Wy - pendientes * Wx) / W
+            )
+        return pendientes, interceptos
+    
+    @staticmethod
+    def _media_movil(valores: np.ndarray, ventana: int) -> np.ndarray:
+        """Media móvil en una pasada con suma acumulada.
+
+        Los primeros ``ventana - 1`` días promedian solo los días disponibles.
+        """
+        acumulado = np.cumsum(valores)
+        sumas = acumulado.copy()
+        sumas[ventana:] -= acumulado[:-ventana]
+        return sumas / np.minimum(np.arange(1, valores.size + 1), ventana)
+    
     @staticmethod
     def _calcular_estacionalidad_semanal(
-        fechas: list, valores: List[float]
-    ) -> dict:
+        dias_semana: np.ndarray, valores: np.ndarray
+    ) -> np.ndarray:
         """Calcula factores de estacionalidad por día de la semana.
         
         Returns:
-            Dict {dia_semana: factor} donde factor > 1 = día fuerte, < 1 = día débil.
+            Array de 7 factores (lunes = 0) donde factor > 1 = día fuerte,
+            < 1 = día débil; 0 si el día no tiene datos.
         """
-        dias = {i: [] for i in range(7)}
-        for fecha, valor in zip(fechas, valores):
-            dias[fecha.weekday()].append(valor)
-        
-        promedios = {}
-        for dia, vals in dias.items():
-            promedios[dia] = np.mean(vals) if vals else 0
+        sumas = np.bincount(dias_semana, weights=valores, minlength=7)
+        conteos = np.bincount(dias_semana, minlength=7)
+        promedios = np.divide(sumas, conteos, out=np.zeros(7), where=conteos > 0)
         
-        media_global = np.mean(valores) if valores else 1
+        media_global = float(valores.sum()) / valores.size if valores.size else 1
         if media_global == 0:
             media_global = 1
         
-        factores = {dia: prom / media_global for dia, prom in promedios.items()}
-        return factores
+        return promedios / media_global
+
+    @staticmethod
+    def _proyectar(
+        pendiente: float, intercepto: float, factores: np.ndarray, x: np.ndarray, dias_semana: np.ndarray
+    ) -> np.ndarray:
+        """Tendencia lineal en ``x`` × factor estacional de cada día, sin negativos."""
+        proyeccion = (pendiente * x + intercepto) * factores[dias_semana]
+        return np.where(proyeccion > 0, proyeccion, 0.0)
+
+    @staticmethod
+    def _indice_dias_semana(fechas: List[date]) -> np.ndarray:
+        """weekday() de cada fecha (lunes = 0) como int8."""
+        return np.fromiter((f.weekday() for f in fechas), dtype=np.int8, count=len(fechas))
+
+    @staticmethod
+    def _dias_semana_siguientes(ultimo_dia_semana: int, dias: int) -> np.ndarray:
+        """Día de la semana de los ``dias`` días calendario posteriores."""
+        return (int(ultimo_dia_semana) + np.arange(1, dias + 1)) % 7
+
+    @staticmethod
+    def _banda_confianza(
+        predicciones: np.ndarray, std_residuos: float
+    ) -> Tuple[List[float], List[float]]:
+        """Banda ±1 std de los residuos que crece un 10% por día (incertidumbre aumenta)."""
+        margen = std_residuos * (1 + 0.1 * np.arange(predicciones.size))
+        upper = np.round(predicciones + margen, 2).tolist()
+        inferior = predicciones - margen
+        lower = np.round(np.where(inferior > 0, inferior, 0.0), 2).tolist()
+        return upper, lower
 
     def _calcular_prediccion_para_serie(
         self,
         fechas_ordenadas: List[date],
-        valores: List[float],
-    ) -> Optional[
-        Tuple[
-            float, float, float, List, List[float], List[float], Optional[float], Optional[float]
-        ]
-    ]:
-        """Calcula predicción para una serie (fechas, valores). Retorna None si datos insuficientes."""
-        n = len(valores)
+        valores: Union[List[float], np.ndarray],
+        recta: Optional[Tuple[float, float]] = None,
+        dias_semana: Optional[np.ndarray] = None,
+    ) -> Optional[Pronostico]:
+        """Calcula predicción para una serie (fechas, valores). Retorna None si datos insuficientes.
+
+        ``recta`` (pendiente, intercepto) evita repetir la regresión si ya se ajustó en lote;
+        ``dias_semana`` (weekday de cada fecha) si el llamador ya lo calculó.
+        """
+        valores_arr = np.asarray(valores, dtype=float)
+        n = valores_arr.size
         if n < 7:
             return None
-        valores_arr = np.array(valores, dtype=float)
-        pendiente, intercepto = self._regresion_lineal_ponderada(valores)
-        factores = self._calcular_estacionalidad_semanal(fechas_ordenadas, valores)
+        if recta is None:
+            recta = self._regresion_lineal_ponderada(valores_arr)
+        pendiente, intercepto = recta
+        
+        # Estacionalidad semanal: el índice de días se reutiliza en el ajuste in-sample
+        dias_hist = dias_semana if dias_semana is not None else self._indice_dias_semana(fechas_ordenadas)
+        factores = self._calcular_estacionalidad_semanal(dias_hist, valores_arr)
+        
+        # Predicción = tendencia lineal * factor estacional del día (sin negativos)
         ultima_fecha = fechas_ordenadas[-1]
         fechas_futuras = [
             ultima_fecha + timedelta(days=i) for i in range(1, self.DIAS_PREDICCION + 1)
         ]
-        predicciones_valores = []
-        for i, fecha_futura in enumerate(fechas_futuras):
-            x_futuro = n + i
-            valor_tendencia = pendiente * x_futuro + intercepto
-            factor = factores.get(fecha_futura.weekday(), 1.0)
-            predicciones_valores.append(max(0, valor_tendencia * factor))
+        dias_futuros = self._dias_semana_siguientes(dias_hist[-1], self.DIAS_PREDICCION)
+        pred_arr = self._proyectar(
+            pendiente, intercepto, factores, np.arange(n, n + self.DIAS_PREDICCION, dtype=float), dias_futuros
+        )
+        
+        # Banda de confianza basada en la desviación estándar de los residuos
         x_hist = np.arange(n, dtype=float)
-        valores_ajustados = pendiente * x_hist + intercepto
-        residuos = valores_arr - valores_ajustados
-        std_residuos = float(np.std(residuos))
-        predicciones_upper = [
-            round(pred + std_residuos * (1 + 0.1 * i), 2) for i, pred in enumerate(predicciones_valores)
-        ]
-        predicciones_lower = [
-            round(max(0, pred - std_residuos * (1 + 0.1 * i)), 2) for i, pred in enumerate(predicciones_valores)
-        ]
-        venta_diaria_promedio = float(np.mean(valores_arr[-7:]))
-        pred_arr = np.array(predicciones_valores)
-        prediccion_semanal = float(np.sum(pred_arr[:7]))
-        prediccion_mensual = float(np.sum(pred_arr[:14])) * (30 / 14)
+        residuos = valores_arr - (pendiente * x_hist + intercepto)
+        # Desviación estándar poblacional sin el despacho de np.std (n pequeño por grupo)
+        residuos -= residuos.sum() / n
+        std_residuos = math.sqrt((residuos * residuos).sum() / n)
+        predicciones_upper, predicciones_lower = self._banda_confianza(pred_arr, std_residuos)
+        
+        # MAPE y WAPE (ajuste in-sample: predicción vs real en histórico)
         mape_val = wape_val = None
-        pred_insample = [
-            max(0, (pendiente * i + intercepto) * factores.get(fechas_ordenadas[i].weekday(), 1.0))
-            for i in range(n)
-        ]
-        pred_insample_arr = np.array(pred_insample)
-        errores_abs = np.abs(valores_arr - pred_insample_arr)
-        total_real = float(np.sum(valores_arr))
+        # Los errores se calculan sobre el buffer de la proyección, sin temporales
+        errores_abs = self._proyectar(pendiente, intercepto, factores, x_hist, dias_hist)
+        np.subtract(valores_arr, errores_abs, out=errores_abs)
+        np.abs(errores_abs, out=errores_abs)
+        total_real = float(valores_arr.sum())
         if total_real > 0:
-            wape_val = round(float(np.sum(errores_abs) / total_real * 100), 2)
+            # WAPE = sum(|actual-pred|) / sum(actual) * 100
+            wape_val = round(float(errores_abs.sum() / total_real * 100), 2)
         mask = valores_arr > 0
-        if np.any(mask):
-            ape = errores_abs[mask] / valores_arr[mask] * 100
-            mape_val = round(float(np.mean(ape)), 2)
+        if mask.any():
+            # MAPE = mean(|actual-pred|/actual) * 100, solo donde actual > 0
+            ape = errores_abs[mask]  # copia: se puede operar en sitio
+            ape /= valores_arr[mask]
+            ape *= 100
+            mape_val = round(float(ape.mean()), 2)
+        
         predicciones = [
-            VentaDiariaResponse(fecha=fechas_futuras[i], ventas=round(predicciones_valores[i], 2))
-            for i in range(len(fechas_futuras))
+            VentaDiariaResponse.model_construct(fecha=fecha, ventas=ventas)
+            for fecha, ventas in zip(fechas_futuras, np.round(pred_arr, 2).tolist())
         ]
-        return (
-            venta_diaria_promedio,
-            prediccion_semanal,
-            prediccion_mensual,
-            predicciones,
-            predicciones_upper,
-            predicciones_lower,
-            mape_val,
-            wape_val,
+        return Pronostico(
+            pendiente=pendiente,
+            venta_diaria_promedio=float(valores_arr[-7:].sum()) / 7,  # Promedio últimos 7 días
+            prediccion_semanal=float(pred_arr[:7].sum()),
+            prediccion_mensual=float(pred_arr[:14].sum()) * (30 / 14),  # Extrapolar a 30 días
+            predicciones=predicciones,
+            predicciones_upper=predicciones_upper,
+            predicciones_lower=predicciones_lower,
+            mape=mape_val,
+            wape=wape_val,
         )
     
     async def get_predicciones(self, filters: FilterParams) -> PrediccionResponse:
         """Genera predicciones de ventas usando regresión lineal ponderada + estacionalidad."""
-        ventas, _ = await self.ventas_service.get_ventas(filters)
+        filas = await self.ventas_service.get_serie_diaria(filters)
         
-        if not ventas:
+        if not filas:
             return PrediccionResponse(
                 venta_diaria_promedio=0,
                 tendencia_diaria=0,
@@ -171,23 +295,15 @@ class PrediccionesService:
                 wape=None,
             )
         
-        # Agrupar ventas por día
-        ventas_dia: dict = {}
-        for v in ventas:
-            fecha = v.fecha_venta
-            if fecha not in ventas_dia:
-                ventas_dia[fecha] = 0
-            ventas_dia[fecha] += v.total_venta
-        
-        # Ordenar por fecha
-        fechas_ordenadas = sorted(ventas_dia.keys())
-        valores = [ventas_dia[f] for f in fechas_ordenadas]
+        # Serie diaria ya agregada y ordenada por fecha en la base
+        fechas_ordenadas = [fila[1] for fila in filas]
+        valores = [fila[2] for fila in filas]
         n = len(valores)
         
         if n < 7:
             historico = [
-                VentaDiariaResponse(fecha=f, ventas=round(ventas_dia[f], 2))
-                for f in fechas_ordenadas
+                VentaDiariaResponse.model_construct(fecha=f, ventas=valor)
+                for f, valor in zip(fechas_ordenadas, np.round(valores, 2).tolist())
             ]
             promedio = sum(valores) / n if n > 0 else 0
             return PrediccionResponse(
@@ -204,180 +320,126 @@ class PrediccionesService:
                 wape=None,
             )
         
-        # --- Media móvil de 7 días ---
+        # --- Tendencia, estacionalidad, predicciones, banda y errores ---
         valores_arr = np.array(valores, dtype=float)
-        media_movil = []
-        for i in range(n):
-            window_start = max(0, i - self.VENTANA_MEDIA_MOVIL + 1)
-            media_movil.append(float(np.mean(valores_arr[window_start:i + 1])))
-        
-        # --- Regresión lineal ponderada para tendencia ---
-        pendiente, intercepto = self._regresion_lineal_ponderada(valores)
-        
-        # Tendencia diaria
-        tendencia_diaria = pendiente
-        
-        # --- Estacionalidad semanal ---
-        factores_estacionalidad = self._calcular_estacionalidad_semanal(
-            fechas_ordenadas, valores
+        # Un solo índice de días de la semana para el pronóstico y el promedio por día
+        dias_semana = self._indice_dias_semana(fechas_ordenadas)
+        pronostico = self._calcular_prediccion_para_serie(
+            fechas_ordenadas, valores_arr, dias_semana=dias_semana
         )
         
-        # --- Generar predicciones ---
-        ultima_fecha = fechas_ordenadas[-1]
-        fechas_futuras = [
-            ultima_fecha + timedelta(days=i) for i in range(1, self.DIAS_PREDICCION + 1)
-        ]
-        
-        # Predicción = tendencia lineal * factor estacional del día
-        predicciones_valores = []
-        for i, fecha_futura in enumerate(fechas_futuras):
-            x_futuro = n + i
-            valor_tendencia = pendiente * x_futuro + intercepto
-            factor = factores_estacionalidad.get(fecha_futura.weekday(), 1.0)
-            prediccion = max(0, valor_tendencia * factor)  # No permitir negativos
-            predicciones_valores.append(prediccion)
-        
-        # --- Banda de confianza basada en desviación estándar real ---
-        # Calcular residuos de la regresión
-        x_historico = np.arange(n, dtype=float)
-        valores_ajustados = pendiente * x_historico + intercepto
-        residuos = valores_arr - valores_ajustados
-        std_residuos = float(np.std(residuos))
-        
-        # Banda crece con la distancia (incertidumbre aumenta)
-        predicciones_upper = []
-        predicciones_lower = []
-        for i, pred in enumerate(predicciones_valores):
-            margen = std_residuos * (1 + 0.1 * i)  # ±1 std que crece un 10% por día
-            predicciones_upper.append(round(pred + margen, 2))
-            predicciones_lower.append(round(max(0, pred - margen), 2))
-        
-        # --- Histórico con media móvil ---
+        # --- Histórico con media móvil de 7 días ---
+        # Valores ya calculados y redondeados: model_construct evita validar fila a fila
+        media_movil = self._media_movil(valores_arr, self.VENTANA_MEDIA_MOVIL)
         historico = [
-            VentaDiariaResponse(
-                fecha=fechas_ordenadas[i],
-                ventas=round(valores[i], 2),
-                media_movil_7d=round(media_movil[i], 2),
+            VentaDiariaResponse.model_construct(fecha=fecha, ventas=ventas, media_movil_7d=media)
+            for fecha, ventas, media in zip(
+                fechas_ordenadas,
+                np.round(valores_arr, 2).tolist(),
+                np.round(media_movil, 2).tolist(),
             )
-            for i in range(n)
-        ]
-        
-        # --- Predicciones ---
-        predicciones = [
-            VentaDiariaResponse(
-                fecha=fechas_futuras[i],
-                ventas=round(predicciones_valores[i], 2),
-            )
-            for i in range(len(fechas_futuras))
         ]
         
         # --- Ventas por día de la semana ---
-        dias_semana_nombres = {
-            0: "Lunes", 1: "Martes", 2: "Miércoles", 3: "Jueves",
-            4: "Viernes", 5: "Sábado", 6: "Domingo",
-        }
-        ventas_dia_semana: dict = {i: [] for i in range(7)}
-        for v in ventas:
-            dia = v.fecha_venta.weekday()
-            ventas_dia_semana[dia].append(v.total_venta)
+        # Promedio por línea de venta: total del día y líneas del día por día de la semana
+        lineas_dia = np.fromiter((fila[3] for fila in filas), dtype=np.int64, count=n)
+        sumas_dia = np.bincount(dias_semana, weights=valores_arr, minlength=7)
+        conteos_dia = np.bincount(dias_semana, weights=lineas_dia, minlength=7)
+        promedios_dia = np.round(
+            np.divide(sumas_dia, conteos_dia, out=np.zeros(7), where=conteos_dia > 0), 2
+        ).tolist()
         
         ventas_por_dia_semana = [
-            {
-                "dia": dias_semana_nombres[i],
-                "promedio": round(
-                    sum(ventas_dia_semana[i]) / len(ventas_dia_semana[i]), 2
-                )
-                if ventas_dia_semana[i]
-                else 0,
-            }
-            for i in range(7)
+            {"dia": nombre, "promedio": promedio if conteo else 0}
+            for nombre, promedio, conteo in zip(
+                self.NOMBRES_DIAS_SEMANA, promedios_dia, conteos_dia.tolist()
+            )
         ]
-        
-        # Métricas resumen
-        venta_diaria_promedio = float(np.mean(valores_arr[-7:]))  # Promedio últimos 7 días
-        pred_arr = np.array(predicciones_valores)
-        prediccion_semanal = float(np.sum(pred_arr[:7]))
-        prediccion_mensual = float(np.sum(pred_arr[:14])) * (30 / 14)  # Extrapolar a 30 días
-
-        # MAPE y WAPE (ajuste in-sample: predicción vs real en histórico)
-        pred_insample = []
-        for i in range(n):
-            x_val = float(i)
-            valor_tendencia = pendiente * x_val + intercepto
-            factor = factores_estacionalidad.get(fechas_ordenadas[i].weekday(), 1.0)
-            pred_insample.append(max(0, valor_tendencia * factor))
-        pred_insample_arr = np.array(pred_insample)
-        errores_abs = np.abs(valores_arr - pred_insample_arr)
-        total_real = float(np.sum(valores_arr))
-        mape_val: Optional[float] = None
-        wape_val: Optional[float] = None
-        if n > 0:
-            # WAPE = sum(|actual-pred|) / sum(actual) * 100
-            if total_real > 0:
-                wape_val = round(float(np.sum(errores_abs) / total_real * 100), 2)
-            # MAPE = mean(|actual-pred|/actual) * 100, solo donde actual > 0
-            mask = valores_arr > 0
-            if np.any(mask):
-                ape = errores_abs[mask] / valores_arr[mask] * 100
-                mape_val = round(float(np.mean(ape)), 2)
 
-        return PrediccionResponse(
-            venta_diaria_promedio=round(venta_diaria_promedio, 2),
-            tendencia_diaria=round(tendencia_diaria, 2),
-            prediccion_semanal=round(prediccion_semanal, 2),
-            prediccion_mensual=round(prediccion_mensual, 2),
+        # Todos los campos ya tienen su tipo final (floats, listas y filas construidas)
+        return PrediccionResponse.model_construct(
+            venta_diaria_promedio=round(pronostico.venta_diaria_promedio, 2),
+            tendencia_diaria=round(pronostico.pendiente, 2),
+            prediccion_semanal=round(pronostico.prediccion_semanal, 2),
+            prediccion_mensual=round(pronostico.prediccion_mensual, 2),
             historico=historico,
-            predicciones=predicciones,
-            predicciones_upper=predicciones_upper,
-            predicciones_lower=predicciones_lower,
+            predicciones=pronostico.predicciones,
+            predicciones_upper=pronostico.predicciones_upper,
+            predicciones_lower=pronostico.predicciones_lower,
             ventas_por_dia_semana=ventas_por_dia_semana,
-            mape=mape_val,
-            wape=wape_val,
+            mape=pronostico.mape,
+            wape=pronostico.wape,
         )
 
+    def _pronosticar_grupos(
+        self, series: List[Tuple[List[date], List[float]]]
+    ) -> List[Optional[Pronostico]]:
+        """Pronóstico de cada serie (fechas, valores); None si datos insuficientes.
+
+        Las regresiones de todas las series con datos suficientes se ajustan en lote.
+        """
+        arrays = [np.asarray(valores, dtype=float) for _, valores in series]
+        suficientes = [i for i, arr in enumerate(arrays) if arr.size >= 7]
+        rectas: List[Optional[Tuple[float, float]]] = [None] * len(series)
+        if suficientes:
+            pendientes, interceptos = self._regresion_lineal_ponderada_lote(
+                [arrays[i] for i in suficientes]
+            )
+            for i, pendiente, intercepto in zip(suficientes, pendientes.tolist(), interceptos.tolist()):
+                rectas[i] = (pendiente, intercepto)
+        return [
+            self._calcular_prediccion_para_serie(fechas, arr, recta)
+            for (fechas, _), arr, recta in zip(series, arrays, rectas)
+        ]
+
     async def get_predicciones_desglose(
         self, filters: FilterParams, nivel: str
     ) -> PrediccionDesgloseResponse:
         """Predicciones desglosadas por familia o producto. Fallback a global si datos insuficientes."""
-        ventas, _ = await self.ventas_service.get_ventas(filters)
-        if not ventas:
+        # Serie diaria de cada familia o producto, agregada en la base
+        key_attr = "familia" if nivel == "familia" else "nombre"
+        filas = await self.ventas_service.get_serie_diaria(filters, key_attr)
+        if not filas:
             return PrediccionDesgloseResponse(nivel=nivel, grupos={})
 
-        # Obtener predicción global para fallback
-        pred_global = await self.get_predicciones(filters)
-        total_ventas_periodo = sum(v.total_venta or 0 for v in ventas)
+        # Predicción global para fallback; comparte el cache de /predicciones
+        clave_global = _cache_key("pred", filters)
+        pred_global = get_cached(PREDICCIONES_CACHE, clave_global)
+        if pred_global is None:
+            pred_global = await self.get_predicciones(filters)
+            set_cached(PREDICCIONES_CACHE, clave_global, pred_global)
+        # Series globales como arrays: cada grupo en fallback solo las escala
+        fechas_global = [p.fecha for p in pred_global.predicciones]
+        ventas_global = np.array([p.ventas for p in pred_global.predicciones], dtype=float)
+        upper_global = np.array(pred_global.predicciones_upper, dtype=float)
+        lower_global = np.array(pred_global.predicciones_lower, dtype=float)
 
-        # Agrupar por familia o producto
-        key_attr = "familia" if nivel == "familia" else "nombre"
-        grupos_ventas: Dict[str, List[Any]] = {}
-        for v in ventas:
-            key = getattr(v, key_attr) or "(sin clasificar)"
-            if key not in grupos_ventas:
-                grupos_ventas[key] = []
-            grupos_ventas[key].append(v)
+        # Filas ordenadas por clave y fecha: cada grupo es un tramo contiguo
+        series: Dict[str, Tuple[List[date], List[float]]] = {}
+        for clave, grupo in groupby(filas, key=itemgetter(0)):
+            fechas, valores = series.setdefault(clave or "(sin clasificar)", ([], []))
+            for _, fecha, total, _ in grupo:
+                fechas.append(fecha)
+                valores.append(total)
+        totales_grupo = [float(np.sum(valores)) for _, valores in series.values()]
+        total_ventas_periodo = float(np.sum(totales_grupo))
 
-        grupos: Dict[str, PrediccionGrupoResponse] = {}
-        for nombre_grupo, ventas_grupo in grupos_ventas.items():
-            ventas_dia: Dict[date, float] = {}
-            for v in ventas_grupo:
-                f = v.fecha_venta
-                ventas_dia[f] = ventas_dia.get(f, 0) + (v.total_venta or 0)
-            fechas_ord = sorted(ventas_dia.keys())
-            valores = [ventas_dia[f] for f in fechas_ord]
-            ventas_grupo_total = sum(valores)
+        # El pronóstico de los grupos es CPU puro: corre fuera del event loop
+        pronosticos = await asyncio.to_thread(self._pronosticar_grupos, list(series.values()))
 
-            result = self._calcular_prediccion_para_serie(fechas_ord, valores)
-            if result is not None:
-                vd, ps, pm, preds, pu, pl, mape, wape = result
-                grupos[nombre_grupo] = PrediccionGrupoResponse(
-                    venta_diaria_promedio=round(vd, 2),
-                    prediccion_semanal=round(ps, 2),
-                    prediccion_mensual=round(pm, 2),
-                    predicciones=preds,
-                    predicciones_upper=pu,
-                    predicciones_lower=pl,
-                    mape=mape,
-                    wape=wape,
+        # Grupos armados con model_construct: cifras y filas ya calculadas
+        grupos: Dict[str, PrediccionGrupoResponse] = {}
+        for nombre_grupo, ventas_grupo_total, pronostico in zip(series, totales_grupo, pronosticos):
+            if pronostico is not None:
+                grupos[nombre_grupo] = PrediccionGrupoResponse.model_construct(
+                    venta_diaria_promedio=round(pronostico.venta_diaria_promedio, 2),
+                    prediccion_semanal=round(pronostico.prediccion_semanal, 2),
+                    prediccion_mensual=round(pronostico.prediccion_mensual, 2),
+                    predicciones=pronostico.predicciones,
+                    predicciones_upper=pronostico.predicciones_upper,
+                    predicciones_lower=pronostico.predicciones_lower,
+                    mape=pronostico.mape,
+                    wape=pronostico.wape,
                     fallback_usado=False,
                 )
             else:
@@ -387,15 +449,14 @@ class PrediccionesService:
                 ps_fb = pred_global.prediccion_semanal * participacion
                 pm_fb = pred_global.prediccion_mensual * participacion
                 preds_fb = [
-                    VentaDiariaResponse(
-                        fecha=p.fecha,
-                        ventas=round(p.ventas * participacion, 2),
+                    VentaDiariaResponse.model_construct(fecha=fecha, ventas=ventas)
+                    for fecha, ventas in zip(
+                        fechas_global, np.round(ventas_global * participacion, 2).tolist()
                     )
-                    for p in pred_global.predicciones
                 ]
-                pu_fb = [round(x * participacion, 2) for x in pred_global.predicciones_upper]
-                pl_fb = [round(x * participacion, 2) for x in pred_global.predicciones_lower]
-                grupos[nombre_grupo] = PrediccionGrupoResponse(
+                pu_fb = np.round(upper_global * participacion, 2).tolist()
+                pl_fb = np.round(lower_global * participacion, 2).tolist()
+                grupos[nombre_grupo] = PrediccionGrupoResponse.model_construct(
                     venta_diaria_promedio=vd_fb,
                     prediccion_semanal=ps_fb,
                     prediccion_mensual=pm_fb,
@@ -413,7 +474,7 @@ class PrediccionesService:
         self, filters: FilterParams, semanas: int = 8
     ) -> dict:
         """Backtesting rolling: WAPE/MAPE sobre últimos N semanas (walk-forward)."""
-        ventas, _ = await self.ventas_service.get_ventas(filters)
+        filas = await self.ventas_service.get_serie_diaria(filters)
         empty = {
             "semanas": 0,
             "wape_promedio": None,
@@ -423,36 +484,34 @@ class PrediccionesService:
             "bias_pct_promedio": None,
             "detalle": [],
         }
-        if not ventas:
-            return empty
-
-        ventas_dia: Dict[date, float] = {}
-        for v in ventas:
-            f = v.fecha_venta
-            ventas_dia[f] = ventas_dia.get(f, 0) + (v.total_venta or 0)
-        fechas_ord = sorted(ventas_dia.keys())
-        if len(fechas_ord) < 14:  # Mínimo 2 semanas
+        if len(filas) < 14:  # Mínimo 2 semanas
             return empty
 
+        # Índice de días de la semana una sola vez; cada corte solo ajusta
+        # tendencia + estacionalidad y proyecta 7 días (sin banda ni métricas)
+        valores_arr = np.fromiter((fila[2] for fila in filas), dtype=float, count=len(filas))
+        dias_semana = self._indice_dias_semana([fila[1] for fila in filas])
         resultados = []
         for i in range(semanas):
             # Holdout: última semana de la ventana
-            corte = len(fechas_ord) - 7 * (i + 1)
+            corte = len(filas) - 7 * (i + 1)
             if corte < 7:
                 break
-            fechas_train = fechas_ord[:corte]
-            fechas_test = fechas_ord[corte : corte + 7]
-            valores_train = [ventas_dia[f] for f in fechas_train]
-            valores_test = [ventas_dia[f] for f in fechas_test]
-            res = self._calcular_prediccion_para_serie(fechas_train, valores_train)
-            if res is None:
-                continue
-            _, _, _, preds, _, _, _, _ = res
-            pred_valores = [p.ventas for p in preds][:7]
-            if len(pred_valores) < 7 or len(valores_test) < 7:
-                continue
-            pred_arr = np.array(pred_valores[: len(valores_test)])
-            real_arr = np.array(valores_test)
+            valores_train = valores_arr[:corte]
+            pendiente, intercepto = self._regresion_lineal_ponderada(valores_train)
+            factores = self._calcular_estacionalidad_semanal(dias_semana[:corte], valores_train)
+            # Redondeado igual que las predicciones publicadas
+            pred_arr = np.round(
+                self._proyectar(
+                    pendiente,
+                    intercepto,
+                    factores,
+                    np.arange(corte, corte + 7, dtype=float),
+                    self._dias_semana_siguientes(dias_semana[corte - 1], 7),
+                ),
+                2,
+            )
+            real_arr = valores_arr[corte : corte + 7]
             total_real = float(np.sum(real_arr))
             if total_real > 0:
                 errores = real_arr - pred_arr
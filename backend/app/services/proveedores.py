@@ -9,7 +9,7 @@ from dataclasses import dataclass
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.schemas import FilterParams
+from app.models.schemas import EstadoStock, FilterParams
 
 
 # Constantes para cálculo de stock
@@ -72,13 +72,15 @@ class ProveedoresService:
         result = await self.db.execute(text(query), params)
         rows = result.fetchall()
         
+        # Alertas de stock de todos los proveedores en una sola consulta agregada
+        alertas_por_proveedor = await self._alertas_por_proveedor()
+        sin_alertas = {"criticos": 0, "bajos": 0}
+        
         proveedores = []
         for row in rows:
             row_dict = row._asdict()
             proveedor_name = row_dict["proveedor"]
-            
-            # Obtener alertas de stock para este proveedor
-            alertas = await self._get_alertas_stock_proveedor(proveedor_name)
+            alertas = alertas_por_proveedor.get(proveedor_name, sin_alertas)
             
             proveedores.append({
                 "proveedor": proveedor_name,
@@ -98,46 +100,46 @@ class ProveedoresService:
         
         return proveedores
     
+    async def _alertas_por_proveedor(self) -> Dict[Optional[str], Dict[str, int]]:
+        """Conteo de alertas de stock REAL de todos los proveedores, agregado en SQL."""
+        from app.services.inventario import InventarioService
+        
+        try:
+            return await InventarioService(self.db).get_alertas_por_proveedor()
+        except Exception:
+            return {}
+    
     async def _get_alertas_stock_proveedor(self, proveedor: str) -> Dict[str, int]:
-        """Obtiene conteo de alertas de stock REAL para un proveedor."""
+        """Obtiene conteo de alertas de stock REAL para un proveedor (índice cacheado)."""
         from app.services.inventario import InventarioService
         
+        alertas = {"criticos": 0, "bajos": 0}
         try:
-            inventario_service = InventarioService(self.db)
-            productos = await inventario_service.get_inventario_completo()
-            
-            # Filtrar por proveedor
-            productos_proveedor = [p for p in productos if p.get("proveedor") == proveedor]
-            
-            criticos = len([p for p in productos_proveedor if p["estado_stock"] == "🔴 Crítico"])
-            bajos = len([p for p in productos_proveedor if p["estado_stock"] == "🟠 Bajo"])
-            
-            return {"criticos": criticos, "bajos": bajos}
+            por_proveedor = await InventarioService(self.db).get_productos_por_proveedor()
         except Exception:
-            return {"criticos": 0, "bajos": 0}
+            return alertas
+        for p in por_proveedor.get(proveedor, []):
+            if p["estado_stock"] is EstadoStock.CRITICO:
+                alertas["criticos"] += 1
+            elif p["estado_stock"] is EstadoStock.BAJO:
+                alertas["bajos"] += 1
+        return alertas
     
     async def get_stock_proveedor(self, proveedor: str) -> List[Dict[str, Any]]:
         """Obtiene estado de stock REAL de todos los productos de un proveedor."""
-        from app.services.inventario import InventarioService
+        from app.services.inventario import InventarioService, redondear_producto
         
         inventario_service = InventarioService(self.db)
-        productos = await inventario_service.get_inventario_completo()
-        
-        # Filtrar por proveedor
-        productos_proveedor = [p for p in productos if p.get("proveedor") == proveedor]
-        
-        # Ordenar: primero críticos, luego bajos, luego por venta
-        def sort_key(p):
-            if p["estado_stock"] == "🔴 Crítico":
-                return (0, -p.get("venta_diaria", 0))
-            elif p["estado_stock"] == "🟠 Bajo":
-                return (1, -p.get("venta_diaria", 0))
-            elif p["estado_stock"] == "🟢 Normal":
-                return (2, -p.get("venta_diaria", 0))
-            else:
-                return (3, -p.get("venta_diaria", 0))
-        
-        productos_proveedor.sort(key=sort_key)
+        por_proveedor = await inventario_service.get_productos_por_proveedor()
+        # Ordenar: primero críticos, luego bajos, normales y exceso; dentro de
+        # cada estado, por venta. Se publica redondeado y con etiqueta de estado.
+        productos_proveedor = [
+            redondear_producto(p)
+            for p in sorted(
+                por_proveedor.get(proveedor, []),
+                key=lambda p: (p["estado_stock"], -p.get("venta_diaria", 0)),
+            )
+        ]
         
         # Calcular cantidad sugerida a comprar
         resultado = []
@@ -173,17 +175,16 @@ class ProveedoresService:
         productos = await self.get_stock_proveedor(proveedor)
         
         # Filtrar solo productos que necesitan reabastecimiento (crítico o bajo)
-        productos_a_comprar = [
-            p for p in productos 
-            if p["estado"] in ["🔴 Crítico", "🟠 Bajo"] or p["cantidad_sugerida"] > 0
-        ]
-        
-        # Calcular totales
-        total_unidades = sum(p["cantidad_sugerida"] for p in productos_a_comprar)
-        total_inversion = sum(
-            p["cantidad_sugerida"] * (p["precio_compra"] or p["precio_venta"] * 0.7)
-            for p in productos_a_comprar
-        )
+        # y acumular totales en la misma pasada
+        en_riesgo = (EstadoStock.CRITICO.label, EstadoStock.BAJO.label)
+        productos_a_comprar = []
+        total_unidades = 0
+        total_inversion = 0.0
+        for p in productos:
+            if p["estado"] in en_riesgo or p["cantidad_sugerida"] > 0:
+                productos_a_comprar.append(p)
+                total_unidades += p["cantidad_sugerida"]
+                total_inversion += p["cantidad_sugerida"] * (p["precio_compra"] or p["precio_venta"] * 0.7)
         
         return {
             "proveedor": proveedor,
@@ -212,15 +213,23 @@ class ProveedoresService:
         margen_prom = metricas.get("margen_porcentaje_promedio") or 0
         score_margen = min(100, max(0, margen_prom * 2.5))  # 40% margen = 100 puntos
         
+        # Una sola pasada: productos activos y conteo por estado de stock
+        critico, bajo = EstadoStock.CRITICO.label, EstadoStock.BAJO.label
+        productos_activos = productos_criticos = productos_bajos = 0
+        for p in productos_stock:
+            if p["venta_diaria"] > 0:
+                productos_activos += 1
+            if p["estado"] == critico:
+                productos_criticos += 1
+            elif p["estado"] == bajo:
+                productos_bajos += 1
+        
         # 2. Score de Rotación (25%) - Basado en ventas promedio
-        productos_activos = len([p for p in productos_stock if p["venta_diaria"] > 0])
         total_productos = len(productos_stock)
         ratio_rotacion = productos_activos / total_productos if total_productos > 0 else 0
         score_rotacion = ratio_rotacion * 100
         
         # 3. Score de Stock (25%) - Productos sin stockout
-        productos_criticos = len([p for p in productos_stock if "Crítico" in p["estado"]])
-        productos_bajos = len([p for p in productos_stock if "Bajo" in p["estado"]])
         ratio_stock_sano = 1 - (productos_criticos * 2 + productos_bajos) / max(1, total_productos)
         score_stock = max(0, ratio_stock_sano * 100)
         
@@ -89,10 +89,38 @@ class VendedoresService:
         """Obtiene detalle de un vendedor específico."""
         ventas, _ = await self.ventas_service.get_ventas(filters)
 
-        # Filtrar por vendedor
-        ventas_vendedor = [v for v in ventas if v.vendedor == nombre]
+        # Una sola pasada: totales del equipo por vendedor y, para el vendedor
+        # pedido, sumas y desgloses por día, producto ([total_venta, cantidad])
+        # y método de pago
+        ventas_por_vendedor: dict = {}
+        ventas_dia: dict = {}
+        productos: dict = {}
+        metodos: dict = {}
+        ventas_totales = precio_total = margen_total = 0
+        n_ventas = 0
+        for v in ventas:
+            vendedor = v.vendedor
+            total_venta = v.total_venta
+            if vendedor:
+                ventas_por_vendedor[vendedor] = ventas_por_vendedor.get(vendedor, 0) + total_venta
+            if vendedor != nombre:
+                continue
+            n_ventas += 1
+            ventas_totales += total_venta
+            precio_total += v.precio
+            if v.total_margen:
+                margen_total += v.total_margen
+            fecha = str(v.fecha_venta)
+            ventas_dia[fecha] = ventas_dia.get(fecha, 0) + total_venta
+            producto = productos.get(v.nombre)
+            if producto is None:
+                producto = productos[v.nombre] = [0, 0]
+            producto[0] += total_venta
+            producto[1] += v.cantidad
+            if v.metodo:
+                metodos[v.metodo] = metodos.get(v.metodo, 0) + total_venta
 
-        if not ventas_vendedor:
+        if not n_ventas:
             return VendedorDetalleResponse(
                 vendedor=nombre,
                 ventas_totales=0,
@@ -106,23 +134,13 @@ class VendedoresService:
             )
 
         # Calcular métricas
-        ventas_totales = sum(v.total_venta for v in ventas_vendedor)
-        productos_unicos = len(set(v.nombre for v in ventas_vendedor))
-        ticket_promedio = sum(v.precio for v in ventas_vendedor) / len(ventas_vendedor)
-
-        margen_total = sum(v.total_margen for v in ventas_vendedor if v.total_margen)
+        productos_unicos = len(productos)
+        ticket_promedio = precio_total / n_ventas
         margen_porcentaje = (
             (margen_total / ventas_totales * 100) if ventas_totales > 0 else 0
         )
 
-        # Calcular delta vs promedio del equipo
-        ventas_por_vendedor: dict = {}
-        for v in ventas:
-            if v.vendedor:
-                ventas_por_vendedor[v.vendedor] = (
-                    ventas_por_vendedor.get(v.vendedor, 0) + v.total_venta
-                )
-
+        # Delta vs promedio del equipo
         promedio_equipo = (
             sum(ventas_por_vendedor.values()) / len(ventas_por_vendedor)
             if ventas_por_vendedor
@@ -135,45 +153,24 @@ class VendedoresService:
         )
 
         # Ventas diarias
-        ventas_dia: dict = {}
-        for v in ventas_vendedor:
-            fecha = str(v.fecha_venta)
-            if fecha not in ventas_dia:
-                ventas_dia[fecha] = 0
-            ventas_dia[fecha] += v.total_venta
-
         ventas_diarias = [
             {"fecha": fecha, "total_venta": round(total, 2)}
             for fecha, total in sorted(ventas_dia.items())
         ]
 
         # Top productos
-        productos: dict = {}
-        for v in ventas_vendedor:
-            if v.nombre not in productos:
-                productos[v.nombre] = {"total_venta": 0, "cantidad": 0}
-            productos[v.nombre]["total_venta"] += v.total_venta
-            productos[v.nombre]["cantidad"] += v.cantidad
-
         top_productos = [
             {
                 "nombre": nombre_prod,
-                "total_venta": round(data["total_venta"], 2),
-                "cantidad": data["cantidad"],
+                "total_venta": round(total_venta, 2),
+                "cantidad": cantidad,
             }
-            for nombre_prod, data in sorted(
-                productos.items(), key=lambda x: x[1]["total_venta"], reverse=True
+            for nombre_prod, (total_venta, cantidad) in sorted(
+                productos.items(), key=lambda x: x[1][0], reverse=True
             )[:10]
         ]
 
         # Métodos de pago
-        metodos: dict = {}
-        for v in ventas_vendedor:
-            if v.metodo:
-                if v.metodo not in metodos:
-                    metodos[v.metodo] = 0
-                metodos[v.metodo] += v.total_venta
-
         metodos_pago = [
             {"metodo": metodo, "total_venta": round(total, 2)}
             for metodo, total in metodos.items()
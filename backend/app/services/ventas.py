@@ -2,12 +2,14 @@
 Servicio de ventas - Lógica de negocio principal.
 """
 from datetime import date, timedelta
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import pandas as pd
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.cache import _cache_key
+from app.database import relacion_existe
 from app.models.schemas import (
     FilterParams,
     VentaBase,
@@ -16,14 +18,138 @@ from app.models.schemas import (
     TopProductoResponse,
     TopVendedorResponse,
     FiltrosOpciones,
+    MargenProductoResponse,
 )
 
 
+# Ventas de 30 a 60 días atrás (período anterior)
+_PERIODO_ANTERIOR_SQL = text("""
+    SELECT 
+        f.nombre,
+        f.precio,
+        f.cantidad,
+        f.metodo,
+        f.vendedor,
+        f.fecha as fecha_venta,
+        i.familia,
+        (f.precio * f.cantidad) as total_venta
+    FROM facturas f
+    LEFT JOIN items i ON f.item_id = i.id
+    WHERE f.fecha BETWEEN :fecha_inicio AND :fecha_fin
+""")
+
+
+# Valores disponibles para cada filtro
+_FILTROS_OPCIONES_SQL = text("""
+    SELECT 
+        ARRAY_AGG(DISTINCT nombre) as productos,
+        ARRAY_AGG(DISTINCT vendedor) FILTER (WHERE vendedor IS NOT NULL) as vendedores,
+        ARRAY_AGG(DISTINCT familia) FILTER (WHERE familia IS NOT NULL) as familias,
+        ARRAY_AGG(DISTINCT metodo) FILTER (WHERE metodo IS NOT NULL) as metodos,
+        ARRAY_AGG(DISTINCT proveedor_moda) FILTER (WHERE proveedor_moda IS NOT NULL) as proveedores,
+        MIN(precio) as precio_min,
+        MAX(precio) as precio_max,
+        MIN(cantidad) as cantidad_min,
+        MAX(cantidad) as cantidad_max,
+        MIN(fecha_venta) as fecha_min,
+        MAX(fecha_venta) as fecha_max
+    FROM reportes_ventas_30dias
+""")
+
+
+# Líneas con costo (precio_promedio_compra distinto de NULL y de 0) con las
+# reglas de _rows_to_ventas: cantidad truncada a entero, margen unitario
+_MARGEN_LINEAS_SQL = """
+    SELECT
+        nombre,
+        COALESCE(NULLIF(familia, ''), 'Sin familia') AS familia,
+        COALESCE(precio, 0) - precio_promedio_compra AS margen,
+        TRUNC(COALESCE(cantidad, 0)) AS cantidad,
+        COALESCE(precio, 0) * TRUNC(COALESCE(cantidad, 0)) AS total_venta
+    FROM reportes_ventas_30dias
+    {where}
+      AND NULLIF(precio_promedio_compra, 0) IS NOT NULL
+"""
+
+# Totales del período, por familia y por producto en una sola pasada sobre las
+# líneas (GROUPING SETS). nivel = GROUPING(familia, nombre): 1 familia,
+# 2 producto, 3 período. De los productos solo salen top (lista 1) y bottom
+# (lista 2): ORDER BY ... LIMIT se resuelve con un top-N heapsort acotado en
+# vez de ordenar todos los productos. Con :limit productos o menos ambas listas
+# son el catálogo completo; no se deriva bottom invirtiendo top porque los
+# empates en margen_total van por nombre ascendente en las dos.
+_NIVEL_TOTAL = 3
+_LISTA_TOP, _LISTA_BOTTOM = 1, 2
+
+_MARGENES_SQL = """
+    WITH lineas AS ({lineas}),
+    agrupado AS (
+        SELECT
+            familia,
+            nombre,
+            GROUPING(familia, nombre) AS nivel,
+            COUNT(*) AS lineas,
+            AVG(margen) AS margen_promedio,
+            SUM(margen * cantidad) AS margen_total,
+            SUM(total_venta) AS ventas_totales,
+            SUM(cantidad) AS cantidad_total,
+            COUNT(*) FILTER (WHERE margen > 0) AS rentables,
+            COUNT(*) FILTER (WHERE margen < 0) AS no_rentables
+        FROM lineas
+        GROUP BY GROUPING SETS ((familia), (nombre), ())
+    )
+    SELECT * FROM (
+        (SELECT 1 AS lista, * FROM agrupado WHERE nivel = 2
+         ORDER BY margen_total DESC, nombre LIMIT :limit)
+        UNION ALL
+        (SELECT 2 AS lista, * FROM agrupado WHERE nivel = 2
+         ORDER BY margen_total ASC, nombre LIMIT :limit)
+        UNION ALL
+        SELECT 0 AS lista, * FROM agrupado WHERE nivel <> 2
+    ) filas
+    ORDER BY lista, CASE WHEN lista = 2 THEN margen_total END, margen_total DESC, familia, nombre
+"""
+
+
+# Rollup diario (migraciones 008 y 011, con las reglas de línea de
+# _rows_to_ventas). Guarda totales por grupo, no líneas, así que no admite
+# filtros por precio o cantidad de línea.
+_AGREGADO_SQL = """
+    SELECT {dimension} AS clave, SUM(ingresos) AS total_venta, SUM(cant) AS cantidad
+    FROM mv_ventas_agg
+    {where}
+    GROUP BY {dimension}
+"""
+
+# Total y líneas por día (y por grupo si {clave} no es NULL), con la cantidad
+# truncada a entero como _rows_to_ventas. Serie de entrada de predicciones.
+_VENTAS_POR_DIA_SQL = """
+    SELECT
+        {clave} AS clave,
+        fecha_venta,
+        SUM(COALESCE(precio, 0) * TRUNC(COALESCE(cantidad, 0))) AS total_venta,
+        COUNT(*) AS lineas
+    FROM reportes_ventas_30dias
+    {where}
+      AND fecha_venta IS NOT NULL
+    GROUP BY {agrupar}
+    ORDER BY {agrupar}
+"""
+
+_REFRESCAR_AGREGADO_SQL = text("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_ventas_agg")
+
+# None = aún no probado; False = la vista no existe en esta base
+_agregado_disponible: Optional[bool] = None
+
+
 class VentasService:
     """Servicio para operaciones de ventas."""
     
     def __init__(self, db: AsyncSession):
         self.db = db
+        # Líneas ya leídas por get_ventas en esta sesión (una por request): los
+        # servicios que comparten esta instancia no repiten la consulta
+        self._ventas_leidas: Dict[str, Tuple[List[VentaBase], int]] = {}
     
     def _build_where_clause(self, filters: FilterParams) -> Tuple[str, dict]:
         """Construye la cláusula WHERE y parámetros."""
@@ -113,7 +239,7 @@ class VentasService:
         """Convierte rows de DB a lista de VentaBase."""
         ventas = []
         for row in rows:
-            row_dict = row._asdict()
+            row_dict = row._mapping
             precio = float(row_dict.get("precio") or 0)
             cantidad = int(row_dict.get("cantidad") or 0)
             precio_compra = row_dict.get("precio_promedio_compra")
@@ -141,6 +267,129 @@ class VentasService:
             ))
         return ventas
     
+    async def _agregar_por(self, filters: FilterParams, dimension: str) -> Optional[List[tuple]]:
+        """
+        (clave, total_venta, cantidad) por ``dimension`` desde mv_ventas_agg.
+
+        Devuelve None si el filtro acota precio/cantidad o la vista no existe;
+        el llamador recurre entonces a las líneas de get_ventas.
+        """
+        global _agregado_disponible
+        if _agregado_disponible is False or any(
+            v is not None
+            for v in (filters.precio_min, filters.precio_max, filters.cantidad_min, filters.cantidad_max)
+        ):
+            return None
+        if _agregado_disponible is None:
+            # Base sin la migración 008: se prueba una vez, sin consultar la vista
+            _agregado_disponible = await relacion_existe(self.db, "mv_ventas_agg")
+            if not _agregado_disponible:
+                return None
+        where, params = self._build_where_clause(filters)
+        if dimension != "nombre":
+            where += f" AND NULLIF({dimension}::text, '') IS NOT NULL"
+        result = await self.db.execute(
+            text(_AGREGADO_SQL.format(dimension=dimension, where=where)), params
+        )
+        return [
+            (clave, float(total or 0), int(cantidad or 0))
+            for clave, total, cantidad in result.fetchall()
+        ]
+
+    async def refrescar_agregados(self) -> None:
+        """Recalcula mv_ventas_agg sin bloquear lecturas (lo programa app.main)."""
+        global _agregado_disponible
+        _agregado_disponible = await relacion_existe(self.db, "mv_ventas_agg")
+        if not _agregado_disponible:
+            return
+        await self.db.execute(_REFRESCAR_AGREGADO_SQL)
+        await self.db.commit()
+
+    async def get_margenes_agregados(
+        self, filters: FilterParams, limit: int = 10
+    ) -> Tuple[Optional[dict], List[dict], List[dict], List[dict]]:
+        """
+        Totales de margen del período, por familia y top/bottom ``limit``
+        productos por margen total, en una sola consulta.
+
+        Devuelve (totales, familias, top, bottom); (None, [], [], []) si no hay
+        líneas con costo.
+        """
+        where, params = self._build_where_clause(filters)
+        query = _MARGENES_SQL.format(lineas=_MARGEN_LINEAS_SQL.format(where=where))
+        result = await self.db.execute(text(query), {**params, "limit": limit})
+
+        def producto(r) -> dict:
+            return {
+                "nombre": r.nombre,
+                "margen": round(float(r.margen_promedio or 0), 2),
+                "total_margen": round(float(r.margen_total or 0), 2),
+                "cantidad": int(r.cantidad_total or 0),
+            }
+
+        totales = None
+        familias: List[dict] = []
+        top: List[dict] = []
+        bottom: List[dict] = []
+        for r in result.fetchall():
+            if r.lista == _LISTA_TOP:
+                top.append(producto(r))
+            elif r.lista == _LISTA_BOTTOM:
+                bottom.append(producto(r))
+            elif r.nivel == _NIVEL_TOTAL:
+                totales = r._mapping
+            else:
+                familias.append(dict(r._mapping))
+        if totales is None or not totales["lineas"]:
+            return None, [], [], []
+        return dict(totales), familias, top, bottom
+
+    async def get_muestra_margenes(
+        self, filters: FilterParams, limit: int = 200
+    ) -> List[MargenProductoResponse]:
+        """
+        Muestra aleatoria uniforme de ``limit`` líneas con costo para el scatter.
+        ORDER BY random() con LIMIT se resuelve con un top-N heapsort de memoria
+        acotada, es decir, una sola pasada como un muestreo de reservorio.
+
+        Lee solo las columnas del scatter y arma cada punto en la misma pasada,
+        con las reglas de margen de _rows_to_ventas, sin pasar por VentaBase. Los
+        campos ya salen con su tipo final, así que se construyen sin validar.
+        """
+        where, params = self._build_where_clause(filters)
+        query = f"""
+            SELECT nombre, precio, cantidad, precio_promedio_compra, vendedor
+            FROM reportes_ventas_30dias
+            {where}
+              AND NULLIF(precio_promedio_compra, 0) IS NOT NULL
+            ORDER BY random()
+            LIMIT :limit
+        """
+        result = await self.db.execute(text(query), {**params, "limit": limit})
+        muestra = []
+        for row in result.fetchall():
+            precio = float(row.precio or 0)
+            cantidad = int(row.cantidad or 0)
+            precio_compra = float(row.precio_promedio_compra)
+            margen = precio - precio_compra
+            muestra.append(MargenProductoResponse.model_construct(
+                nombre=row.nombre or "",
+                precio=precio,
+                precio_promedio_compra=precio_compra,
+                cantidad=cantidad,
+                margen=margen,
+                margen_porcentaje=round(margen / precio * 100, 2) if margen and precio else None,
+                total_margen=(margen * cantidad) if margen else None,
+                vendedor=row.vendedor,
+            ))
+        return muestra
+
+    async def hay_ventas(self, filters: FilterParams) -> bool:
+        """Indica si existe al menos una venta con los filtros dados."""
+        where, params = self._build_where_clause(filters)
+        query = f"SELECT 1 FROM reportes_ventas_30dias {where} LIMIT 1"
+        return (await self.db.execute(text(query), params)).fetchone() is not None
+
     async def get_ventas(
         self,
         filters: FilterParams,
@@ -148,10 +397,18 @@ class VentasService:
     ) -> Tuple[List[VentaBase], int]:
         """Obtiene ventas con filtros aplicados (sin paginación).
         
+        El resultado se reutiliza para los mismos filtros dentro de la instancia;
+        los llamadores no deben modificar la lista devuelta.
+        
         Args:
             filters: Parámetros de filtro.
             max_rows: Límite máximo de filas para prevenir OOM. Default 10000.
         """
+        clave = _cache_key("ventas", filters, str(max_rows))
+        leidas = self._ventas_leidas.get(clave)
+        if leidas is not None:
+            return leidas
+        
         where, params = self._build_where_clause(filters)
         
         query = f"""
@@ -166,30 +423,79 @@ class VentasService:
         rows = result.fetchall()
         
         ventas = self._rows_to_ventas(rows)
+        self._ventas_leidas[clave] = (ventas, len(ventas))
         return ventas, len(ventas)
     
+    async def get_serie_diaria(
+        self, filters: FilterParams, dimension: Optional[str] = None
+    ) -> List[Tuple[Optional[str], date, float, int]]:
+        """(clave, fecha, total_venta, líneas) por día, agregado en la base.
+
+        Con ``dimension`` ("familia" o "nombre") agrupa además por esa columna
+        (vacío y NULL juntos, clave None) y ordena por clave y fecha; sin ella la
+        clave es None y hay una fila por fecha. Usa todas las líneas del filtro,
+        sin el tope de filas de get_ventas.
+        """
+        where, params = self._build_where_clause(filters)
+        if dimension is None:
+            clave, agrupar = "NULL", "fecha_venta"
+        else:
+            clave, agrupar = f"NULLIF({dimension}, '')", "clave, fecha_venta"
+        query = _VENTAS_POR_DIA_SQL.format(clave=clave, where=where, agrupar=agrupar)
+        result = await self.db.execute(text(query), params)
+        return [
+            (clave, fecha, float(total or 0), int(lineas))
+            for clave, fecha, total, lineas in result.fetchall()
+        ]
+    
+    async def get_rango_fechas(
+        self, filters: FilterParams
+    ) -> Tuple[Optional[date], Optional[date]]:
+        """Primera y última fecha con ventas para los filtros dados."""
+        where, params = self._build_where_clause(filters)
+        query = f"SELECT MIN(fecha_venta), MAX(fecha_venta) FROM reportes_ventas_30dias {where}"
+        row = (await self.db.execute(text(query), params)).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+    
+    async def get_totales_hoy_ayer(self, filters: FilterParams) -> dict:
+        """Total y transacciones de hoy y total de ayer en una sola pasada, con
+        las reglas de línea de _rows_to_ventas (cantidad truncada, precio NULL = 0).
+
+        Ignora el rango de fechas de ``filters`` (igual que get_metricas con las
+        fechas sustituidas por hoy/ayer) y respeta el resto de filtros.
+        """
+        where, params = self._build_where_clause(
+            filters.model_copy(update={"fecha_inicio": None, "fecha_fin": None})
+        )
+        hoy = date.today()
+        params["hoy"] = hoy
+        params["ayer"] = hoy - timedelta(days=1)
+        query = f"""
+            SELECT
+                COALESCE(SUM(COALESCE(precio, 0) * TRUNC(COALESCE(cantidad, 0)))
+                    FILTER (WHERE fecha_venta = :hoy), 0) AS total_hoy,
+                COUNT(*) FILTER (WHERE fecha_venta = :hoy) AS tx_hoy,
+                COALESCE(SUM(COALESCE(precio, 0) * TRUNC(COALESCE(cantidad, 0)))
+                    FILTER (WHERE fecha_venta = :ayer), 0) AS total_ayer
+            FROM reportes_ventas_30dias
+            {where} AND fecha_venta IN (:hoy, :ayer)
+        """
+        row = (await self.db.execute(text(query), params)).fetchone()
+        if not row:
+            return {"total_hoy": 0.0, "tx_hoy": 0, "total_ayer": 0.0}
+        return {
+            "total_hoy": float(row.total_hoy or 0),
+            "tx_hoy": int(row.tx_hoy or 0),
+            "total_ayer": float(row.total_ayer or 0),
+        }
+    
     async def get_periodo_anterior(self) -> pd.DataFrame:
         """Obtiene datos del período anterior (30-60 días atrás)."""
         fecha_inicio = date.today() - timedelta(days=60)
         fecha_fin = date.today() - timedelta(days=31)
         
-        query = """
-            SELECT 
-                f.nombre,
-                f.precio,
-                f.cantidad,
-                f.metodo,
-                f.vendedor,
-                f.fecha as fecha_venta,
-                i.familia,
-                (f.precio * f.cantidad) as total_venta
-            FROM facturas f
-            LEFT JOIN items i ON f.item_id = i.id
-            WHERE f.fecha BETWEEN :fecha_inicio AND :fecha_fin
-        """
-        
         result = await self.db.execute(
-            text(query),
+            _PERIODO_ANTERIOR_SQL,
             {"fecha_inicio": fecha_inicio, "fecha_fin": fecha_fin}
         )
         rows = result.fetchall()
@@ -197,8 +503,7 @@ class VentasService:
         if not rows:
             return pd.DataFrame()
         
-        data = [row._asdict() for row in rows]
-        return pd.DataFrame(data)
+        return pd.DataFrame(rows, columns=list(result.keys()))
     
     async def get_metricas(self, filters: FilterParams) -> MetricasResponse:
         """Calcula métricas principales con comparación."""
@@ -263,14 +568,34 @@ class VentasService:
         if not ventas:
             return alertas
         
+        # Una sola pasada: conteos y pérdida sobre todas las líneas, solo las
+        # primeras 10 de cada alerta se guardan para el detalle
+        negativos, margen_bajo = [], []
+        n_negativos = n_margen_bajo = 0
+        total_perdida = 0
+        ventas_por_vendedor = {}
+        for v in ventas:
+            margen = v.margen
+            if margen is not None:
+                if margen < 0:
+                    n_negativos += 1
+                    if v.total_margen:
+                        total_perdida += v.total_margen
+                    if n_negativos <= 10:
+                        negativos.append(v)
+                elif margen > 0 and v.margen_porcentaje is not None and v.margen_porcentaje < 10:
+                    n_margen_bajo += 1
+                    if n_margen_bajo <= 10:
+                        margen_bajo.append(v)
+            if v.vendedor:
+                ventas_por_vendedor[v.vendedor] = ventas_por_vendedor.get(v.vendedor, 0) + v.total_venta
+        
         # Alerta: Productos con margen negativo
-        negativos = [v for v in ventas if v.margen is not None and v.margen < 0]
         if negativos:
-            total_perdida = sum(v.total_margen for v in negativos if v.total_margen)
             alertas.append(AlertaResponse(
                 tipo="error",
                 icono="🚨",
-                titulo=f"{len(negativos)} ventas con margen negativo",
+                titulo=f"{n_negativos} ventas con margen negativo",
                 detalle=f"Pérdida total: ${abs(total_perdida):,.2f}",
                 datos=[{
                     "nombre": v.nombre,
@@ -278,33 +603,25 @@ class VentasService:
                     "precio_compra": v.precio_promedio_compra,
                     "margen": v.margen,
                     "cantidad": v.cantidad
-                } for v in negativos[:10]]
+                } for v in negativos]
             ))
         
         # Alerta: Margen bajo (<10%)
-        margen_bajo = [v for v in ventas 
-                       if v.margen is not None and v.margen > 0 
-                       and v.margen_porcentaje is not None and v.margen_porcentaje < 10]
         if margen_bajo:
             alertas.append(AlertaResponse(
                 tipo="warning",
                 icono="⚠️",
-                titulo=f"{len(margen_bajo)} ventas con margen menor al 10%",
+                titulo=f"{n_margen_bajo} ventas con margen menor al 10%",
                 detalle="Considera revisar los precios de estos productos",
                 datos=[{
                     "nombre": v.nombre,
                     "precio": v.precio,
                     "margen_porcentaje": v.margen_porcentaje,
                     "cantidad": v.cantidad
-                } for v in margen_bajo[:10]]
+                } for v in margen_bajo]
             ))
         
         # Alerta: Vendedores bajo rendimiento
-        ventas_por_vendedor = {}
-        for v in ventas:
-            if v.vendedor:
-                ventas_por_vendedor[v.vendedor] = ventas_por_vendedor.get(v.vendedor, 0) + v.total_venta
-        
         if ventas_por_vendedor:
             promedio = sum(ventas_por_vendedor.values()) / len(ventas_por_vendedor)
             bajo_rendimiento = {k: v for k, v in ventas_por_vendedor.items() if v < promedio * 0.5}
@@ -322,14 +639,18 @@ class VentasService:
     
     async def get_top_productos(self, filters: FilterParams, limit: int = 5) -> List[TopProductoResponse]:
         """Obtiene top productos más vendidos."""
-        ventas, _ = await self.get_ventas(filters)
-        
-        productos = {}
-        for v in ventas:
-            if v.nombre not in productos:
-                productos[v.nombre] = {"cantidad": 0, "total_venta": 0}
-            productos[v.nombre]["cantidad"] += v.cantidad
-            productos[v.nombre]["total_venta"] += v.total_venta
+        agregado = await self._agregar_por(filters, "nombre")
+        if agregado is not None:
+            productos = {k: {"cantidad": c, "total_venta": t} for k, t, c in agregado}
+        else:
+            ventas, _ = await self.get_ventas(filters)
+
+            productos = {}
+            for v in ventas:
+                if v.nombre not in productos:
+                    productos[v.nombre] = {"cantidad": 0, "total_venta": 0}
+                productos[v.nombre]["cantidad"] += v.cantidad
+                productos[v.nombre]["total_venta"] += v.total_venta
         
         sorted_productos = sorted(productos.items(), key=lambda x: x[1]["cantidad"], reverse=True)[:limit]
         
@@ -344,15 +665,19 @@ class VentasService:
     
     async def get_top_vendedores(self, filters: FilterParams, limit: int = 5) -> List[TopVendedorResponse]:
         """Obtiene top vendedores."""
-        ventas, _ = await self.get_ventas(filters)
-        
-        vendedores = {}
-        for v in ventas:
-            if v.vendedor:
-                if v.vendedor not in vendedores:
-                    vendedores[v.vendedor] = {"total_venta": 0, "cantidad": 0}
-                vendedores[v.vendedor]["total_venta"] += v.total_venta
-                vendedores[v.vendedor]["cantidad"] += v.cantidad
+        agregado = await self._agregar_por(filters, "vendedor")
+        if agregado is not None:
+            vendedores = {k: {"total_venta": t, "cantidad": c} for k, t, c in agregado}
+        else:
+            ventas, _ = await self.get_ventas(filters)
+
+            vendedores = {}
+            for v in ventas:
+                if v.vendedor:
+                    if v.vendedor not in vendedores:
+                        vendedores[v.vendedor] = {"total_venta": 0, "cantidad": 0}
+                    vendedores[v.vendedor]["total_venta"] += v.total_venta
+                    vendedores[v.vendedor]["cantidad"] += v.cantidad
         
         sorted_vendedores = sorted(vendedores.items(), key=lambda x: x[1]["total_venta"], reverse=True)[:limit]
         
@@ -367,23 +692,7 @@ class VentasService:
     
     async def get_filtros_opciones(self) -> FiltrosOpciones:
         """Obtiene opciones disponibles para filtros."""
-        query = """
-            SELECT 
-                ARRAY_AGG(DISTINCT nombre) as productos,
-                ARRAY_AGG(DISTINCT vendedor) FILTER (WHERE vendedor IS NOT NULL) as vendedores,
-                ARRAY_AGG(DISTINCT familia) FILTER (WHERE familia IS NOT NULL) as familias,
-                ARRAY_AGG(DISTINCT metodo) FILTER (WHERE metodo IS NOT NULL) as metodos,
-                ARRAY_AGG(DISTINCT proveedor_moda) FILTER (WHERE proveedor_moda IS NOT NULL) as proveedores,
-                MIN(precio) as precio_min,
-                MAX(precio) as precio_max,
-                MIN(cantidad) as cantidad_min,
-                MAX(cantidad) as cantidad_max,
-                MIN(fecha_venta) as fecha_min,
-                MAX(fecha_venta) as fecha_max
-            FROM reportes_ventas_30dias
-        """
-        
-        result = await self.db.execute(text(query))
+        result = await self.db.execute(_FILTROS_OPCIONES_SQL)
         row = result.fetchone()
         
         if not row:
@@ -419,15 +728,19 @@ class VentasService:
     
     async def get_ventas_por_dia(self, filters: FilterParams) -> List[dict]:
         """Obtiene ventas agrupadas por día."""
-        ventas, _ = await self.get_ventas(filters)
-        
-        ventas_dia = {}
-        for v in ventas:
-            fecha = v.fecha_venta
-            if fecha not in ventas_dia:
-                ventas_dia[fecha] = {"total_venta": 0, "cantidad": 0}
-            ventas_dia[fecha]["total_venta"] += v.total_venta
-            ventas_dia[fecha]["cantidad"] += v.cantidad
+        agregado = await self._agregar_por(filters, "fecha_venta")
+        if agregado is not None:
+            ventas_dia = {k: {"total_venta": t, "cantidad": c} for k, t, c in agregado}
+        else:
+            ventas, _ = await self.get_ventas(filters)
+
+            ventas_dia = {}
+            for v in ventas:
+                fecha = v.fecha_venta
+                if fecha not in ventas_dia:
+                    ventas_dia[fecha] = {"total_venta": 0, "cantidad": 0}
+                ventas_dia[fecha]["total_venta"] += v.total_venta
+                ventas_dia[fecha]["cantidad"] += v.cantidad
         
         return [
             {"fecha": str(fecha), "total_venta": round(data["total_venta"], 2), "cantidad": data["cantidad"]}
@@ -436,14 +749,18 @@ class VentasService:
     
     async def get_ventas_por_vendedor(self, filters: FilterParams) -> List[dict]:
         """Obtiene ventas agrupadas por vendedor."""
-        ventas, _ = await self.get_ventas(filters)
-        
-        vendedores = {}
-        for v in ventas:
-            if v.vendedor:
-                if v.vendedor not in vendedores:
-                    vendedores[v.vendedor] = 0
-                vendedores[v.vendedor] += v.total_venta
+        agregado = await self._agregar_por(filters, "vendedor")
+        if agregado is not None:
+            vendedores = {k: t for k, t, _ in agregado}
+        else:
+            ventas, _ = await self.get_ventas(filters)
+
+            vendedores = {}
+            for v in ventas:
+                if v.vendedor:
+                    if v.vendedor not in vendedores:
+                        vendedores[v.vendedor] = 0
+                    vendedores[v.vendedor] += v.total_venta
         
         sorted_vendedores = sorted(vendedores.items(), key=lambda x: x[1], reverse=True)[:10]
         
@@ -454,14 +771,18 @@ class VentasService:
     
     async def get_ventas_por_familia(self, filters: FilterParams) -> List[dict]:
         """Obtiene ventas agrupadas por familia."""
-        ventas, _ = await self.get_ventas(filters)
-        
-        familias = {}
-        for v in ventas:
-            if v.familia:
-                if v.familia not in familias:
-                    familias[v.familia] = 0
-                familias[v.familia] += v.total_venta
+        agregado = await self._agregar_por(filters, "familia")
+        if agregado is not None:
+            familias = {k: t for k, t, _ in agregado}
+        else:
+            ventas, _ = await self.get_ventas(filters)
+
+            familias = {}
+            for v in ventas:
+                if v.familia:
+                    if v.familia not in familias:
+                        familias[v.familia] = 0
+                    familias[v.familia] += v.total_venta
         
         return [
             {"familia": familia, "total_venta": round(total, 2)}
@@ -470,14 +791,18 @@ class VentasService:
     
     async def get_ventas_por_metodo(self, filters: FilterParams) -> List[dict]:
         """Obtiene ventas agrupadas por método de pago."""
-        ventas, _ = await self.get_ventas(filters)
-        
-        metodos = {}
-        for v in ventas:
-            if v.metodo:
-                if v.metodo not in metodos:
-                    metodos[v.metodo] = 0
-                metodos[v.metodo] += v.total_venta
+        agregado = await self._agregar_por(filters, "metodo")
+        if agregado is not None:
+            metodos = {k: t for k, t, _ in agregado}
+        else:
+            ventas, _ = await self.get_ventas(filters)
+
+            metodos = {}
+            for v in ventas:
+                if v.metodo:
+                    if v.metodo not in metodos:
+                        metodos[v.metodo] = 0
+                    metodos[v.metodo] += v.total_venta
         
         return [
             {"metodo": metodo, "total_venta": round(total, 2)}
@@ -486,13 +811,17 @@ class VentasService:
     
     async def get_top_productos_cantidad(self, filters: FilterParams, limit: int = 10) -> List[dict]:
         """Obtiene top productos por cantidad vendida."""
-        ventas, _ = await self.get_ventas(filters)
-        
-        productos = {}
-        for v in ventas:
-            if v.nombre not in productos:
-                productos[v.nombre] = 0
-            productos[v.nombre] += v.cantidad
+        agregado = await self._agregar_por(filters, "nombre")
+        if agregado is not None:
+            productos = {k: c for k, _, c in agregado}
+        else:
+            ventas, _ = await self.get_ventas(filters)
+
+            productos = {}
+            for v in ventas:
+                if v.nombre not in productos:
+                    productos[v.nombre] = 0
+                productos[v.nombre] += v.cantidad
         
         sorted_productos = sorted(productos.items(), key=lambda x: x[1], reverse=True)[:limit]
         
@@ -0,0 +1,77 @@
+"""
+Contador de consultas para detectar N+1 sin base de datos.
+
+Los tests no tienen PostgreSQL, así que en lugar de escuchar
+before_cursor_execute sobre un engine real se cuentan las sentencias que
+llegan a sesiones AsyncSession simuladas. Todas las sesiones del contador
+(la principal y las que abre su session_factory) comparten el registro.
+"""
+from typing import Any, Callable, List, Optional, Sequence
+from unittest.mock import MagicMock
+
+
+Responder = Callable[[Any, Any], Sequence[Any]]
+
+
+class _Cursor:
+    """AsyncResult mínimo de db.stream."""
+
+    def __init__(self, filas: Sequence[Any]):
+        self.filas = filas
+
+    async def __aiter__(self):
+        for fila in self.filas:
+            yield fila
+
+
+def _resultado(filas: Sequence[Any]) -> MagicMock:
+    result = MagicMock()
+    result.fetchall.return_value = list(filas)
+    result.fetchone.return_value = filas[0] if filas else None
+    result.scalar.return_value = None
+    result.__iter__.side_effect = lambda: iter(filas)
+    return result
+
+
+class QueryCounter:
+    """Registra cada execute/stream; ``responder(sql, params)`` da las filas de cada consulta."""
+
+    def __init__(self, responder: Optional[Responder] = None):
+        self.sentencias: List[Any] = []
+        self.responder: Responder = responder or (lambda sql, params: [])
+
+    @property
+    def count(self) -> int:
+        return len(self.sentencias)
+
+    def session(self) -> MagicMock:
+        db = MagicMock()
+
+        async def execute(sql, params=None, **kwargs):
+            self.sentencias.append(sql)
+            return _resultado(self.responder(sql, params))
+
+        async def stream(sql, params=None, **kwargs):
+            self.sentencias.append(sql)
+            return _Cursor(self.responder(sql, params))
+
+        async def noop(*args, **kwargs):
+            return None
+
+        db.execute = execute
+        db.stream = stream
+        db.rollback = noop
+        db.commit = noop
+        return db
+
+    def session_factory(self) -> Callable[[], Any]:
+        contador = self
+
+        class _Sesion:
+            async def __aenter__(self):
+                return contador.session()
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return _Sesion
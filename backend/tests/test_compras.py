@@ -0,0 +1,153 @@
+"""
+Tests de la aritmética vectorizada de reposición en ComprasService y de la
+clase ABC por producto.
+"""
+import sqlite3
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import numpy as np
+
+from app.models.schemas import FilterParams, Prioridad, SugerenciaCompraResponse
+from app.services.abc import ABCService
+from app.services.compras import _calcular_reposicion
+from app.services.ventas import VentasService
+from tests.query_counter import QueryCounter
+
+
+def _calcular(**kwargs):
+    base = dict(
+        venta_diaria=np.array([2.0]),
+        stock=np.array([10.0]),
+        variabilidad=np.array([0.0]),
+        cobertura_objetivo=np.array([30.0]),
+        lead_time=np.array([7.0]),
+        precio_compra=np.array([100.0]),
+        precio_venta=np.array([150.0]),
+        safety_dias_base=3,
+    )
+    base.update({k: np.array(v, dtype=float) if isinstance(v, list) else v for k, v in kwargs.items()})
+    return _calcular_reposicion(**base)
+
+
+class TestCalcularReposicion:
+    def test_cantidad_rop_costo_y_roi(self):
+        dias, cantidad, costo, rop, roi, _ = _calcular()
+        # objetivo = 2 × 30 × 1.1 = 66 → 66 − 10 = 56
+        assert dias[0] == 5.0
+        assert cantidad[0] == 56
+        assert costo[0] == 5600.0
+        # ROP = 2 × (7 + 3) = 20
+        assert rop[0] == 20
+        assert roi[0] == 56 * 50.0
+
+    def test_stock_suficiente_no_pide(self):
+        _, cantidad, costo, _, roi, _ = _calcular(stock=[500.0])
+        assert cantidad[0] == 0
+        assert costo[0] == 0
+        assert roi[0] == 0
+
+    def test_sin_venta_dias_stock_999(self):
+        dias, _, _, _, _, prioridad = _calcular(venta_diaria=[0.0])
+        assert dias[0] == 999.0
+        assert prioridad[0] == 3
+
+    def test_cortes_de_prioridad_inclusivos(self):
+        # dias_stock = stock / 1 → 3, 3.5, 7, 15, 16
+        *_, prioridad = _calcular(
+            venta_diaria=[1.0] * 5,
+            stock=[3.0, 3.5, 7.0, 15.0, 16.0],
+            variabilidad=[0.0] * 5,
+            cobertura_objetivo=[30.0] * 5,
+            lead_time=[7.0] * 5,
+            precio_compra=[1.0] * 5,
+            precio_venta=[1.0] * 5,
+        )
+        assert prioridad.tolist() == [0, 1, 1, 2, 3]
+
+    def test_margen_seguridad_acotado(self):
+        # variabilidad alta → margen tope 40%: 1 × 30 × 1.4 = 42
+        _, cantidad, _, rop, _, _ = _calcular(
+            venta_diaria=[1.0], stock=[0.0], variabilidad=[5.0]
+        )
+        assert cantidad[0] == 42
+        # safety = 3 × (1 + min(5, 1)) = 6 → ROP = 1 × (7 + 6)
+        assert rop[0] == 13
+
+
+class TestPrioridad:
+    def _sugerencia(self, prioridad):
+        return SugerenciaCompraResponse(
+            nombre="X", proveedor=None, familia=None, cantidad_disponible=0,
+            venta_diaria=1.0, dias_stock=1.0, cantidad_sugerida=1,
+            precio_compra=None, costo_estimado=0.0, prioridad=prioridad,
+        )
+
+    def test_acepta_etiqueta_y_serializa_etiqueta(self):
+        s = self._sugerencia("🟠 Alta")
+        assert s.prioridad is Prioridad.ALTA
+        assert s.model_dump(mode="json")["prioridad"] == "🟠 Alta"
+
+    def test_orden_por_urgencia(self):
+        assert Prioridad.URGENTE < Prioridad.ALTA < Prioridad.MEDIA < Prioridad.BAJA
+        assert self._sugerencia(Prioridad.BAJA).model_dump()["prioridad"] == "🟢 Baja"
+
+    def test_from_label_desconocida(self):
+        assert Prioridad.from_label("otra") is None
+        assert Prioridad.from_label(None) is None
+
+
+class TestClasificacionABCProducto:
+    async def _clasificar(self, fila):
+        db = MagicMock()
+        db.execute = AsyncMock(return_value=MagicMock(fetchone=MagicMock(return_value=fila)))
+        service = ABCService(VentasService(db))
+        categoria = await service.get_clasificacion_abc_producto("X", FilterParams(productos=["X", "Y"]))
+        return categoria, db.execute.await_args.args[1]
+
+    async def test_corte_por_acumulado_anterior(self):
+        assert (await self._clasificar(MagicMock(anterior=None, total=100)))[0] == "A"
+        assert (await self._clasificar(MagicMock(anterior=79.9, total=100)))[0] == "A"
+        # Acumulado anterior de exactamente 80 ya es B, igual que el análisis completo
+        assert (await self._clasificar(MagicMock(anterior=80, total=100)))[0] == "B"
+        assert (await self._clasificar(MagicMock(anterior=95, total=100)))[0] == "C"
+
+    async def test_sin_ventas_del_producto(self):
+        categoria, params = await self._clasificar(None)
+        assert categoria is None
+        assert params == {"productos": ["X", "Y"], "nombre": "X"}
+
+    async def test_misma_clase_que_el_analisis_completo(self):
+        # SQLite ejecuta el mismo SQL que PostgreSQL para este fixture: ventas
+        # empatadas (C, D y B en 100), cantidades fraccionarias y precio NULL.
+        con = sqlite3.connect(":memory:")
+        con.row_factory = sqlite3.Row
+        con.execute(
+            "CREATE TABLE reportes_ventas_30dias (nombre, precio, cantidad, fecha_venta, "
+            "familia, vendedor, metodo, proveedor_moda, precio_promedio_compra)"
+        )
+        lineas = [
+            ("A", 100, 3, "2026-01-03"),
+            ("B", 50, 2.9, "2026-01-01"),
+            ("B", None, 3, "2026-01-01"),
+            ("C", 100, 1, "2026-01-02"),
+            ("D", 100, 1, "2026-01-02"),
+            ("E", 10, 1.5, "2026-01-01"),
+            ("E", 5, 1, "2026-01-01"),
+            ("F", 5, 1, "2026-01-01"),
+        ]
+        con.executemany(
+            "INSERT INTO reportes_ventas_30dias (nombre, precio, cantidad, fecha_venta) VALUES (?, ?, ?, ?)",
+            lineas,
+        )
+
+        def responder(sql, params):
+            filas = con.execute(str(sql), params or {}).fetchall()
+            return [SimpleNamespace(_mapping=dict(f), **dict(f)) for f in filas]
+
+        service = ABCService(VentasService(QueryCounter(responder).session()))
+        analisis = await service.get_analisis_abc(FilterParams())
+        esperado = analisis["_categoria_por_nombre"]
+        assert esperado == {"A": "A", "C": "A", "D": "A", "B": "B", "E": "C", "F": "C"}
+        for nombre, categoria in esperado.items():
+            assert await service.get_clasificacion_abc_producto(nombre, FilterParams()) == categoria
@@ -0,0 +1,72 @@
+"""Tests del resumen de facturas de proveedor."""
+from collections import namedtuple
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.facturas_proveedor import FacturasProveedorService
+
+Fila = namedtuple(
+    "Fila",
+    "proveedor total_facturas monto_total facturas_vencidas monto_vencido "
+    "facturas_vence_hoy monto_vence_hoy facturas_proximas monto_proximo",
+)
+
+
+def _service(rows=None, error=None) -> FacturasProveedorService:
+    db = MagicMock()
+    if error:
+        db.execute = AsyncMock(side_effect=error)
+    else:
+        result = MagicMock()
+        result.fetchall.return_value = rows
+        db.execute = AsyncMock(return_value=result)
+    return FacturasProveedorService(db)
+
+
+async def test_resumen_suma_totales_y_agrupa_proximas_con_vence_hoy():
+    service = _service([
+        Fila("P1", 4, 400.0, 1, 100.0, 1, 50.0, 1, 25.0),
+        Fila("P2", 2, 200.5, 0, 0, 0, 0, 2, 200.5),
+    ])
+    resumen = await service.get_resumen()
+
+    assert resumen["total_facturas"] == 6
+    assert resumen["monto_total"] == 600.5
+    assert resumen["facturas_vencidas"] == 1
+    assert resumen["facturas_vence_hoy"] == 1
+    assert resumen["monto_vence_hoy"] == 50.0
+    assert resumen["facturas_proximas"] == 3
+    assert resumen["monto_proximo"] == 225.5
+    p1 = resumen["por_proveedor"][0]
+    assert p1["proveedor"] == "P1"
+    assert p1["facturas_proximas"] == 2
+    assert p1["monto_proximo"] == 75.0
+
+
+async def test_resumen_vacio_si_falla_la_consulta():
+    resumen = await _service(error=RuntimeError("sin tabla")).get_resumen()
+    assert resumen["total_facturas"] == 0
+    assert resumen["monto_total"] == 0
+    assert resumen["por_proveedor"] == []
+
+
+async def test_resumen_se_memoiza_por_instancia():
+    service = _service([Fila("P1", 1, 10.0, 0, 0, 0, 0, 0, 0)])
+    primero = await service.get_resumen(dias_plazo=30)
+    assert await service.get_resumen(dias_plazo=30) is primero
+    await service.get_resumen(dias_plazo=15)
+    assert service.db.execute.await_count == 2
+
+
+def test_filas_json_response_equivale_a_lista_de_dicts():
+    import json
+
+    from app.responses import FilasJSONResponse
+    from app.services.facturas_proveedor import COLUMNAS_FACTURA
+
+    filas = [
+        ('Pérez "SA"', "2026-01-01", "2026-01-31", -3, 1500.5, 2, "vencida"),
+        ("Otro", "2026-02-01", "2026-03-03", 10, 0.0, 1, "vigente"),
+    ]
+    body = FilasJSONResponse(filas, COLUMNAS_FACTURA).body
+    assert json.loads(body) == [dict(zip(COLUMNAS_FACTURA, f)) for f in filas]
+    assert FilasJSONResponse([], COLUMNAS_FACTURA).body == b"[]"
@@ -0,0 +1,64 @@
+"""Tests del despacho de consultas de InsightsService."""
+import asyncio
+from unittest.mock import MagicMock
+
+from app import database
+from app.services.insights import InsightsService
+
+
+class _FakeSession:
+    def __init__(self, abiertas: list):
+        self.abiertas = abiertas
+
+    async def __aenter__(self):
+        self.abiertas.append(self)
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def _service(session_factory=None) -> InsightsService:
+    return InsightsService(MagicMock(), MagicMock(), MagicMock(), session_factory=session_factory)
+
+
+async def test_reunir_sin_factory_usa_sesion_compartida_en_serie():
+    service = _service()
+    orden = []
+
+    async def bloque(svc, n):
+        assert svc is service
+        orden.append(n)
+        return n
+
+    result = await service._reunir(lambda s: bloque(s, 1), lambda s: bloque(s, 2))
+    assert result == [1, 2]
+    assert orden == [1, 2]
+
+
+async def test_reunir_con_factory_abre_una_sesion_por_bloque():
+    abiertas: list = []
+    service = _service(session_factory=lambda: _FakeSession(abiertas))
+    en_curso = 0
+    max_en_curso = 0
+
+    async def bloque(svc, n):
+        nonlocal en_curso, max_en_curso
+        en_curso += 1
+        max_en_curso = max(max_en_curso, en_curso)
+        await asyncio.sleep(0)
+        en_curso -= 1
+        return svc.db
+
+    result = await service._reunir(*(lambda s, n=n: bloque(s, n) for n in range(3)))
+    assert result == abiertas
+    assert len({id(s) for s in abiertas}) == 3
+    assert max_en_curso == 3
+
+
+def test_readonly_session_factory_usa_autocommit_sobre_el_mismo_pool():
+    lectura = database.get_readonly_session_factory()
+    escritura = database.get_session_factory()
+    bind = lectura.kw["bind"]
+    assert bind.get_execution_options()["isolation_level"] == "AUTOCOMMIT"
+    assert bind.sync_engine.pool is escritura.kw["bind"].sync_engine.pool
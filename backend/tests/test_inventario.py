@@ -0,0 +1,305 @@
+"""Tests de InventarioService."""
+import sqlite3
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from sqlalchemy.exc import ProgrammingError
+
+from app.cache import INVENTARIO_COMPLETO_CACHE
+from app.models.schemas import EstadoStock
+from app.services import inventario as inventario_mod
+from app.services.inventario import InventarioService, redondear_producto
+from tests.query_counter import QueryCounter
+
+
+@pytest.fixture(autouse=True)
+def _cache_limpio(monkeypatch):
+    monkeypatch.setattr(inventario_mod, "_ventas_30d_mv_disponible", None)
+    INVENTARIO_COMPLETO_CACHE.clear()
+    yield
+    INVENTARIO_COMPLETO_CACHE.clear()
+
+
+def _fila(**kw):
+    base = dict(
+        nombre="X", stock_actual=10, cantidad_vendida_30d=30, total_ventas_30d=300,
+        precio_venta=10, precio_compra=6, proveedor="P", familia="F",
+    )
+    base.update(kw)
+    fila = MagicMock()
+    fila._mapping = base
+    return fila
+
+
+class _Cursor:
+    """AsyncResult mínimo de db.stream."""
+
+    def __init__(self, filas):
+        self.filas = filas
+
+    async def __aiter__(self):
+        for fila in self.filas:
+            yield fila
+
+
+def _service(filas) -> InventarioService:
+    db = MagicMock()
+    result = MagicMock()
+    result.fetchall.return_value = filas
+    db.execute = AsyncMock(return_value=result)
+    db.stream = AsyncMock(side_effect=lambda *args, **kwargs: _Cursor(filas))
+    return InventarioService(db)
+
+
+async def test_inventario_completo_consulta_una_vez():
+    service = _service([_fila()])
+    stockout = await service.get_stockout_rate()
+    productos = await service.get_inventario_completo()
+    assert stockout["activos"] == 1
+    assert productos[0]["estado_stock"] is EstadoStock.NORMAL
+    assert service.db.stream.await_count == 1
+
+    # Otra instancia dentro del TTL reutiliza el cache compartido
+    otro = _service([])
+    assert await otro.get_inventario_completo() == await service.get_inventario_completo()
+    otro.db.stream.assert_not_awaited()
+
+
+async def test_metricas_sin_redondear_hasta_la_respuesta():
+    service = _service([_fila(stock_actual=10, cantidad_vendida_30d=7, precio_compra=6.005)])
+    producto = (await service.get_inventario_completo())[0]
+    assert producto["venta_diaria"] == 7 / 30
+    assert producto["dias_cobertura"] == 10 / (7 / 30)
+
+    publicado = redondear_producto(producto)
+    assert publicado["venta_diaria"] == 0.23
+    assert publicado["dias_cobertura"] == 42.9
+    assert publicado["rotacion"] == 8.4
+    assert producto["estado_stock"] is EstadoStock.NORMAL
+    assert publicado["estado_stock"] == "🟢 Normal"
+    # La copia no altera el inventario compartido en cache
+    assert producto["venta_diaria"] == 7 / 30
+
+
+async def test_indice_por_proveedor_se_reutiliza_con_el_inventario():
+    service = _service([_fila(nombre="A", proveedor="P"), _fila(nombre="B", proveedor="Q"), _fila(nombre="C")])
+    indice = await service.get_productos_por_proveedor()
+    assert [p["nombre"] for p in indice["P"]] == ["A", "C"]
+    assert [p["nombre"] for p in indice["Q"]] == ["B"]
+    assert await _service([]).get_productos_por_proveedor() is indice
+
+    # Si el inventario se recalcula, el índice se reconstruye
+    service.invalidate_inventario()
+    assert await service.get_productos_por_proveedor() is not indice
+
+
+async def test_invalidate_inventario_fuerza_recalculo():
+    service = _service([_fila()])
+    await service.get_inventario_completo()
+    service.invalidate_inventario()
+    await service.get_inventario_completo()
+    assert service.db.stream.await_count == 2
+
+
+async def test_resumen_y_familias_se_agregan_en_sql():
+    resumen = MagicMock(
+        total_productos=3, total_unidades=40, valor_total=1234.567, criticos=1, bajos=1,
+        normales=0, exceso=1, rotacion_promedio=4.25, valor_criticos=10, valor_exceso=None,
+    )
+    inventario_mod._ventas_30d_mv_disponible = True  # vista ya probada
+    service = _service([])
+    service.db.execute.return_value.fetchone.return_value = resumen
+    r = await service.get_resumen_inventario()
+    assert r["valor_total"] == 1234.57
+    assert r["productos_criticos"] == 1 and r["productos_exceso"] == 1
+    assert r["valor_exceso"] == 0
+    sql = str(service.db.execute.await_args.args[0])
+    assert "FILTER (WHERE estado = 'critico')" in sql
+    assert "<= 7 THEN 'bajo'" in sql and "<= 60 THEN 'normal'" in sql
+
+    service.db.execute.return_value.fetchall.return_value = [
+        MagicMock(por_proveedor=False, familia="F", proveedor=None, productos=2, unidades=5, valor=100, criticos=1, bajos=0),
+        MagicMock(por_proveedor=True, familia=None, proveedor="P", productos=2, unidades=5, valor=100, criticos=1, bajos=0),
+    ]
+    assert await service.get_valor_por_familia() == [
+        {"familia": "F", "productos": 2, "unidades": 5, "valor": 100.0, "criticos": 1, "bajos": 0}
+    ]
+    assert await service.get_valor_por_proveedor() == [
+        {"proveedor": "P", "productos": 2, "unidades": 5, "valor": 100.0, "criticos": 1}
+    ]
+    # Familia y proveedor salen de la misma consulta
+    assert service.db.execute.await_count == 2
+    assert "GROUPING SETS ((familia_grupo), (proveedor_grupo))" in str(service.db.execute.await_args.args[0])
+
+
+async def test_alertas_por_proveedor_se_cuentan_en_sql():
+    service = _service([
+        MagicMock(proveedor="P1", criticos=2, bajos=1),
+        MagicMock(proveedor=None, criticos=0, bajos=3),
+    ])
+    assert await service.get_alertas_por_proveedor() == {
+        "P1": {"criticos": 2, "bajos": 1},
+        None: {"criticos": 0, "bajos": 3},
+    }
+    sql = str(service.db.execute.await_args.args[0])
+    assert "GROUP BY proveedor" in sql and "WHERE estado IN ('critico', 'bajo')" in sql
+    service.db.stream.assert_not_awaited()
+
+async def test_ventas_30d_desde_vista_materializada_o_agrupadas():
+    service = _service([_fila()])
+    await service.get_inventario_completo()
+    stmt = service.db.stream.await_args.args[0]
+    assert "FROM mv_ventas_30d_por_producto" in str(stmt)
+    assert stmt.get_execution_options()["yield_per"] == 1000
+
+    # Sin la vista (to_regclass NULL): la consulta agrupa reportes_ventas_30dias
+    service.invalidate_inventario()
+    inventario_mod._ventas_30d_mv_disponible = None
+    service.db.execute.return_value.scalar.return_value = False
+    assert len(await service.get_inventario_completo()) == 1
+    assert "to_regclass" in str(service.db.execute.await_args.args[0])
+    sql = str(service.db.stream.await_args.args[0])
+    assert "mv_ventas_30d_por_producto" not in sql and "GROUP BY nombre" in sql
+    assert inventario_mod._ventas_30d_mv_disponible is False
+
+
+async def test_error_de_la_vista_30d_no_la_marca_ausente():
+    service = _service([_fila()])
+    service.db.stream = AsyncMock(side_effect=ProgrammingError("SELECT", {}, Exception("timeout")))
+    with pytest.raises(ProgrammingError):
+        await service.get_inventario_completo()
+    assert inventario_mod._ventas_30d_mv_disponible is True
+
+
+async def test_alertas_seleccionadas_en_sql_con_metricas_de_inventario():
+    filas = [
+        _fila(grupo="critico", total_grupo=12, valor_grupo=50, stock_actual=1, cantidad_vendida_30d=30),
+        _fila(grupo="sin_movimiento", total_grupo=1, valor_grupo=1234.5, nombre="Y", cantidad_vendida_30d=0),
+    ]
+    service = _service(filas)
+    alertas = await service.get_alertas_inventario()
+    assert [a["titulo"] for a in alertas] == [
+        "12 productos con stock crítico",
+        "1 productos sin movimiento",
+    ]
+    assert alertas[0]["datos"][0]["estado_stock"] == "🔴 Crítico"
+    assert alertas[0]["datos"][0]["dias_cobertura"] == 1.0
+    assert alertas[1]["detalle"].endswith("$1,234")
+    assert "WHERE rn <= 10" in str(service.db.execute.await_args.args[0])
+
+
+async def test_producto_detalle_reune_bloques_en_sesiones_propias(monkeypatch):
+    sesiones = []
+
+    class _Sesion:
+        async def __aenter__(self):
+            db = MagicMock()
+            db.execute = AsyncMock(return_value=MagicMock(fetchall=MagicMock(return_value=[])))
+            sesiones.append(db)
+            return db
+
+        async def __aexit__(self, *exc):
+            return False
+
+    class _ABCRoto:
+        def __init__(self, ventas):
+            pass
+
+        async def get_clasificacion_abc_producto(self, nombre, filtros):
+            raise RuntimeError("sin ventas")
+
+    monkeypatch.setattr(inventario_mod, "ABCService", _ABCRoto)
+    monkeypatch.setattr(
+        inventario_mod.ComprasService, "get_sugerencia_producto", AsyncMock(return_value=None)
+    )
+    db = MagicMock()
+    producto = MagicMock(_asdict=MagicMock(return_value={"stock_actual": 5, "precio_venta": 10}))
+    db.execute = AsyncMock(return_value=MagicMock(fetchone=MagicMock(return_value=producto)))
+    service = InventarioService(db, session_factory=_Sesion)
+
+    detalle = await service.get_producto_detalle("X")
+    assert detalle["clasificacion_abc"] is None
+    assert detalle["sugerencia_compra"] is None
+    assert detalle["historial_ventas"] == []
+    # Solo el producto va por la sesión compartida; el resto, una sesión por bloque
+    assert db.execute.await_count == 1
+    assert len(sesiones) == 3
+
+
+async def test_ruta_agotados_no_calcula_inventario_completo(monkeypatch):
+    from app.routes import inventario as inventario_routes
+
+    monkeypatch.setattr(
+        InventarioService, "get_inventario_completo", AsyncMock(side_effect=AssertionError("inventario completo"))
+    )
+    filas = [
+        _fila(
+            stock_actual=0, cantidad_vendida=14, ingresos=140, ultima_venta=None, precio_promedio=10,
+            costo_promedio=6, venta_diaria=2, periodo_agotamiento="ultima_semana",
+        ),
+    ]
+    filas[0].venta_diaria = 2
+    db = _service(filas).db
+    agotados = await inventario_routes.get_productos_agotados(db=db)
+    assert agotados["ultima_semana"]["total"] == 1
+    assert agotados["ultima_semana"]["ingresos_perdidos_estimados"] == 140.0
+    assert db.stream.await_args.args[0] is inventario_mod._AGOTADOS_SQL
+    db.execute.assert_not_awaited()
+
+
+async def test_inventario_completo_una_consulta_por_snapshot():
+    inventario_mod._ventas_30d_mv_disponible = True  # vista ya probada
+    contador = QueryCounter(lambda sql, params: [_fila()])
+    service = InventarioService(contador.session())
+    await service.get_inventario_completo()
+    await service.get_productos_por_proveedor()
+    await InventarioService(contador.session()).get_inventario_completo()
+    assert contador.count == 1
+
+
+async def test_producto_detalle_consultas_acotadas():
+    producto = MagicMock(_asdict=MagicMock(return_value={"stock_actual": 5, "precio_venta": 10}))
+    contador = QueryCounter(lambda sql, params: [producto] if sql is inventario_mod._PRODUCTO_SQL else [])
+    service = InventarioService(contador.session(), session_factory=contador.session_factory())
+    assert await service.get_producto_detalle("X") is not None
+    # producto, historial, ABC del producto y las consultas de la sugerencia
+    # (ventas del producto, items, rango de fechas); ninguna por fila
+    assert contador.count <= 6
+
+
+async def test_estado_en_el_corte_igual_en_sql_y_en_el_listado():
+    # stock 22 y 30d vendidas 11: stock / (vendida / 30) = 60.00000000000001
+    # (exceso), mientras stock * 30 / vendida = 60.0 (normal). SQLite evalúa
+    # _METRICAS_CTE con el mismo float8 que PostgreSQL (sin los casts ::).
+    inventario_mod._ventas_30d_mv_disponible = False
+    con = sqlite3.connect(":memory:")
+    con.row_factory = sqlite3.Row
+    con.execute("CREATE TABLE items (nombre, cantidad_disponible, precio)")
+    con.execute(
+        "CREATE TABLE reportes_ventas_30dias (nombre, precio, cantidad, precio_promedio_compra, "
+        "proveedor_moda, familia)"
+    )
+    con.executemany("INSERT INTO items VALUES (?, ?, 10)", [("Borde", 22), ("Normal", 30), ("Critico", 1)])
+    con.executemany(
+        "INSERT INTO reportes_ventas_30dias VALUES (?, 10, ?, 6, 'P', 'F')",
+        [("Borde", 11), ("Normal", 30), ("Critico", 30)],
+    )
+
+    def responder(sql, params):
+        consulta = str(sql).replace("::numeric", "").replace("::float8", "")
+        filas = con.execute(consulta, params or {}).fetchall()
+        return [SimpleNamespace(_mapping=dict(f), **dict(f)) for f in filas]
+
+    service = InventarioService(QueryCounter(responder).session())
+    estados = {p["nombre"]: p["estado_stock"] for p in await service.get_inventario_completo()}
+    assert estados == {"Borde": EstadoStock.EXCESO, "Normal": EstadoStock.NORMAL, "Critico": EstadoStock.CRITICO}
+
+    resumen = await service.get_resumen_inventario()
+    assert (resumen["productos_criticos"], resumen["productos_normales"], resumen["productos_exceso"]) == (1, 1, 1)
+
+    alertas = {a["titulo"]: [d["nombre"] for d in a["datos"]] for a in await service.get_alertas_inventario()}
+    assert alertas == {
+        "1 productos con stock crítico": ["Critico"],
+        "1 productos con exceso de stock": ["Borde"],
+    }
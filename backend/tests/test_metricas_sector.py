@@ -31,8 +31,14 @@ def _venta(nombre: str, total: float, fecha: date | None = None) -> VentaBase:
 
 
 def _ventas_service(ventas: list[VentaBase]):
+    por_dia: dict[date, list] = {}
+    for venta in ventas:
+        fila = por_dia.setdefault(venta.fecha_venta, [None, venta.fecha_venta, 0.0, 0])
+        fila[2] += venta.total_venta
+        fila[3] += 1
     mock = MagicMock()
     mock.get_ventas = AsyncMock(return_value=(ventas, len(ventas)))
+    mock.get_serie_diaria = AsyncMock(return_value=[tuple(por_dia[f]) for f in sorted(por_dia)])
     return mock
 
 
@@ -108,3 +114,21 @@ def test_ventas_diarias_includes_lineas_and_ticket():
     ticket = round(row["ventas"] / row["facturas"], 2) if row["facturas"] else 0
     assert row["lineas"] == 8
     assert ticket == 200
+
+
+def test_query_pipeline_une_escalares_en_un_select():
+    from app.database import QueryPipeline
+
+    row = MagicMock()
+    row._mapping = {"a": 1, "b": 2}
+    db = MagicMock()
+    db.execute = AsyncMock(return_value=MagicMock(fetchone=MagicMock(return_value=row)))
+
+    pipeline = QueryPipeline().add("a", "SELECT 1 WHERE :x = 1", {"x": 1}).add("b", "SELECT 2", {"x": 1})
+    assert asyncio.run(pipeline.execute(db)) == {"a": 1, "b": 2}
+    stmt, params = db.execute.await_args.args
+    assert str(stmt) == "SELECT (SELECT 1 WHERE :x = 1) AS a, (SELECT 2) AS b"
+    assert params == {"x": 1}
+
+    with pytest.raises(ValueError):
+        pipeline.add("c", "SELECT :x", {"x": 2})
@@ -1,9 +1,14 @@
 """
 Tests para el servicio de predicciones.
 """
+import json
+
 import pytest
+import numpy as np
 from datetime import date, timedelta
-from unittest.mock import AsyncMock, MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.cache import PREDICCIONES_CACHE
 
 from app.services.predicciones import PrediccionesService
 from app.models.schemas import FilterParams, VentaBase
@@ -29,9 +34,22 @@ def _make_venta(fecha: date, total: float, nombre: str = "Producto A") -> VentaB
 
 
 def _create_mock_ventas_service(ventas: list):
-    """Crea un mock de VentasService que retorna las ventas dadas."""
+    """Crea un mock de VentasService que retorna las ventas dadas.
+
+    ``get_serie_diaria`` agrupa como la consulta SQL: (clave, fecha) ordenado.
+    """
+    async def por_dia(filters, dimension=None):
+        filas = {}
+        for v in ventas:
+            clave = (getattr(v, dimension) or None) if dimension else None
+            fila = filas.setdefault((clave or "", v.fecha_venta), [clave, v.fecha_venta, 0.0, 0])
+            fila[2] += v.total_venta
+            fila[3] += 1
+        return [tuple(fila) for _, fila in sorted(filas.items())]
+
     mock = MagicMock()
     mock.get_ventas = AsyncMock(return_value=(ventas, len(ventas)))
+    mock.get_serie_diaria = AsyncMock(side_effect=por_dia)
     return mock
 
 
@@ -128,6 +146,66 @@ class TestPrediccionesService:
             assert punto.media_movil_7d is not None
 
 
+    async def test_desglose_reutiliza_prediccion_global_cacheada(self):
+        """El fallback comparte la predicción global con /predicciones por filtro."""
+        PREDICCIONES_CACHE.clear()
+        hoy = date.today()
+        ventas = [_make_venta(hoy - timedelta(days=i), 100 + i) for i in range(20)]
+        service = PrediccionesService(_create_mock_ventas_service(ventas))
+        filters = FilterParams()
+        try:
+            with patch.object(
+                service, "get_predicciones", wraps=service.get_predicciones
+            ) as spy:
+                primero = await service.get_predicciones_desglose(filters, "familia")
+                segundo = await service.get_predicciones_desglose(filters, "producto")
+            assert spy.await_count == 1
+            assert primero.grupos and segundo.grupos
+        finally:
+            PREDICCIONES_CACHE.clear()
+
+    async def test_backtest_coincide_con_el_pronostico_del_corte(self):
+        """Cada semana del backtest usa el mismo pronóstico que la serie recortada."""
+        inicio = date(2026, 6, 1)
+        ventas = [
+            _make_venta(inicio + timedelta(days=i), 100 + (i * 37) % 50)
+            for i in range(40)
+            if i % 9 != 4  # días sin venta: las fechas no son consecutivas
+        ]
+        service = PrediccionesService(_create_mock_ventas_service(ventas))
+        resultado = await service.get_backtest_metricas(FilterParams(), semanas=1)
+
+        filas = await service.ventas_service.get_serie_diaria(FilterParams())
+        fechas = [fila[1] for fila in filas]
+        valores = [fila[2] for fila in filas]
+        pronostico = service._calcular_prediccion_para_serie(fechas[:-7], valores[:-7])
+        pred = np.array([p.ventas for p in pronostico.predicciones[:7]])
+        real = np.array(valores[-7:])
+        mae = float(np.mean(np.abs(real - pred)))
+        assert resultado["detalle"][0]["mae"] == round(mae, 2)
+
+    async def test_ruta_desglose_cachea_el_json(self, monkeypatch):
+        """Un hit del desglose devuelve el JSON guardado sin recalcular."""
+        from app.cache import PREDICCIONES_DESGLOSE_CACHE
+        from app.routes import ventas as rutas
+
+        hoy = date.today()
+        ventas = [_make_venta(hoy - timedelta(days=i), 100 + i) for i in range(20)]
+        mock = _create_mock_ventas_service(ventas)
+        monkeypatch.setattr(rutas, "VentasService", lambda db: mock)
+        PREDICCIONES_DESGLOSE_CACHE.clear()
+        PREDICCIONES_CACHE.clear()
+        try:
+            primera = await rutas.get_predicciones_desglose("producto", FilterParams(), None)
+            segunda = await rutas.get_predicciones_desglose("producto", FilterParams(), None)
+        finally:
+            PREDICCIONES_DESGLOSE_CACHE.clear()
+            PREDICCIONES_CACHE.clear()
+        assert primera.body == segunda.body
+        assert primera.media_type == "application/json"
+        assert "Producto A" in json.loads(primera.body)["grupos"]
+        assert mock.get_serie_diaria.await_count == 2  # desglose + predicción global, una vez
+
 class TestRegresionLinealPonderada:
     """Tests para la regresión lineal ponderada."""
 
@@ -152,3 +230,71 @@ class TestRegresionLinealPonderada:
             [50, 40, 30, 20, 10]
         )
         assert pendiente < 0
+
+    def test_lote_coincide_con_el_ajuste_por_serie(self):
+        """El ajuste en lote (largos distintos, más allá de la ventana) da las mismas rectas."""
+        rng = np.random.default_rng(7)
+        series = [rng.uniform(0, 100, n) for n in (7, 30, 269, 400)]
+        pendientes, interceptos = PrediccionesService._regresion_lineal_ponderada_lote(series)
+        for serie, pendiente, intercepto in zip(series, pendientes, interceptos):
+            esperado = PrediccionesService._regresion_lineal_ponderada(serie)
+            assert (pendiente, intercepto) == pytest.approx(esperado, rel=1e-9)
+
+    def test_historia_larga_conserva_x_absoluto(self):
+        """Con más días que la ventana efectiva la recta sigue en x absoluto."""
+        valores = [5 + 2 * i for i in range(1000)]
+        pendiente, intercepto = PrediccionesService._regresion_lineal_ponderada(valores)
+        assert pendiente == pytest.approx(2)
+        assert intercepto == pytest.approx(5, abs=1e-6)
+
+
+class TestEstacionalidadSemanal:
+    """Tests para los factores por día de la semana."""
+
+    def test_factores_relativos_a_la_media(self):
+        """Cada factor es el promedio del día sobre la media global; 0 sin datos."""
+        dias = np.array([0, 0, 1, 2], dtype=np.int8)
+        valores = np.array([10.0, 30.0, 40.0, 0.0])
+        factores = PrediccionesService._calcular_estacionalidad_semanal(dias, valores)
+        assert factores.tolist() == [1.0, 2.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+
+    def test_dias_semana_siguientes(self):
+        """Los días futuros se derivan del último día, sin llamar a weekday()."""
+        inicio = date(2026, 9, 12)  # sábado
+        esperado = [(inicio + timedelta(days=i)).weekday() for i in range(1, 15)]
+        dias = PrediccionesService._dias_semana_siguientes(inicio.weekday(), 14)
+        assert dias.tolist() == esperado
+
+    def test_dia_sin_historia_se_proyecta_en_cero(self):
+        """Las predicciones indexan los factores por día de la semana."""
+        inicio = date(2026, 9, 7)  # lunes
+        fechas = [inicio + timedelta(days=i) for i in range(21) if (i % 7) != 6]
+        service = PrediccionesService(_create_mock_ventas_service([]))
+        pronostico = service._calcular_prediccion_para_serie(fechas, [100.0] * len(fechas))
+        for punto in pronostico.predicciones:
+            if punto.fecha.weekday() == 6:
+                assert punto.ventas == 0
+            else:
+                assert punto.ventas > 0
+
+
+class TestMediaMovil:
+    """Tests para la media móvil por suma acumulada."""
+
+    def test_coincide_con_ventana_explicita(self):
+        """Debe coincidir con promediar cada ventana, incluidos los primeros días."""
+        valores = np.array([3.0, 8.0, 1.0, 0.0, 12.5, 7.0, 4.0, 9.0, 2.0, 6.0])
+        esperado = [valores[max(0, i - 2):i + 1].mean() for i in range(len(valores))]
+        assert np.allclose(PrediccionesService._media_movil(valores, 3), esperado)
+
+    def test_serie_larga_sin_deriva(self):
+        """En series largas de montos altos la suma acumulada no se aleja de la ventana."""
+        valores = np.random.default_rng(7).uniform(0, 5_000_000, 1500).round(2)
+        esperado = [valores[max(0, i - 6):i + 1].mean() for i in range(len(valores))]
+        media = PrediccionesService._media_movil(valores, 7)
+        assert np.round(media, 2).tolist() == np.round(esperado, 2).tolist()
+
+    def test_serie_mas_corta_que_la_ventana(self):
+        """Con menos días que la ventana promedia lo disponible."""
+        media = PrediccionesService._media_movil(np.array([2.0, 4.0]), 7)
+        assert media.tolist() == [2.0, 3.0]
@@ -0,0 +1,69 @@
+"""Tests de ProveedoresService."""
+from unittest.mock import AsyncMock, MagicMock
+
+from app.models.schemas import EstadoStock, FilterParams
+from app.services.inventario import InventarioService
+from app.services.proveedores import ProveedoresService
+
+
+def _fila_resumen(proveedor: str):
+    fila = MagicMock()
+    fila._asdict.return_value = {
+        "proveedor": proveedor, "total_transacciones": 1, "productos_unicos": 1,
+        "unidades_vendidas": 1, "total_ventas": 10, "precio_promedio": 10,
+        "costo_promedio": None, "margen_total": 0, "margen_porcentaje_promedio": None,
+    }
+    return fila
+
+
+async def test_resumen_consulta_las_alertas_una_vez(monkeypatch):
+    alertas = AsyncMock(return_value={"P1": {"criticos": 2, "bajos": 1}})
+    monkeypatch.setattr(InventarioService, "get_alertas_por_proveedor", alertas)
+    inventario = AsyncMock()
+    monkeypatch.setattr(InventarioService, "get_inventario_completo", inventario)
+    db = MagicMock()
+    db.execute = AsyncMock(return_value=MagicMock(
+        fetchall=MagicMock(return_value=[_fila_resumen(p) for p in ("P1", "P2")])
+    ))
+
+    resumen = await ProveedoresService(db).get_resumen_proveedores(FilterParams())
+
+    assert alertas.await_count == 1
+    inventario.assert_not_awaited()
+    por_proveedor = {
+        r["proveedor"]: (r["productos_criticos"], r["productos_bajos"], r["tiene_alertas"])
+        for r in resumen
+    }
+    assert por_proveedor == {"P1": (2, 1, True), "P2": (0, 0, False)}
+
+
+async def test_resumen_sin_alertas_si_falla_el_inventario(monkeypatch):
+    monkeypatch.setattr(
+        InventarioService, "get_alertas_por_proveedor", AsyncMock(side_effect=RuntimeError)
+    )
+    db = MagicMock()
+    db.execute = AsyncMock(return_value=MagicMock(
+        fetchall=MagicMock(return_value=[_fila_resumen("P1")])
+    ))
+
+    (fila,) = await ProveedoresService(db).get_resumen_proveedores(FilterParams())
+
+    assert (fila["productos_criticos"], fila["productos_bajos"]) == (0, 0)
+
+
+async def test_alertas_de_un_proveedor_leen_el_indice_cacheado(monkeypatch):
+    todas = AsyncMock()
+    monkeypatch.setattr(InventarioService, "get_alertas_por_proveedor", todas)
+    indice = AsyncMock(return_value={
+        "P1": [
+            {"estado_stock": e}
+            for e in (EstadoStock.CRITICO, EstadoStock.BAJO, EstadoStock.BAJO, EstadoStock.NORMAL)
+        ],
+        "P2": [{"estado_stock": EstadoStock.CRITICO}],
+    })
+    monkeypatch.setattr(InventarioService, "get_productos_por_proveedor", indice)
+    service = ProveedoresService(MagicMock())
+
+    assert await service._get_alertas_stock_proveedor("P1") == {"criticos": 1, "bajos": 2}
+    assert await service._get_alertas_stock_proveedor("P3") == {"criticos": 0, "bajos": 0}
+    todas.assert_not_awaited()
@@ -0,0 +1,192 @@
+"""Tests de las agregaciones SQL de VentasService (rollup y márgenes)."""
+import sqlite3
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from sqlalchemy.exc import ProgrammingError
+
+from app.models.schemas import FilterParams, VentaBase
+from app.services import ventas as ventas_mod
+from app.services.margenes import MargenesService
+from app.services.ventas import VentasService
+from tests.query_counter import QueryCounter
+
+
+@pytest.fixture(autouse=True)
+def _agregado_sin_probar(monkeypatch):
+    monkeypatch.setattr(ventas_mod, "_agregado_disponible", None)
+
+
+def _service(filas=None, vista=True) -> VentasService:
+    db = MagicMock()
+    result = MagicMock()
+    result.fetchall.return_value = filas or []
+    # to_regclass de la prueba de existencia de mv_ventas_agg
+    result.scalar.return_value = vista
+    db.execute = AsyncMock(return_value=result)
+    db.commit = AsyncMock()
+    return VentasService(db)
+
+
+async def test_por_vendedor_lee_del_rollup():
+    service = _service([("Ana", 150.0, 3), ("Luis", 300.0, 2)])
+    assert await service.get_ventas_por_vendedor(FilterParams()) == [
+        {"vendedor": "Luis", "total_venta": 300.0},
+        {"vendedor": "Ana", "total_venta": 150.0},
+    ]
+    sql = str(service.db.execute.await_args.args[0])
+    assert "mv_ventas_agg" in sql and "GROUP BY vendedor" in sql
+
+
+async def test_filtro_de_precio_no_usa_el_rollup():
+    service = _service()
+    assert await service._agregar_por(FilterParams(precio_min=10), "nombre") is None
+    service.db.execute.assert_not_awaited()
+
+
+async def test_sin_vista_recurre_a_las_lineas(monkeypatch):
+    service = _service(vista=False)
+    venta = VentaBase(
+        nombre="X", precio=10.0, cantidad=2, fecha_venta=date(2026, 1, 1), total_venta=20.0,
+    )
+    service.get_ventas = AsyncMock(return_value=([venta], 1))
+    assert await service.get_top_productos_cantidad(FilterParams()) == [{"nombre": "X", "cantidad": 2}]
+    # Solo la prueba de existencia: la vista ausente nunca se consulta
+    assert "to_regclass" in str(service.db.execute.await_args.args[0])
+    assert ventas_mod._agregado_disponible is False
+    await service.get_top_productos_cantidad(FilterParams())
+    assert service.db.execute.await_count == 1
+
+
+async def test_error_de_la_vista_no_la_marca_ausente():
+    service = _service()
+    existe = MagicMock()
+    existe.scalar.return_value = True
+    service.db.execute.side_effect = [existe, ProgrammingError("SELECT", {}, Exception("timeout"))]
+    with pytest.raises(ProgrammingError):
+        await service.get_ventas_por_vendedor(FilterParams())
+    assert ventas_mod._agregado_disponible is True
+
+
+async def test_refresco_omite_la_vista_ausente():
+    service = _service(vista=False)
+    await service.refrescar_agregados()
+    assert service.db.execute.await_count == 1
+    service.db.commit.assert_not_awaited()
+    service = _service()
+    await service.refrescar_agregados()
+    assert "REFRESH MATERIALIZED VIEW CONCURRENTLY mv_ventas_agg" in str(service.db.execute.await_args.args[0])
+    service.db.commit.assert_awaited_once()
+
+
+def _nivel(nivel, lista=0, **kw):
+    base = dict(familia=None, nombre=None, lineas=1, margen_promedio=0, margen_total=0, cantidad_total=0)
+    base.update(kw)
+    fila = MagicMock(nivel=nivel, lista=lista, **base)
+    fila._mapping = {"lista": lista, "nivel": nivel, **base}
+    return fila
+
+
+async def test_margenes_totales_familias_y_ranking_en_una_consulta():
+    a = dict(nombre="A", margen_promedio=2.345, margen_total=100.0, cantidad_total=10)
+    b = dict(nombre="B", margen_promedio=1.0, margen_total=20.0, cantidad_total=20)
+    c = dict(nombre="C", margen_promedio=-1.0, margen_total=-5.0, cantidad_total=5)
+    service = _service([
+        _nivel(1, familia="F2", margen_total=90.0),
+        _nivel(1, familia="F1", margen_total=25.0),
+        _nivel(3, lineas=7, margen_total=115.0),
+        _nivel(2, lista=1, **a),
+        _nivel(2, lista=1, **b),
+        _nivel(2, lista=2, **c),
+        _nivel(2, lista=2, **b),
+    ])
+    totales, familias, top, bottom = await service.get_margenes_agregados(FilterParams(), limit=2)
+    assert totales["lineas"] == 7
+    assert [f["familia"] for f in familias] == ["F2", "F1"]
+    assert [p["nombre"] for p in top] == ["A", "B"]
+    assert [p["nombre"] for p in bottom] == ["C", "B"]
+    assert top[0] == {"nombre": "A", "margen": 2.35, "total_margen": 100.0, "cantidad": 10}
+    assert service.db.execute.await_count == 1
+    assert service.db.execute.await_args.args[1] == {"limit": 2}
+    sql = str(service.db.execute.await_args.args[0])
+    assert "GROUPING SETS ((familia), (nombre), ())" in sql
+    assert "ORDER BY margen_total DESC, nombre LIMIT :limit" in sql
+
+
+async def test_margenes_sin_lineas_con_costo():
+    service = _service([_nivel(3, lineas=0)])
+    assert await service.get_margenes_agregados(FilterParams()) == (None, [], [], [])
+
+
+async def test_analisis_margenes_sin_costo_consulta_si_hay_ventas():
+    ventas = MagicMock()
+    ventas.get_margenes_agregados = AsyncMock(return_value=(None, [], [], []))
+    ventas.hay_ventas = AsyncMock(return_value=True)
+    r = await MargenesService(ventas).get_analisis_margenes(FilterParams())
+    assert r.sin_datos_costo is True
+    assert r.top_margen == [] and r.datos_scatter == []
+
+
+async def test_muestra_margenes_arma_puntos_del_scatter():
+    filas = [
+        MagicMock(nombre="A", precio=120, cantidad=2.7, precio_promedio_compra=100, vendedor="Ana"),
+        MagicMock(nombre="B", precio=50, cantidad=1, precio_promedio_compra=50, vendedor=None),
+    ]
+    service = _service(filas)
+    a, b = await service.get_muestra_margenes(FilterParams(), limit=2)
+    assert (a.cantidad, a.margen, a.margen_porcentaje, a.total_margen) == (2, 20.0, 16.67, 40.0)
+    assert a.vendedor == "Ana"
+    # Margen cero: sin porcentaje ni total, igual que _rows_to_ventas
+    assert (b.margen, b.margen_porcentaje, b.total_margen) == (0.0, None, None)
+    sql = str(service.db.execute.await_args.args[0])
+    assert "SELECT *" not in sql and "ORDER BY random()" in sql
+
+
+async def test_get_ventas_reutiliza_lineas_de_la_misma_instancia():
+    service = _service([])
+    assert await service.get_ventas(FilterParams()) == ([], 0)
+    await service.get_ventas(FilterParams())
+    assert service.db.execute.await_count == 1
+    await service.get_ventas(FilterParams(productos=["X"]))
+    await service.get_ventas(FilterParams(), max_rows=50000)
+    assert service.db.execute.await_count == 3
+
+
+async def test_serie_diaria_agrupa_en_la_base():
+    service = _service([(None, date(2026, 3, 9), 14, 2), (None, date(2026, 3, 10), None, 1)])
+    assert await service.get_serie_diaria(FilterParams()) == [
+        (None, date(2026, 3, 9), 14.0, 2),
+        (None, date(2026, 3, 10), 0.0, 1),
+    ]
+    sql = str(service.db.execute.await_args.args[0])
+    assert "GROUP BY fecha_venta" in sql and "LIMIT" not in sql
+
+    await service.get_serie_diaria(FilterParams(), "familia")
+    sql = str(service.db.execute.await_args.args[0])
+    assert "NULLIF(familia, '') AS clave" in sql
+    assert "GROUP BY clave, fecha_venta" in sql and "ORDER BY clave, fecha_venta" in sql
+
+
+
+async def test_totales_hoy_ayer_con_las_reglas_de_linea():
+    # Mismo total que las líneas de get_metricas: cantidad truncada, precio NULL = 0
+    hoy = date.today()
+    ayer = hoy - timedelta(days=1)
+    con = sqlite3.connect(":memory:")
+    con.row_factory = sqlite3.Row
+    con.execute("CREATE TABLE reportes_ventas_30dias (nombre, precio, cantidad, fecha_venta)")
+    con.executemany(
+        "INSERT INTO reportes_ventas_30dias VALUES ('X', ?, ?, ?)",
+        [(10, 2.9, hoy.isoformat()), (None, 3, hoy.isoformat()), (5, 1.5, ayer.isoformat())],
+    )
+
+    def responder(sql, params):
+        params = {k: v.isoformat() if isinstance(v, date) else v for k, v in (params or {}).items()}
+        return [SimpleNamespace(**dict(f)) for f in con.execute(str(sql), params).fetchall()]
+
+    service = VentasService(QueryCounter(responder).session())
+    assert await service.get_totales_hoy_ayer(FilterParams()) == {
+        "total_hoy": 20.0, "tx_hoy": 2, "total_ayer": 5.0,
+    }